@@ -1,11 +1,11 @@
 import streamlit as st
-import os
 import json
+import time
 from dotenv import load_dotenv
-from parsers import parse_document, parse_pdf, parse_json, parse_html
-from knowledge_base import KnowledgeBase
-from test_case_agent import TestCaseAgent
-from selenium_agent import SeleniumAgent
+from service_client import ServiceClient, ServiceError, DEFAULT_PROJECT
+from instrumentation import format_waterfall
+
+MAX_SESSION_TRACES = 20 # Most recent requests of this session kept for the timing waterfall
 
 # Debugging line - should always show up
 # st.write("Streamlit app is running!")
@@ -17,14 +17,78 @@ st.set_page_config(page_title="Autonomous QA Agent", layout="wide")
 st.title("🧠 Autonomous QA Agent")
 
 
+@st.cache_resource
+def get_service_client() -> ServiceClient:
+    # The knowledge base, models and agents live in service.py and are shared by every session.
+    return ServiceClient()
+
+
+client = get_service_client()
+client.take_trace_ids() # Start this run's request history empty
+try:
+    service_health = client.health()
+except ServiceError as e:
+    st.error(f"{e}. Start it with `python service.py` or set QA_AGENT_SERVICE_URL.")
+    st.stop()
+
+# Shared LLM response cache statistics
+with st.sidebar:
+    st.subheader("LLM Response Cache")
+    cache_stats = client.stats()["response_cache"]
+    st.caption(
+        f"{cache_stats['hits']} hits / {cache_stats['misses']} misses "
+        f"({cache_stats['hit_rate']:.0%} hit rate), {cache_stats['disk_entries']} cached responses"
+    )
+
+# Project selection: every project has its own knowledge base on the service
+with st.sidebar:
+    st.subheader("Project")
+    projects = {project["name"]: project for project in client.projects()}
+    if 'next_project' in st.session_state: # Set by "Create project"; must be applied before the selectbox exists
+        st.session_state.project = st.session_state.pop('next_project')
+    if st.session_state.get('project') not in projects:
+        st.session_state.project = DEFAULT_PROJECT if DEFAULT_PROJECT in projects else next(iter(projects), DEFAULT_PROJECT)
+    project_names = sorted(set(projects) | {st.session_state.project})
+    project = st.selectbox("Project", project_names, key="project")
+    new_project = st.text_input("New project", placeholder="e.g. checkout-v2")
+    if st.button("Create project") and new_project:
+        try:
+            client.create_project(new_project)
+        except ServiceError as e:
+            st.error(str(e))
+        else:
+            st.session_state.next_project = new_project
+            st.rerun()
+    project_info = projects.get(project, {"chunks": 0, "open": False})
+    st.caption(f"{project_info['chunks']} chunks" + (", loaded" if project_info["open"] else ""))
+    if st.button("Snapshot project"):
+        try:
+            snapshot = client.snapshot_project(project)
+            st.caption(f"Saved {snapshot['chunks']} chunks as snapshot {snapshot['snapshot']}")
+        except ServiceError as e:
+            st.error(str(e))
+
+# Generated artefacts belong to one project; start over when switching
+if st.session_state.get('active_project') != project:
+    st.session_state.active_project = project
+    for key in ('test_cases', 'generated_scripts', 'checkout_html', 'script_results'):
+        st.session_state.pop(key, None)
+
 # Initialize session state variables if they don't exist
-if 'kb' not in st.session_state:
-    st.session_state.kb = None
+# Knowledge bases are shared across sessions, so a project is ready as soon as it has any chunks.
+st.session_state.kb_ready = project_info["chunks"] > 0
 if 'test_cases' not in st.session_state:
     st.session_state.test_cases = []
+if 'generated_scripts' not in st.session_state:
+    st.session_state.generated_scripts = []
+if 'checkout_html' not in st.session_state:
+    st.session_state.checkout_html = None
+if 'script_results' not in st.session_state:
+    st.session_state.script_results = []
 
 # Phase 1: Knowledge Base Ingestion & UI
 st.header("Phase 1: Knowledge Base Ingestion")
+st.caption(f"Project: {project}")
 
 with st.expander("Upload Documents and Build Knowledge Base"):
     st.subheader("Upload Support Documents")
@@ -41,87 +105,114 @@ with st.expander("Upload Documents and Build Knowledge Base"):
         accept_multiple_files=False
     )
 
+    embedding_batch_size = st.number_input(
+        "Embedding batch size",
+        min_value=1,
+        max_value=1024,
+        value=64,
+        help="Number of chunks encoded per forward pass. Tune for throughput on your hardware."
+    )
+
     if st.button("Build Knowledge Base"):
         if not support_docs and not checkout_html:
             st.warning("Please upload at least one document or the checkout.html file.")
         else:
-            st.info("Building Knowledge Base...")
-            
-            kb = KnowledgeBase()
-            
-            # Create a temporary directory for uploaded files
-            temp_dir = "./temp_docs"
-            os.makedirs(temp_dir, exist_ok=True)
-
-            # Process support documents
-            for doc_file in support_docs:
-                file_path = os.path.join(temp_dir, doc_file.name)
-                with open(file_path, "wb") as f:
-                    f.write(doc_file.getbuffer())
-                
-                content = ""
-                if doc_file.type == "application/pdf":
-                    content = parse_pdf(file_path)
-                elif doc_file.type == "application/json":
-                    json_data = parse_json(file_path)
-                    content = json.dumps(json_data, indent=2) if json_data else ""
-                else: # md, txt
-                    content = parse_document(file_path, doc_file.type)
-                
-                if content:
-                    kb.add_documents([content], [{"source_document": doc_file.name}])
-                os.remove(file_path) # Clean up temp file
-
-            # Process checkout.html
-            if checkout_html:
-                file_path = os.path.join(temp_dir, checkout_html.name)
-                with open(file_path, "wb") as f:
-                    f.write(checkout_html.getbuffer())
-                
-                html_content = parse_html(file_path)
-                if html_content:
-                    kb.add_documents([html_content], [{"source_document": checkout_html.name, "type": "html"}])
-                os.remove(file_path) # Clean up temp file
-            
-            # # Clean up the temporary directory if it's empty - Removed for debugging
-            # if not os.listdir(temp_dir):
-            #     os.rmdir(temp_dir)
-
-            st.session_state.kb = kb # Store KnowledgeBase in session state
-            st.success("Knowledge Base Built!")
+            # Parsing, embedding and writing happen in the service; PDFs are streamed page by page there.
+            uploads = [(doc_file.name, doc_file.getvalue(), doc_file.type) for doc_file in (support_docs or [])]
+            uploads += [(checkout_html.name, checkout_html.getvalue(), checkout_html.type)] if checkout_html else []
+            ingest_progress = st.progress(0.0, text="Parsing documents...")
+
+            def update_ingest_progress(done, total, text):
+                ingest_progress.progress(done / total, text=text)
+
+            try:
+                ingest_result = client.ingest(uploads, batch_size=int(embedding_batch_size), project=project,
+                                              progress_callback=update_ingest_progress)
+            except ServiceError as e:
+                st.error(str(e))
+            else:
+                for warning in ingest_result["warnings"]:
+                    st.warning(warning)
+                ingest_stats = ingest_result["stats"]
+                st.caption(
+                    f"Embedded {ingest_stats['chunks_embedded']} chunks at "
+                    f"{ingest_stats['chunks_per_second']:.1f} chunks/s "
+                    f"({ingest_stats['chunks_unchanged']} unchanged, {ingest_stats['chunks_deleted']} removed, "
+                    f"{ingest_stats['documents_skipped']} documents skipped)."
+                )
+                st.session_state.kb_ready = True
+                if checkout_html:
+                    st.session_state.checkout_html = checkout_html.getvalue().decode('utf-8') # Served in Phase 4
+                st.success("Knowledge Base Built!")
 
 # Phase 2: Test Case Generation Agent
 st.header("Phase 2: Test Case Generation Agent")
 
-# Get API key from environment
-gemini_api_key = os.getenv("GEMINI_API_KEY")
-if not gemini_api_key:
-    st.error("Gemini API key not found. Please set it in a .env file (e.g., GEMINI_API_KEY='YOUR_API_KEY').")
+# The Gemini API key is read by the service
+llm_configured = service_health["llm_configured"]
+if not llm_configured:
+    st.error("Gemini API key not found. Please set it in the service's .env file (e.g., GEMINI_API_KEY='YOUR_API_KEY').")
 
 with st.expander("Generate Test Cases"):
-    if st.session_state.kb is None:
+    if not st.session_state.kb_ready:
         st.warning("Please build the Knowledge Base first in Phase 1.")
-    elif not gemini_api_key:
+    elif not llm_configured:
         st.warning("Gemini API key is missing. Please set it in the .env file.")
     else:    
         user_query = st.text_input(
             "Enter your query for test case generation.",
             value="Generate all positive and negative test cases for the discount code feature."
         )
+        map_reduce = st.checkbox(
+            "Generate per feature", value=False,
+            help="Finds the features in the knowledge base, generates test cases for each in parallel, "
+                 "removes near-duplicates and renumbers the Test_IDs. Faster and more complete on large specs."
+        )
+        stream_test_cases = not map_reduce and st.checkbox("Stream test cases as they are generated", value=True)
         if st.button("Generate Test Cases"):
             if not user_query:
                 st.warning("Please enter a query to generate test cases.")
             else:
                 st.info("Generating Test Cases...")
-                test_case_agent = TestCaseAgent(st.session_state.kb, gemini_api_key)
-                test_cases_result = test_case_agent.generate_test_cases(user_query)
-                
+                try:
+                    if stream_test_cases:
+                        # Render each test case as soon as the model finishes writing it
+                        start_time = time.perf_counter()
+                        first_case_seconds = None
+                        streamed_cases = []
+                        stream_status = st.empty()
+                        stream_container = st.container()
+                        test_cases_result = streamed_cases
+                        for item in client.generate_test_cases_stream(user_query, project=project):
+                            if "error" in item:
+                                test_cases_result = item if not streamed_cases else streamed_cases
+                                if streamed_cases:
+                                    st.warning(item["error"])
+                                break
+                            if first_case_seconds is None:
+                                first_case_seconds = time.perf_counter() - start_time
+                            streamed_cases.append(item)
+                            stream_container.json(item)
+                            stream_status.caption(
+                                f"{len(streamed_cases)} test cases so far (first after {first_case_seconds:.1f}s)"
+                            )
+                        if streamed_cases:
+                            stream_status.caption(
+                                f"First test case after {first_case_seconds:.1f}s, "
+                                f"all {len(streamed_cases)} after {time.perf_counter() - start_time:.1f}s."
+                            )
+                    else:
+                        test_cases_result = client.generate_test_cases(user_query, project=project, map_reduce=map_reduce)
+                except ServiceError as e:
+                    test_cases_result = {"error": str(e)}
+
                 if isinstance(test_cases_result, dict) and "error" in test_cases_result:
                     st.error(test_cases_result["error"])
                     st.session_state.test_cases = [] # Clear test cases on error
-                elif isinstance(test_cases_result, list):
+                elif isinstance(test_cases_result, list) and (test_cases_result or not stream_test_cases):
                     st.session_state.test_cases = test_cases_result # Store generated test cases
-                    st.json(test_cases_result)
+                    if not stream_test_cases:
+                        st.json(test_cases_result)
                     st.success("Test Cases Generated!")
                 else:
                     st.error("Unexpected format for generated test cases.")
@@ -131,9 +222,9 @@ with st.expander("Generate Test Cases"):
 st.header("Phase 3: Selenium Script Generation Agent")
 
 with st.expander("Generate Selenium Test Script"):
-    if st.session_state.kb is None or not st.session_state.test_cases:
+    if not st.session_state.kb_ready or not st.session_state.test_cases:
         st.warning("Please build the Knowledge Base and generate Test Cases first.")
-    elif not gemini_api_key:
+    elif not llm_configured:
         st.warning("Gemini API key is missing. Please set it in the .env file.")
     else:
         test_case_options = [
@@ -160,8 +251,10 @@ with st.expander("Generate Selenium Test Script"):
                 )
 
                 if selected_test_case:
-                    selenium_agent = SeleniumAgent(st.session_state.kb, gemini_api_key)
-                    selenium_script = selenium_agent.generate_selenium_script(selected_test_case)
+                    try:
+                        selenium_script = client.generate_selenium_script(selected_test_case, project=project)
+                    except ServiceError as e:
+                        selenium_script = {"error": str(e)}
 
                     if isinstance(selenium_script, dict) and "error" in selenium_script:
                         st.error(selenium_script["error"])
@@ -170,3 +263,125 @@ with st.expander("Generate Selenium Test Script"):
                         st.success("Selenium Script Generated!")
                 else:
                     st.error("Selected test case not found.")
+
+        st.subheader("Generate Scripts for All Test Cases")
+        batch_col1, batch_col2 = st.columns(2)
+        with batch_col1:
+            max_concurrency = st.number_input("Concurrent requests", min_value=1, max_value=32, value=4)
+        with batch_col2:
+            requests_per_second = st.number_input(
+                "Max requests per second", min_value=0.1, max_value=50.0, value=1.0, step=0.1
+            )
+
+        if st.button("Generate All Selenium Scripts"):
+            test_cases = st.session_state.test_cases
+            progress_bar = st.progress(0.0, text=f"Generating {len(test_cases)} scripts...")
+
+            def update_progress(done, total, result):
+                progress_bar.progress(done / total, text=f"Generated {done}/{total} ({result['Test_ID']})")
+
+            try:
+                st.session_state.generated_scripts = client.generate_selenium_scripts(
+                    test_cases,
+                    max_concurrency=int(max_concurrency),
+                    requests_per_second=float(requests_per_second),
+                    project=project,
+                    progress_callback=update_progress
+                )
+            except ServiceError as e:
+                st.error(str(e))
+            else:
+                failed = [result for result in st.session_state.generated_scripts if result["error"]]
+                if failed:
+                    st.warning(f"{len(failed)} of {len(test_cases)} scripts failed to generate.")
+                else:
+                    st.success("All Selenium Scripts Generated!")
+
+        for result in st.session_state.generated_scripts:
+            with st.expander(f"{result['Test_ID']} ({result['seconds']:.1f}s, {result['attempts']} API attempts)"):
+                if result["error"]:
+                    st.error(result["error"])
+                else:
+                    st.code(result["script"], language="python")
+
+# Phase 4: Run Generated Selenium Scripts
+st.header("Phase 4: Run Generated Selenium Scripts")
+
+with st.expander("Run Generated Scripts"):
+    runnable_scripts = [result for result in st.session_state.generated_scripts if result.get("script")]
+    if not service_health.get("script_runner_enabled"):
+        st.info("Running scripts is disabled on the service. Set QA_AGENT_ENABLE_SCRIPT_RUNNER=1 and "
+                "QA_AGENT_SERVICE_TOKEN in the service's .env file (and the same token here) to enable it.")
+    elif not runnable_scripts:
+        st.warning("Please generate Selenium scripts for all test cases first in Phase 3.")
+    elif not st.session_state.checkout_html:
+        st.warning("Please upload checkout.html in Phase 1 so the scripts have a page to run against.")
+    else:
+        run_col1, run_col2 = st.columns(2)
+        with run_col1:
+            runner_workers = st.number_input("Parallel browsers", min_value=1, max_value=16, value=2)
+        with run_col2:
+            use_fake_driver = st.checkbox(
+                "Dry run without a browser", value=False,
+                help="Checks scripts against the page structure with a fake driver instead of headless Chrome."
+            )
+
+        if st.button("Run Generated Scripts"):
+            # The service serves the page and drives the browsers in a separate process.
+            run_progress = st.progress(0.0, text=f"Running {len(runnable_scripts)} scripts...")
+
+            def update_run_progress(done, total, result):
+                run_progress.progress(done / total, text=f"Ran {done}/{total} ({result['Test_ID']}: {result['status']})")
+
+            try:
+                st.session_state.script_results = client.run_scripts(
+                    runnable_scripts, st.session_state.checkout_html,
+                    workers=int(runner_workers), dry_run=use_fake_driver, progress_callback=update_run_progress
+                )
+            except ServiceError as e:
+                st.error(f"Could not run the scripts: {e}")
+                st.session_state.script_results = []
+
+        if st.session_state.script_results:
+            passed = sum(1 for result in st.session_state.script_results if result["passed"])
+            total_seconds = sum(result["seconds"] for result in st.session_state.script_results)
+            st.caption(f"{passed}/{len(st.session_state.script_results)} passed ({total_seconds:.1f}s of test time).")
+            st.dataframe(
+                [{"Test_ID": result["Test_ID"], "Status": result["status"], "Seconds": round(result["seconds"], 2),
+                  "Error": result["error"] or ""} for result in st.session_state.script_results],
+                use_container_width=True
+            )
+            for result in st.session_state.script_results:
+                if result["traceback"]:
+                    with st.expander(f"{result['Test_ID']}: {result['status']}"):
+                        st.code(result["traceback"], language="text")
+
+# Timing waterfall of this session's requests (rendered last so it includes the ones this run made)
+if 'trace_ids' not in st.session_state:
+    st.session_state.trace_ids = []
+st.session_state.trace_ids = (st.session_state.trace_ids + client.take_trace_ids())[-MAX_SESSION_TRACES:]
+
+
+def trace_label(trace):
+    root = max((span for span in trace if span["parent_id"] is None), key=lambda span: span["duration"])
+    seconds = max(span["start"] + span["duration"] for span in trace) - trace[0]["start"]
+    return f"{root['name']} ({seconds:.2f}s, {time.strftime('%H:%M:%S', time.localtime(trace[0]['start']))})"
+
+
+with st.sidebar:
+    st.subheader("Request Timings")
+    recent_traces = [trace for trace in (client.trace(trace_id) for trace_id in reversed(st.session_state.trace_ids))
+                     if trace]
+    if not recent_traces:
+        st.caption("No requests traced in this session yet.")
+    else:
+        trace_labels = [trace_label(trace) for trace in recent_traces]
+        selected_trace = st.selectbox("Request", range(len(recent_traces)), format_func=lambda index: trace_labels[index])
+        st.code(format_waterfall(recent_traces[selected_trace], width=24), language="text")
+        slowest = sorted(recent_traces[selected_trace][1:], key=lambda span: -span["duration"])[:5]
+        for span in slowest:
+            attributes = ", ".join(f"{key}={value}" for key, value in span["attributes"].items())
+            st.caption(f"{span['name']}: {span['duration'] * 1000:.1f} ms" + (f" ({attributes})" if attributes else ""))
+    spans_jsonl = "".join(json.dumps(span) + "\n" for trace in reversed(recent_traces) for span in trace)
+    st.download_button("Download spans (JSON lines)", spans_jsonl, file_name="qa_agent_spans.jsonl")
+    st.download_button("Download metrics (Prometheus)", client.metrics(), file_name="qa_agent_metrics.prom")
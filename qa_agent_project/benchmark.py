@@ -0,0 +1,276 @@
+"""
+Offline performance benchmark for the QA agent pipeline.
+
+Builds synthetic corpora by scaling the fixtures in data/ (10x, 100x, ... copies with rewritten
+rule ids, discount codes and endpoint paths), then measures ingestion throughput, KnowledgeBase
+query latency, prompt sizes, peak RSS and end-to-end generation time with a deterministic local
+LLM stand-in. Results are written as JSON so runs on different commits can be compared:
+
+    python benchmark.py --scales 10,100 --output bench_results.json
+    python benchmark.py --scales 10,100 --baseline bench_results.json --tolerance 0.2
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from typing import List, Dict, Tuple
+
+from knowledge_base import KnowledgeBase
+from test_case_agent import TestCaseAgent
+from selenium_agent import SeleniumAgent
+from llm_cache import ResponseCache
+from fake_llm import FakeGenerativeModel
+
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+BENCHMARK_QUERIES = [
+    "Generate all positive and negative test cases for the discount code feature.",
+    "What are the form validation rules for the email field?",
+    "How is the shipping cost calculated for express delivery?",
+    "Pay Now button state and payment success message",
+    "SAVE15",
+    "#pay_now_btn",
+    "/api/apply_coupon",
+]
+
+# Metrics where a larger value is a regression (everything else: larger is better).
+LOWER_IS_BETTER = ("seconds", "latency", "tokens", "rss", "errors", "write_calls", "p50", "p95", "p99", "mean", "max")
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict:
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else 0.0,
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": max(values) if values else 0.0,
+    }
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def load_fixtures(data_dir: str) -> Tuple[List[Tuple[str, str]], Tuple[str, str]]:
+    """
+    Returns ([(name, text)] support documents, (name, text) HTML page) from the data directory.
+    """
+    support_documents = []
+    html_page = None
+    for name in sorted(os.listdir(data_dir)):
+        path = os.path.join(data_dir, name)
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        if name.endswith(".html"):
+            html_page = (name, text)
+        else:
+            support_documents.append((name, text))
+    return support_documents, html_page
+
+
+def synthesize_variant(name: str, text: str, variant: int) -> Tuple[str, str]:
+    """
+    Produces the `variant`-th copy of a fixture with distinct identifiers, so copies are not
+    byte-identical (and are not deduplicated by hashing).
+    """
+    stem, extension = os.path.splitext(name)
+    text = re.sub(r"\bRule ([A-Z])-(\d+)", lambda m: f"Rule {m.group(1)}{variant}-{m.group(2)}", text)
+    text = re.sub(r"\bSAVE(\d+)\b", lambda m: f"SAVE{m.group(1)}X{variant}", text)
+    text = text.replace("/api/", f"/api/v{variant}/")
+    if extension == ".md":
+        text = re.sub(r"^# (.+)$", lambda m: f"# {m.group(1)} (variant {variant})", text, count=1, flags=re.M)
+    else:
+        text = f"Variant {variant}\n{text}" if extension != ".json" else text
+    return f"{stem}_{variant:05d}{extension}", text
+
+
+def build_corpus(data_dir: str, scale: int) -> Tuple[List[str], List[Dict]]:
+    support_documents, html_page = load_fixtures(data_dir)
+    contents, metadatas = [], []
+    for variant in range(scale):
+        for name, text in support_documents:
+            variant_name, variant_text = synthesize_variant(name, text, variant)
+            contents.append(variant_text)
+            metadatas.append({"source_document": variant_name})
+    if html_page is not None:
+        contents.append(html_page[1])
+        metadatas.append({"source_document": html_page[0], "type": "html"})
+    return contents, metadatas
+
+
+def benchmark_scale(args, scale: int) -> Dict:
+    print(f"--- Scale {scale}x ---")
+    work_dir = tempfile.mkdtemp(prefix=f"qa_bench_{scale}x_")
+    try:
+        contents, metadatas = build_corpus(args.data_dir, scale)
+        corpus_bytes = sum(len(content.encode("utf-8")) for content in contents)
+
+        kb = KnowledgeBase(persist_directory=os.path.join(work_dir, "chroma_db"))
+        ingest_stats = kb.ingest_documents(contents, metadatas, batch_size=args.batch_size)
+        reingest_stats = kb.ingest_documents(contents, metadatas, batch_size=args.batch_size)
+
+        # Cold queries embed and search every time; warm queries hit the KnowledgeBase caches.
+        cold_latencies, warm_latencies = [], []
+        for _ in range(args.query_repeats):
+            for query_text in BENCHMARK_QUERIES:
+                kb.clear_query_cache()
+                start_time = time.perf_counter()
+                kb.query(query_text, n_results=5)
+                cold_latencies.append((time.perf_counter() - start_time) * 1000)
+                start_time = time.perf_counter()
+                kb.query(query_text, n_results=5)
+                warm_latencies.append((time.perf_counter() - start_time) * 1000)
+
+        fake_llm = FakeGenerativeModel(latency=args.llm_latency, test_cases_per_prompt=args.test_cases)
+        test_case_agent = TestCaseAgent(kb, api_key=None, response_cache=ResponseCache(None), llm=fake_llm)
+        selenium_agent = SeleniumAgent(kb, api_key=None, response_cache=ResponseCache(None), llm=fake_llm)
+
+        start_time = time.perf_counter()
+        test_cases = test_case_agent.generate_test_cases(BENCHMARK_QUERIES[0])
+        test_case_seconds = time.perf_counter() - start_time
+        if not isinstance(test_cases, list):
+            raise RuntimeError(f"Test case generation failed: {test_cases}")
+
+        start_time = time.perf_counter()
+        script_results = selenium_agent.generate_selenium_scripts(
+            test_cases, max_concurrency=args.concurrency, requests_per_second=1000.0
+        )
+        script_seconds = time.perf_counter() - start_time
+
+        token_counter = kb.embedding_model.count_tokens
+        prompt_tokens = [float(token_counter(prompt)) for prompt in fake_llm.prompts]
+
+        # Per-feature fan-out: wall clock should track the slowest feature, not the whole spec.
+        start_time = time.perf_counter()
+        map_reduce_cases = test_case_agent.generate_test_cases_map_reduce(
+            BENCHMARK_QUERIES[0], max_concurrency=args.concurrency, requests_per_second=1000.0
+        )
+        map_reduce_seconds = time.perf_counter() - start_time
+        if not isinstance(map_reduce_cases, list):
+            raise RuntimeError(f"Map-reduce test case generation failed: {map_reduce_cases}")
+
+        return {
+            "scale": scale,
+            "corpus": {"documents": len(contents), "bytes": corpus_bytes, "chunks": kb.collection.count()},
+            "ingestion": {
+                "seconds": ingest_stats["seconds"],
+                "chunks_embedded": ingest_stats["chunks_embedded"],
+                "chunks_per_second": ingest_stats["chunks_per_second"],
+                "write_calls": ingest_stats["write_calls"],
+                "reingest_seconds": reingest_stats["seconds"],
+            },
+            "query_latency_ms": {"cold": summarize(cold_latencies), "warm": summarize(warm_latencies)},
+            "prompt_tokens": summarize(prompt_tokens),
+            "generation": {
+                "test_cases": len(test_cases),
+                "test_case_seconds": test_case_seconds,
+                "scripts": len(script_results),
+                "script_errors": sum(1 for result in script_results if result["error"]),
+                "script_seconds": script_seconds,
+                "end_to_end_seconds": test_case_seconds + script_seconds,
+                "map_reduce_test_cases": len(map_reduce_cases),
+                "map_reduce_seconds": map_reduce_seconds,
+            },
+            "peak_rss_mb": peak_rss_mb(),
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def flatten(prefix: str, value, into: Dict) -> Dict:
+    if isinstance(value, dict):
+        for key, item in value.items():
+            flatten(f"{prefix}.{key}" if prefix else key, item, into)
+    elif isinstance(value, (int, float)):
+        into[prefix] = float(value)
+    return into
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Lists metrics that got worse than the baseline by more than `tolerance` (a fraction).
+    """
+    regressions = []
+    baseline_scales = {run["scale"]: run for run in baseline.get("runs", [])}
+    for run in results["runs"]:
+        previous = baseline_scales.get(run["scale"])
+        if previous is None:
+            continue
+        current_metrics = flatten("", run, {})
+        previous_metrics = flatten("", previous, {})
+        for metric, current in current_metrics.items():
+            before = previous_metrics.get(metric)
+            if not before or metric.endswith("count") or metric == "scale" or metric.startswith("corpus."):
+                continue
+            change = (current - before) / before
+            worse = change > tolerance if any(word in metric for word in LOWER_IS_BETTER) else change < -tolerance
+            if worse:
+                regressions.append(f"{run['scale']}x {metric}: {before:.4g} -> {current:.4g} ({change:+.0%})")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmark for the QA agent pipeline.")
+    parser.add_argument("--scales", default="10,100", help="Comma-separated corpus scale factors (e.g. 10,100,1000).")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Directory with the fixture documents.")
+    parser.add_argument("--output", default="bench_results.json", help="Where to write the JSON results.")
+    parser.add_argument("--batch-size", type=int, default=64, help="Embedding batch size for ingestion.")
+    parser.add_argument("--query-repeats", type=int, default=5, help="Repetitions of the query set.")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Simulated LLM latency in seconds.")
+    parser.add_argument("--test-cases", type=int, default=10, help="Test cases returned per generation.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent Selenium script and per-feature test case generations.")
+    parser.add_argument("--baseline", help="Previous results JSON to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression vs. baseline.")
+    args = parser.parse_args()
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("baseline", "output")},
+        "runs": [benchmark_scale(args, int(scale)) for scale in args.scales.split(",") if scale.strip()],
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Benchmark results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("No regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,370 @@
+import os
+import re
+import json
+from html.parser import HTMLParser
+from typing import List, Dict, Tuple, Optional
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# Bump to re-chunk every stored document on its next ingest after the chunking rules change.
+CHUNKER_VERSION = 1
+PATH_SEPARATOR = " > "
+
+MARKDOWN_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+MARKDOWN_FENCE = re.compile(r"^(```|~~~)")
+# Plain-text section headings: a short capitalised line without closing punctuation.
+TEXT_HEADING = re.compile(r"^[A-Z][\w&/()' -]{2,60}$")
+MAX_HEADING_WORDS = 6
+
+EXTENSION_TYPES = {".md": "markdown", ".markdown": "markdown", ".json": "json", ".html": "html",
+                   ".htm": "html", ".txt": "text"}
+
+# Subtrees that always become one HTML chunk, and block containers that do when a heading is
+# one of their direct children.
+HTML_UNIT_TAGS = {"form", "section", "article", "fieldset"}
+HTML_CONTAINER_TAGS = {"div", "main", "aside", "nav", "header", "footer", "table", "ul", "ol"}
+HTML_HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6", "legend"}
+HTML_VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param",
+                  "source", "track", "wbr"}
+
+
+def document_type(metadata: Dict) -> str:
+    """
+    The structure a document is chunked by: its `type` metadata, else its source file extension.
+    """
+    if metadata.get("type"):
+        return metadata["type"]
+    extension = os.path.splitext(metadata.get("source_document", ""))[1].lower()
+    return EXTENSION_TYPES.get(extension, "text")
+
+
+def _split(text: str, header: str, max_chars: int, overlap: int) -> List[str]:
+    """
+    `text` prefixed by `header`, split with the recursive splitter only if it does not fit in one chunk.
+    """
+    text = text.strip()
+    if not text:
+        return []
+    prefix = f"{header}\n" if header else ""
+    if len(prefix) + len(text) <= max_chars:
+        return [prefix + text]
+    size = max(max_chars - len(prefix), max_chars // 2)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=size, chunk_overlap=min(overlap, size // 4),
+                                              length_function=len, is_separator_regex=False)
+    return [prefix + part for part in splitter.split_text(text)]
+
+
+def _section_chunks(sections: List[Tuple[List[str], Optional[str], List[str]]], max_chars: int,
+                    overlap: int) -> List[Tuple[str, Dict]]:
+    chunks = []
+    for path, section, lines in sections:
+        structure_path = PATH_SEPARATOR.join(path)
+        extra = {"structure_path": structure_path}
+        if section:
+            extra["section"] = section
+        chunks.extend((text, extra) for text in _split("\n".join(lines), structure_path, max_chars, overlap))
+    return chunks
+
+
+def markdown_sections(text: str) -> List[Tuple[List[str], Optional[str], List[str]]]:
+    """
+    Splits Markdown at its headings into (heading path, section heading, body lines) sections. The
+    section heading is set for `##` and deeper headings, not for the `#` document title. Headings
+    inside fenced code blocks are ignored; text before the first heading has an empty path.
+    """
+    sections = [([], None, [])]
+    stack: List[Tuple[int, str]] = []
+    in_fence = False
+    for line in text.splitlines():
+        if MARKDOWN_FENCE.match(line.strip()):
+            in_fence = not in_fence
+        match = None if in_fence else MARKDOWN_HEADING.match(line.strip())
+        if match is None:
+            sections[-1][2].append(line)
+            continue
+        level = len(match.group(1))
+        while stack and stack[-1][0] >= level:
+            stack.pop()
+        stack.append((level, match.group(2).strip()))
+        sections.append(([title for _, title in stack], stack[-1][1] if level > 1 else None, []))
+    return sections
+
+
+def is_text_heading(lines: List[str], index: int) -> bool:
+    """
+    Whether `lines[index]` is a plain-text section heading: a short title-like line that follows a
+    blank line and is immediately followed by content.
+    """
+    stripped = lines[index].strip()
+    if stripped.startswith("#") or not TEXT_HEADING.match(stripped) or len(stripped.split()) > MAX_HEADING_WORDS:
+        return False
+    previous_blank = index == 0 or not lines[index - 1].strip()
+    next_line = lines[index + 1].strip() if index + 1 < len(lines) else ""
+    return previous_blank and bool(next_line) and not next_line.startswith("#")
+
+
+def text_sections(text: str) -> List[Tuple[List[str], Optional[str], List[str]]]:
+    """
+    Splits plain text into (heading path, section heading, body lines) sections at the lines
+    is_text_heading accepts. A first line followed by a blank line is the document title and heads
+    the path of every section.
+    """
+    lines = text.splitlines()
+    title = []
+    start = 0
+    while start < len(lines) and not lines[start].strip():
+        start += 1
+    if (start + 1 < len(lines) and not lines[start + 1].strip()
+            and len(lines[start].strip()) <= 80 and not lines[start].strip().endswith((".", ":"))):
+        title = [lines[start].strip()]
+        start += 1
+    sections = [(title, None, [])]
+    for index in range(start, len(lines)):
+        if is_text_heading(lines, index):
+            sections.append((title + [lines[index].strip()], lines[index].strip(), []))
+        else:
+            sections[-1][2].append(lines[index])
+    return sections
+
+
+def chunk_markdown(text: str, max_chars: int = 1000, overlap: int = 200) -> List[Tuple[str, Dict]]:
+    return _section_chunks(markdown_sections(text), max_chars, overlap)
+
+
+def chunk_text(text: str, max_chars: int = 1000, overlap: int = 200) -> List[Tuple[str, Dict]]:
+    return _section_chunks(text_sections(text), max_chars, overlap)
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _is_record_list(value) -> bool:
+    return isinstance(value, list) and bool(value) and all(isinstance(item, dict) for item in value)
+
+
+def _record_label(record: Dict) -> str:
+    # e.g. "POST /api/apply_coupon" for an endpoint, else its name, id or title.
+    if isinstance(record.get("method"), str) and isinstance(record.get("path"), str):
+        return f"{record['method']} {record['path']}"
+    for key in ("name", "id", "title", "path"):
+        if isinstance(record.get(key), (str, int)):
+            return str(record[key])
+    return ""
+
+
+def _json_chunks(value, path: str, label: str, max_chars: int, overlap: int,
+                 split_records: bool = False) -> List[Tuple[str, Dict]]:
+    header = f"{path} {label}".strip()
+    text = _dumps(value)
+    fits = len(header) + 1 + len(text) <= max_chars
+    # `split_records` makes an object that fits give up its lists of objects all the same.
+    if not isinstance(value, (dict, list)) or (fits and not _is_record_list(value)
+                                               and not (split_records and isinstance(value, dict))):
+        return [(chunk, {"structure_path": path}) for chunk in _split(text, header, max_chars, overlap)]
+
+    chunks = []
+    if isinstance(value, list):
+        for index, item in enumerate(value):
+            item_label = _record_label(item) if isinstance(item, dict) else ""
+            chunks.extend(_json_chunks(item, f"{path}[{index}]", item_label, max_chars, overlap))
+        return chunks
+
+    # Lists of objects always get one chunk per object; other nested values get their own
+    # chunks only when the object is too large to keep whole. The remaining fields stay together
+    # in a chunk of their own, ahead of the nested ones.
+    rest = {}
+    for key, item in value.items():
+        if _is_record_list(item):
+            chunks.extend(_json_chunks(item, f"{path}.{key}", "", max_chars, overlap, split_records=True))
+        elif isinstance(item, (dict, list)) and not fits:
+            chunks.extend(_json_chunks(item, f"{path}.{key}", "", max_chars, overlap))
+        else:
+            rest[key] = item
+    if rest:
+        chunks[:0] = [(chunk, {"structure_path": path}) for chunk in _split(_dumps(rest), header, max_chars, overlap)]
+    return chunks
+
+
+def chunk_json(text: str, max_chars: int = 1000, overlap: int = 200) -> List[Tuple[str, Dict]]:
+    """
+    One chunk per element of every list of objects (e.g. per API endpoint) and one per object path
+    for the rest, each as compact JSON headed by its JSONPath (`$.endpoints[0] POST /api/...`).
+    Text that is not valid JSON is chunked as plain text.
+    """
+    try:
+        value = json.loads(text)
+    except ValueError:
+        return chunk_text(text, max_chars, overlap)
+    return _json_chunks(value, "$", "", max_chars, overlap, split_records=True)
+
+
+class _HtmlSectionParser(HTMLParser):
+    """
+    Records the source span and heading of every form and section-like subtree. Subtrees inside
+    a form are part of that form.
+    """
+    def __init__(self, html: str):
+        super().__init__(convert_charrefs=True)
+        self.html = html
+        # HTMLParser positions are (line, column) with lines counted at "\n" only.
+        self.line_offsets = [0] + [match.end() for match in re.finditer("\n", html)]
+        self.stack: List[Dict] = []
+        self.candidates: List[Dict] = []
+        self.comments: List[Tuple[int, int, str]] = []
+        self.style_spans: List[Tuple[int, int]] = []
+        self.has_elements = False
+        self.title: Optional[str] = None
+        self.heading_text: Optional[List[str]] = None
+        self.title_text: Optional[List[str]] = None
+
+    def _offset(self) -> int:
+        line, column = self.getpos()
+        return self.line_offsets[line - 1] + column
+
+    def _inside_form(self) -> bool:
+        return any(frame["tag"] == "form" for frame in self.stack)
+
+    def handle_starttag(self, tag, attrs):
+        self.has_elements = self.has_elements or tag not in ("html", "head", "body")
+        start = self._offset()
+        if tag in HTML_HEADING_TAGS:
+            self.heading_text = []
+        elif tag == "title":
+            self.title_text = []
+        if tag in HTML_VOID_TAGS:
+            return
+        attrs = dict(attrs)
+        self.stack.append({"tag": tag, "attrs": attrs, "start": start, "heading": None,
+                           "candidate": tag in HTML_UNIT_TAGS or tag in HTML_CONTAINER_TAGS,
+                           "in_form": self._inside_form()})
+
+    def handle_startendtag(self, tag, attrs):
+        self.has_elements = True
+
+    def handle_endtag(self, tag):
+        if not any(frame["tag"] == tag for frame in self.stack):
+            return # Stray end tag
+        end = self.html.find(">", self._offset())
+        end = len(self.html) if end < 0 else end + 1
+        while self.stack:
+            frame = self.stack.pop()
+            if frame["tag"] in HTML_HEADING_TAGS and self.heading_text is not None:
+                text = re.sub(r"\s+", " ", "".join(self.heading_text)).strip()
+                self.heading_text = None
+                if text and self.stack and self.stack[-1]["heading"] is None:
+                    self.stack[-1]["heading"] = text
+            elif frame["tag"] == "title" and self.title_text is not None:
+                self.title = re.sub(r"\s+", " ", "".join(self.title_text)).strip() or None
+                self.title_text = None
+            elif frame["tag"] == "style":
+                self.style_spans.append((frame["start"], end))
+            is_unit = frame["tag"] in HTML_UNIT_TAGS or frame["heading"] is not None
+            if frame["candidate"] and is_unit and not frame["in_form"]:
+                self.candidates.append({"tag": frame["tag"], "attrs": frame["attrs"], "heading": frame["heading"],
+                                        "start": frame["start"], "end": end})
+            if frame["tag"] == tag:
+                return
+
+    def handle_data(self, data):
+        if self.heading_text is not None:
+            self.heading_text.append(data)
+        if self.title_text is not None:
+            self.title_text.append(data)
+
+    def handle_comment(self, data):
+        start = self._offset()
+        end = self.html.find("-->", start)
+        self.comments.append((start, len(self.html) if end < 0 else end + 3, data))
+
+
+def _html_label(candidate: Dict) -> str:
+    # e.g. "Your Details [form#user_details_form]"
+    attrs = candidate["attrs"]
+    reference = candidate["tag"]
+    if attrs.get("id"):
+        reference += f"#{attrs['id']}"
+    elif attrs.get("class"):
+        reference += "." + attrs["class"].split()[0]
+    return f"{candidate['heading']} [{reference}]" if candidate["heading"] else reference
+
+
+def _cut(text: str, start: int, spans: List[Tuple[int, int]]) -> str:
+    # `text` (which starts at offset `start` of the page) without the given page spans.
+    kept, position = [], start
+    for span_start, span_end in sorted(spans):
+        if span_end <= position or span_start >= start + len(text):
+            continue
+        kept.append(text[position - start:max(span_start, position) - start])
+        position = max(position, span_end)
+    kept.append(text[position - start:])
+    lines = (line.strip() for line in "".join(kept).splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def _visible_text(markup: str) -> str:
+    return re.sub(r"\s+", " ", re.sub(r"<[^>]*>", " ", markup)).strip()
+
+
+def chunk_html(html: str, max_chars: int = 1000, overlap: int = 200) -> List[Tuple[str, Dict]]:
+    """
+    One chunk per form and per section-like subtree (a section, article or fieldset, or a block
+    whose direct child is a heading), as markup headed by its path of enclosing sections. Sections
+    that contain other sections keep only their own markup; whatever is outside every section
+    (minus styles and comments) becomes one page-level chunk.
+
+    Markup that is entirely commented out (as in the sample checkout.html) is chunked from the
+    comment bodies when the live document has no elements, like dom_index.build_dom_index.
+    """
+    parser = _HtmlSectionParser(html)
+    parser.feed(html)
+    parser.close()
+    if not parser.has_elements:
+        commented_markup = "\n".join(data for _, _, data in parser.comments if "<" in data)
+        if commented_markup:
+            return chunk_html(commented_markup, max_chars, overlap)
+
+    candidates = sorted(parser.candidates, key=lambda candidate: (candidate["start"], -candidate["end"]))
+    title = parser.title
+    chunks: List[Tuple[str, Dict]] = []
+    skipped_spans = [(start, end) for start, end, _ in parser.comments] + parser.style_spans
+    section_spans = []
+    for candidate in candidates:
+        ancestors = [other for other in candidates if other is not candidate
+                     and other["start"] <= candidate["start"] and candidate["end"] <= other["end"]]
+        children = [(other["start"], other["end"]) for other in candidates if other is not candidate
+                    and candidate["start"] <= other["start"] and other["end"] <= candidate["end"]]
+        markup = _cut(html[candidate["start"]:candidate["end"]], candidate["start"], children + skipped_spans)
+        if children and _visible_text(markup) == (candidate["heading"] or ""):
+            continue # A wrapper around other sections; its heading stays in their paths.
+        path = [_html_label(other) for other in ancestors] + [_html_label(candidate)]
+        if title and (ancestors or [candidate])[0]["heading"] != title:
+            path.insert(0, title)
+        structure_path = PATH_SEPARATOR.join(path)
+        chunks.extend((text, {"structure_path": structure_path})
+                      for text in _split(markup, structure_path, max_chars, overlap))
+        section_spans.append((candidate["start"], candidate["end"]))
+
+    rest = _cut(html, 0, skipped_spans + section_spans)
+    if _visible_text(rest):
+        structure_path = title or ""
+        chunks[:0] = [(text, {"structure_path": structure_path})
+                      for text in _split(rest, structure_path, max_chars, overlap)]
+    return chunks
+
+
+def chunk_document(content: str, metadata: Dict, max_chars: int = 1000,
+                   overlap: int = 200) -> List[Tuple[str, Dict]]:
+    """
+    Splits a document along its structure into (chunk text, chunk metadata) pairs: Markdown and
+    plain text by heading, JSON by record and object path, HTML by form and section. Each chunk
+    starts with its `structure_path`, which is also in its metadata along with the `section`
+    heading for Markdown and text sections. Only sections larger than `max_chars` are split further.
+    """
+    kind = document_type(metadata)
+    if kind == "markdown":
+        return chunk_markdown(content, max_chars, overlap)
+    if kind == "json":
+        return chunk_json(content, max_chars, overlap)
+    if kind == "html":
+        return chunk_html(content, max_chars, overlap)
+    return chunk_text(content, max_chars, overlap)
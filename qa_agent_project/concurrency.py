@@ -0,0 +1,216 @@
+import time
+import queue
+import random
+import threading
+from concurrent.futures import Future
+from typing import Callable, Tuple, Any, Dict, Hashable, List, Optional
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter: `rate` tokens are added per second up to
+    `capacity`, and each call to acquire() consumes one token, blocking until one is available.
+    """
+    def __init__(self, rate: float, capacity: float = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """
+        Takes `tokens` from the bucket, sleeping as needed. Returns the time spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                wait_time = (tokens - self._tokens) / self.rate
+            time.sleep(wait_time)
+            waited += wait_time
+
+
+# HTTP statuses worth retrying: request timeout, rate limiting and server-side failures.
+TRANSIENT_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+# google.api_core exception classes for the same conditions, matched by name so that module stays optional.
+TRANSIENT_ERROR_NAMES = frozenset({"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+                                   "BadGateway", "GatewayTimeout", "DeadlineExceeded"})
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    response = getattr(error, "response", None)
+    for value in (getattr(error, "code", None), getattr(error, "status_code", None),
+                  getattr(response, "status_code", None)):
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    True for errors a retry can fix: timeouts, connection failures, rate limiting (429,
+    ResourceExhausted) and server errors (5xx, ServiceUnavailable, DeadlineExceeded). Permanent
+    errors such as invalid arguments, authentication failures or bugs are not retried.
+    """
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if any(cls.__name__ in TRANSIENT_ERROR_NAMES for cls in type(error).__mro__):
+        return True
+    return _status_code(error) in TRANSIENT_STATUS_CODES
+
+
+def call_with_retries(fn: Callable[[], Any], max_retries: int = 3, base_delay: float = 1.0,
+                      max_delay: float = 30.0, retry_on: Callable[[BaseException], bool] = is_transient_error,
+                      rate_limiter: TokenBucket = None) -> Tuple[Any, int]:
+    """
+    Calls `fn` until it succeeds, retrying up to `max_retries` times with exponential backoff
+    and full jitter, but only for exceptions `retry_on` accepts (transient ones by default).
+    If a rate limiter is given, every attempt first takes a token from it. Returns (result,
+    attempts); other exceptions, and the last one once retries are exhausted, are re-raised.
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            return fn(), attempt
+        except Exception as e:
+            if attempt > max_retries or not retry_on(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * (2 ** (attempt - 1))))
+            print(f"Attempt {attempt} failed ({e}). Retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
+
+class RequestCoalescer:
+    """
+    Collapses identical concurrent calls: while a call for `key` is in flight, further calls with
+    the same key wait for it and share its result (or exception) instead of running again.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._stats = {"executed": 0, "coalesced": 0}
+
+    def run(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Returns (result, coalesced), where `coalesced` is True if the result came from a call
+        another thread had already started.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+                self._stats["executed"] += 1
+            else:
+                self._stats["coalesced"] += 1
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._in_flight))
+
+
+class MicroBatcher:
+    """
+    Groups items submitted concurrently from many threads into one `batch_fn(items) -> results`
+    call. A batch is dispatched on a background thread once it holds `max_batch_size` items or
+    `max_wait` seconds after its first item arrived; submit() blocks until its result is ready.
+    """
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], max_batch_size: int = 32,
+                 max_wait: float = 0.005, name: str = "micro-batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self._queue: "queue.Queue" = queue.Queue()
+        self._closed = False
+        self._stats = {"batches": 0, "items": 0, "max_batch": 0}
+        self._stats_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Any) -> Any:
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        future = Future()
+        self._queue.put((item, future))
+        return future.result()
+
+    def _loop(self) -> None:
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                return
+            batch = [entry]
+            stop = False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                    break
+                batch.append(entry)
+            self._dispatch(batch)
+            if stop:
+                return
+
+    def _dispatch(self, batch: List[Tuple[Any, Future]]) -> None:
+        with self._stats_lock:
+            self._stats["batches"] += 1
+            self._stats["items"] += len(batch)
+            self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+        try:
+            results = self.batch_fn([item for item, _ in batch])
+        except BaseException as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["mean_batch"] = stats["items"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    def close(self) -> None:
+        """
+        Stops the background thread once the items already submitted have been dispatched.
+        """
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
@@ -0,0 +1,186 @@
+import math
+from typing import List, Dict, Callable, Optional
+from embeddings import get_embedding_model, DEFAULT_EMBEDDING_MODEL
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def mmr_order(records: List[Dict], query_embedding: List[float], mmr_lambda: float = 0.7) -> List[Dict]:
+    """
+    Orders retrieval records by maximal marginal relevance: each next pick maximises
+    `mmr_lambda * sim(query, chunk) - (1 - mmr_lambda) * max sim(chunk, already picked)`.
+    Records without an embedding keep their retrieval order after the others.
+    """
+    candidates = [record for record in records if record.get("embedding")]
+    relevance = {id(record): _cosine(query_embedding, record["embedding"]) for record in candidates}
+    ordered: List[Dict] = []
+    max_similarity = {id(record): 0.0 for record in candidates}
+    while candidates:
+        best = max(
+            candidates,
+            key=lambda record: mmr_lambda * relevance[id(record)] - (1 - mmr_lambda) * max_similarity[id(record)]
+        )
+        candidates.remove(best)
+        ordered.append(best)
+        for record in candidates:
+            max_similarity[id(record)] = max(max_similarity[id(record)], _cosine(record["embedding"], best["embedding"]))
+    return ordered + [record for record in records if not record.get("embedding")]
+
+
+def merge_overlapping(first: str, second: str, min_overlap: int = 20) -> Optional[str]:
+    """
+    Joins two chunks when one contains the other or the end of `first` repeats the start of
+    `second` (the splitter's chunk_overlap). Returns None when they do not overlap.
+    """
+    if second in first:
+        return first
+    if first in second:
+        return second
+    if len(second) < min_overlap:
+        return None
+    # Candidate overlaps start wherever the head of `second` occurs in `first`; earliest = longest.
+    probe = second[:min_overlap]
+    position = first.find(probe)
+    while position != -1:
+        size = len(first) - position
+        if size < len(second) and second.startswith(first[position:]):
+            return first + second[size:]
+        position = first.find(probe, position + 1)
+    return None
+
+
+class ContextAssembler:
+    """
+    Turns retrieval records into a compact prompt context: diversifies them with MMR, merges
+    chunks from the same source whose text overlaps, and packs the result into a token budget.
+
+    Tokens are counted with `token_counter`, by default the tokenizer (only) of the shared
+    embedding model. That is a WordPiece tokenizer, not Gemini's SentencePiece one, so counts are
+    an estimate of what the LLM will see, not an exact figure. The budget check therefore
+    inflates counts by `approximation_margin` (20% by default) to leave headroom; pass the LLM's
+    own counter and a margin of 0 for exact budgets. Each chunk is
+    counted once and the context total is kept as a running sum (a merge counts only the text
+    it adds), so assembly costs one pass over the retrieved text. Token boundaries where chunks
+    are joined make the sum approximate by a token or two per merge.
+    """
+    def __init__(self, token_budget: int = 1500, mmr_lambda: float = 0.7, min_overlap: int = 20,
+                 token_counter: Optional[Callable[[str], int]] = None, approximation_margin: float = 0.2):
+        self.token_budget = token_budget
+        self.mmr_lambda = mmr_lambda
+        self.min_overlap = min_overlap
+        self.token_counter = token_counter or get_embedding_model(DEFAULT_EMBEDDING_MODEL).count_tokens
+        self.approximation_margin = approximation_margin
+
+    def _count(self, text: str) -> int:
+        return self.token_counter(text) if text else 0
+
+    def _fits(self, tokens: int) -> bool:
+        return tokens * (1 + self.approximation_margin) <= self.token_budget
+
+    @staticmethod
+    def _header(source: str) -> str:
+        return f"[Source: {source}]\n"
+
+    def _new_segment(self, source: str, text: str) -> Dict:
+        return {"source": source, "text": text, "tokens": self._count(self._header(source)) + self._count(text)}
+
+    def _grown_tokens(self, segment: Dict, merged_text: str) -> int:
+        """
+        Token count of `segment` with its text replaced by `merged_text`, counting only the text
+        the merge added.
+        """
+        text = segment["text"]
+        if merged_text.startswith(text):
+            return segment["tokens"] + self._count(merged_text[len(text):])
+        if merged_text.endswith(text):
+            return segment["tokens"] + self._count(merged_text[:len(merged_text) - len(text)])
+        return self._new_segment(segment["source"], merged_text)["tokens"]
+
+    def _try_merge(self, segment: Dict, record: Dict) -> Optional[str]:
+        return (merge_overlapping(segment["text"], record["document"], self.min_overlap)
+                or merge_overlapping(record["document"], segment["text"], self.min_overlap))
+
+    def _coalesce(self, segment: Dict, segments: List[Dict]) -> int:
+        """
+        After `segment` grew, folds in any other segment of the same source it now overlaps
+        (a chunk can bridge two previously separate ones). Returns the change in token count.
+        """
+        delta = 0
+        merged = True
+        while merged:
+            merged = False
+            for other in segments:
+                if other is segment or other["source"] != segment["source"]:
+                    continue
+                merged_text = (merge_overlapping(segment["text"], other["text"], self.min_overlap)
+                               or merge_overlapping(other["text"], segment["text"], self.min_overlap))
+                if merged_text is not None:
+                    new_tokens = self._grown_tokens(segment, merged_text)
+                    delta += new_tokens - segment["tokens"] - other["tokens"]
+                    segment["text"], segment["tokens"] = merged_text, new_tokens
+                    segments.remove(other)
+                    merged = True
+                    break
+        return delta
+
+    def assemble(self, records: List[Dict], query_embedding: Optional[List[float]] = None) -> Dict:
+        """
+        Returns a dict with the assembled `text`, its estimated `tokens`, the `sources` it draws
+        on and how many retrieved chunks were `used` out of those `retrieved`.
+        """
+        ordered = mmr_order(records, query_embedding, self.mmr_lambda) if query_embedding else list(records)
+        separator_tokens = self._count("\n\n")
+        segments: List[Dict] = []
+        used = 0
+        total_tokens = 0
+        for record in ordered:
+            if not record.get("document"):
+                continue
+            source = (record.get("metadata") or {}).get("source_document", "unknown")
+            merged_into = None
+            for segment in segments:
+                if segment["source"] == source:
+                    merged_text = self._try_merge(segment, record)
+                    if merged_text is not None:
+                        merged_into = (segment, merged_text)
+                        break
+            if merged_into is not None:
+                segment, merged_text = merged_into
+                new_tokens = self._grown_tokens(segment, merged_text)
+                if self._fits(total_tokens - segment["tokens"] + new_tokens):
+                    total_tokens += new_tokens - segment["tokens"]
+                    segment["text"], segment["tokens"] = merged_text, new_tokens
+                    used += 1
+                    total_tokens += self._coalesce(segment, segments)
+                continue
+            segment = self._new_segment(source, record["document"])
+            added_tokens = segment["tokens"] + (separator_tokens if segments else 0)
+            if self._fits(total_tokens + added_tokens):
+                segments.append(segment)
+                total_tokens += added_tokens
+                used += 1
+
+        if not segments and ordered:
+            # Even the best chunk exceeds the budget on its own; keep a truncated prefix of it.
+            best = ordered[0]
+            source = (best.get("metadata") or {}).get("source_document", "unknown")
+            text = best["document"]
+            header_tokens = self._count(self._header(source))
+            while text and not self._fits(header_tokens + self._count(text)):
+                text = text[:int(len(text) * 0.9)]
+            segment = self._new_segment(source, text)
+            segments.append(segment)
+            total_tokens = segment["tokens"]
+            used = 1
+
+        return {
+            "text": "\n\n".join(self._header(segment["source"]) + segment["text"] for segment in segments),
+            "tokens": total_tokens,
+            "sources": sorted({segment["source"] for segment in segments}),
+            "used": used,
+            "retrieved": len(records),
+        }
@@ -0,0 +1,271 @@
+import os
+import re
+import json
+from html.parser import HTMLParser
+from typing import List, Dict, Optional
+
+# Elements a test can interact with; any other element is indexed only when it has an id
+# (e.g. spans and paragraphs that display totals, errors or status messages).
+INTERACTIVE_TAGS = {"input", "select", "textarea", "button", "a", "option"}
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param",
+             "source", "track", "wbr"}
+HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6", "legend"}
+TEXT_LIMIT = 80
+
+
+def _css_string(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _id_selector(element_id: str) -> str:
+    if re.fullmatch(r"[A-Za-z_][\w-]*", element_id):
+        return f"#{element_id}"
+    return f'[id="{_css_string(element_id)}"]'
+
+
+class _DomIndexParser(HTMLParser):
+    """
+    Single pass over the markup that records every indexed element with its position, ancestry,
+    enclosing form, nearest preceding heading and text content.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        # Each frame: tag, attrs, css/xpath path steps, child tag counters, text buffer, record
+        self.stack: List[Dict] = [{"tag": "#document", "attrs": {}, "css": [], "xpath": [],
+                                   "counts": {}, "text": [], "record": None}]
+        self.elements: List[Dict] = []
+        self.forms: List[Dict] = []
+        self.labels_for: Dict[str, List[str]] = {}
+        self.comments: List[str] = []
+        self.section: Optional[str] = None
+        self.title: Optional[str] = None
+
+    def _open(self, tag: str, attrs: Dict) -> Dict:
+        parent = self.stack[-1]
+        position = parent["counts"].get(tag, 0) + 1
+        parent["counts"][tag] = position
+        element_id = attrs.get("id")
+        if element_id:
+            css = [_id_selector(element_id)]
+            xpath = [f'//*[@id="{element_id}"]']
+        else:
+            css = parent["css"] + [f"{tag}:nth-of-type({position})"]
+            xpath = parent["xpath"] + [f"/{tag}[{position}]"]
+        return {"tag": tag, "attrs": attrs, "css": css, "xpath": xpath, "counts": {}, "text": [], "record": None}
+
+    def _enclosing(self, tag: str) -> Optional[Dict]:
+        for frame in reversed(self.stack):
+            if frame["tag"] == tag:
+                return frame
+        return None
+
+    def _record(self, frame: Dict) -> Dict:
+        tag, attrs = frame["tag"], frame["attrs"]
+        css = " > ".join(frame["css"])
+        xpath = "".join(frame["xpath"]) or "/"
+        # Prefer stable attribute selectors over positional ones when there is no id.
+        if not attrs.get("id") and attrs.get("name"):
+            css = f'{tag}[name="{_css_string(attrs["name"])}"]'
+            xpath = f'//{tag}[@name="{attrs["name"]}"]'
+            if attrs.get("value") is not None and attrs.get("type") in ("radio", "checkbox"):
+                css += f'[value="{_css_string(attrs["value"])}"]'
+                xpath = f'//{tag}[@name="{attrs["name"]}" and @value="{attrs["value"]}"]'
+
+        form_frame = self._enclosing("form")
+        form = attrs.get("form")
+        if form is None and form_frame is not None:
+            form = form_frame["attrs"].get("id") or form_frame["attrs"].get("name")
+
+        labels = [attrs[key] for key in ("aria-label", "placeholder", "title") if attrs.get(key)]
+        style = (attrs.get("style") or "").replace(" ", "").lower()
+        record = {
+            "tag": tag,
+            "id": attrs.get("id"),
+            "name": attrs.get("name"),
+            "type": attrs.get("type"),
+            "value": attrs.get("value"),
+            "labels": labels,
+            "text": "",
+            "css": css,
+            "xpath": xpath,
+            "form": form,
+            "section": self.section,
+            "interactive": tag in INTERACTIVE_TAGS,
+            "disabled": "disabled" in attrs,
+            "required": "required" in attrs,
+            "checked": "checked" in attrs,
+            "hidden": "hidden" in attrs or "display:none" in style or attrs.get("type") == "hidden",
+        }
+        if tag == "a":
+            record["href"] = attrs.get("href")
+        label_frame = self._enclosing("label")
+        if label_frame is not None:
+            label_frame.setdefault("wrapped", []).append(record)
+        return record
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {key: (value if value is not None else "") for key, value in attrs}
+        frame = self._open(tag, attrs)
+        if tag == "form":
+            self.forms.append({"id": attrs.get("id"), "name": attrs.get("name"), "action": attrs.get("action"),
+                               "method": attrs.get("method"), "css": " > ".join(frame["css"]), "section": self.section})
+        if tag in INTERACTIVE_TAGS or attrs.get("id"):
+            if not (tag == "a" and "href" not in attrs and not attrs.get("id")):
+                frame["record"] = self._record(frame)
+                self.elements.append(frame["record"])
+        if tag not in VOID_TAGS:
+            self.stack.append(frame)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and self.stack[-1]["tag"] == tag:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if not any(frame["tag"] == tag for frame in self.stack[1:]):
+            return # Stray end tag
+        while True:
+            frame = self.stack.pop()
+            text = re.sub(r"\s+", " ", "".join(frame["text"])).strip()
+            if self.stack:
+                self.stack[-1]["text"].append(" " + "".join(frame["text"]) + " ")
+            if frame["record"] is not None and text:
+                frame["record"]["text"] = text[:TEXT_LIMIT]
+            if frame["tag"] in HEADING_TAGS and text:
+                self.section = text[:TEXT_LIMIT]
+            if frame["tag"] == "title" and text:
+                self.title = text
+            if frame["tag"] == "label" and text:
+                if frame["attrs"].get("for"):
+                    self.labels_for.setdefault(frame["attrs"]["for"], []).append(text[:TEXT_LIMIT])
+                for wrapped in frame.get("wrapped", []):
+                    wrapped["labels"].append(text[:TEXT_LIMIT])
+            if frame["tag"] == tag:
+                return
+
+    def handle_data(self, data):
+        self.stack[-1]["text"].append(data)
+
+    def handle_comment(self, data):
+        self.comments.append(data)
+
+
+def build_dom_index(html: str) -> Dict:
+    """
+    Builds a compact structural index of an HTML page: every interactive element (and every other
+    element with an id) with its id, name, type, labels, text, a stable CSS selector and XPath,
+    its form membership and the heading of the section it sits in.
+
+    Markup that is entirely commented out (as in the sample checkout.html) is indexed from the
+    comment bodies when the live document has no elements.
+    """
+    parser = _DomIndexParser()
+    parser.feed(html)
+    parser.close()
+    if not parser.elements:
+        commented_markup = "\n".join(comment for comment in parser.comments if "<" in comment)
+        if commented_markup:
+            parser = _DomIndexParser()
+            parser.feed(commented_markup)
+            parser.close()
+
+    for element in parser.elements:
+        if element["id"] and element["id"] in parser.labels_for:
+            element["labels"] = parser.labels_for[element["id"]] + element["labels"]
+    for form in parser.forms:
+        form["elements"] = [
+            element["id"] or element["css"] for element in parser.elements
+            if element["form"] and element["form"] in (form["id"], form["name"])
+        ]
+    return {"title": parser.title, "elements": parser.elements, "forms": parser.forms}
+
+
+def _tokens(text: str) -> List[str]:
+    return [token for token in re.split(r"[^a-z0-9]+", text.lower()) if len(token) > 1]
+
+
+def select_relevant_elements(index: Dict, query_text: str, max_elements: int = 30,
+                             min_elements: int = 10) -> List[Dict]:
+    """
+    Picks the elements most relevant to `query_text` by token overlap with their ids, names, labels,
+    text and section, padding with interactive elements when few match. Returns them in document order.
+    """
+    elements = index.get("elements", [])
+    query_tokens = set(_tokens(query_text))
+    scored = []
+    for position, element in enumerate(elements):
+        strong = set(_tokens(" ".join(filter(None, [element["id"], element["name"]]))))
+        weak = set(_tokens(" ".join(filter(None, element["labels"] + [
+            element["text"], element["section"], element["type"], element["value"], element["form"]]))))
+        score = 2 * len(query_tokens & strong) + len(query_tokens & (weak - strong))
+        if score:
+            scored.append((score, position))
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    chosen = {position for _, position in scored[:max_elements]}
+    for position, element in enumerate(elements):
+        if len(chosen) >= min(min_elements, max_elements):
+            break
+        if element["interactive"]:
+            chosen.add(position)
+    return [elements[position] for position in sorted(chosen)]
+
+
+def format_element_digest(elements: List[Dict]) -> str:
+    """
+    Renders elements as one compact line each, e.g.
+    `button#pay_now_btn "Pay Now" [disabled] css=#pay_now_btn xpath=//*[@id="pay_now_btn"] section="Payment Method"`.
+    """
+    lines = []
+    for element in elements:
+        head = element["tag"] + (f"#{element['id']}" if element["id"] else "")
+        parts = [head]
+        for key in ("type", "name", "value"):
+            if element.get(key):
+                parts.append(f'{key}="{element[key]}"')
+        if element["labels"]:
+            parts.append("label=" + json.dumps(" / ".join(element["labels"])))
+        if element["text"] and element["text"] not in element["labels"]:
+            parts.append("text=" + json.dumps(element["text"]))
+        if element.get("href"):
+            parts.append(f'href="{element["href"]}"')
+        flags = [flag for flag in ("disabled", "required", "checked", "hidden") if element.get(flag)]
+        if flags:
+            parts.append("[" + ",".join(flags) + "]")
+        parts.append(f"css={element['css']}")
+        parts.append(f"xpath={element['xpath']}")
+        if element["form"]:
+            parts.append(f'form="{element["form"]}"')
+        if element["section"]:
+            parts.append("section=" + json.dumps(element["section"]))
+        lines.append(" ".join(parts))
+    return "\n".join(lines)
+
+
+class DomIndexStore:
+    """
+    DOM indexes keyed by source document, persisted as JSON next to the Chroma collection.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.indexes: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.indexes = json.load(f)
+            except Exception as e:
+                print(f"Error reading DOM index {path}: {e}")
+
+    def update(self, source_document: str, index: Dict) -> None:
+        self.indexes[source_document] = index
+        self.save()
+
+    def remove(self, source_document: str) -> None:
+        if self.indexes.pop(source_document, None) is not None:
+            self.save()
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.indexes, f)
+        os.replace(tmp_path, self.path)
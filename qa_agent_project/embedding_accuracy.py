@@ -0,0 +1,141 @@
+"""
+Compares the int8 embedding backend against the fp32 baseline on the data/ corpus.
+
+Chunks the fixtures the way KnowledgeBase does, embeds them with both backends and reports the
+speedup, how closely the int8 vectors track the fp32 ones (cosine similarity) and retrieval
+agreement: for a set of queries, recall@k of the int8 top-k against the fp32 top-k.
+
+    python embedding_accuracy.py --threads 4 --output embedding_accuracy.json
+    python embedding_accuracy.py --min-recall 0.9   # exit code 1 below this recall@5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from typing import List, Dict
+from chunkers import chunk_document
+from embeddings import EmbeddingModel, DEFAULT_EMBEDDING_MODEL
+
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+QUERIES = [
+    "Generate all positive and negative test cases for the discount code feature.",
+    "What are the form validation rules for the email field?",
+    "How is the shipping cost calculated for express delivery?",
+    "Pay Now button state and payment success message",
+    "What happens when an invalid discount code is applied?",
+    "Which fields are required in the user details form?",
+    "API endpoint for applying a coupon",
+    "Error message colour and placement guidelines",
+]
+
+
+def load_chunks(data_dir: str) -> List[str]:
+    # Same chunker and settings as KnowledgeBase, so the chunks match what gets ingested.
+    chunks = []
+    for name in sorted(os.listdir(data_dir)):
+        with open(os.path.join(data_dir, name), 'r', encoding='utf-8') as f:
+            chunks.extend(text for text, _ in chunk_document(f.read(), {"source_document": name},
+                                                             max_chars=1000, overlap=200))
+    return chunks
+
+
+def probe_queries(chunks: List[str], max_length: int = 120) -> List[str]:
+    """
+    One short query per chunk, taken from its first non-empty line.
+    """
+    queries = []
+    for chunk in chunks:
+        line = next((line.strip() for line in chunk.splitlines() if len(line.strip()) > 10), chunk.strip())
+        queries.append(line[:max_length])
+    return queries
+
+
+def dot(a: List[float], b: List[float]) -> float:
+    return sum(x * y for x, y in zip(a, b)) # Embeddings are unit length, so this is the cosine
+
+
+def top_k(query_embedding: List[float], chunk_embeddings: List[List[float]], k: int) -> List[int]:
+    scores = [dot(query_embedding, chunk_embedding) for chunk_embedding in chunk_embeddings]
+    return sorted(range(len(scores)), key=lambda index: -scores[index])[:k]
+
+
+def timed_encode(model: EmbeddingModel, texts: List[str], batch_size: int, repeats: int) -> Dict:
+    model.encode(texts[:batch_size], batch_size=batch_size) # Warm-up (loads weights)
+    best = None
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        embeddings = model.encode(texts, batch_size=batch_size)
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return {"embeddings": embeddings, "seconds": best, "texts_per_second": len(texts) / best if best else 0.0}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Accuracy and speed of the int8 embedding backend vs fp32.")
+    parser.add_argument("--model", default=DEFAULT_EMBEDDING_MODEL, help="Embedding model name.")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Directory with the corpus documents.")
+    parser.add_argument("--threads", type=int, default=None, help="PyTorch intra-op threads.")
+    parser.add_argument("--batch-size", type=int, default=32, help="Encoding batch size.")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed encoding passes per backend (best is kept).")
+    parser.add_argument("--k", default="1,3,5", help="Comma-separated k values for recall@k.")
+    parser.add_argument("--min-recall", type=float, default=None, help="Fail if recall@5 falls below this.")
+    parser.add_argument("--output", help="Optional path for the JSON report.")
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.data_dir)
+    queries = QUERIES + probe_queries(chunks)
+    ks = [int(k) for k in args.k.split(",") if k.strip()]
+    print(f"{len(chunks)} chunks, {len(queries)} queries")
+
+    runs = {}
+    for backend in ("fp32", "int8"):
+        model = EmbeddingModel(args.model, backend=backend, num_threads=args.threads)
+        chunk_run = timed_encode(model, chunks, args.batch_size, args.repeats)
+        runs[backend] = {
+            "chunks": chunk_run["embeddings"],
+            "queries": model.encode(queries, batch_size=args.batch_size),
+            "seconds": chunk_run["seconds"],
+            "texts_per_second": chunk_run["texts_per_second"],
+        }
+
+    baseline, quantized = runs["fp32"], runs["int8"]
+    similarities = [dot(a, b) for a, b in zip(baseline["chunks"] + baseline["queries"],
+                                              quantized["chunks"] + quantized["queries"])]
+    recall = {}
+    for k in ks:
+        overlaps = []
+        for fp32_query, int8_query in zip(baseline["queries"], quantized["queries"]):
+            expected = set(top_k(fp32_query, baseline["chunks"], k))
+            actual = set(top_k(int8_query, quantized["chunks"], k))
+            overlaps.append(len(expected & actual) / len(expected))
+        recall[f"recall@{k}"] = sum(overlaps) / len(overlaps)
+
+    report = {
+        "model": args.model,
+        "threads": args.threads,
+        "batch_size": args.batch_size,
+        "chunks": len(chunks),
+        "queries": len(queries),
+        "fp32_texts_per_second": baseline["texts_per_second"],
+        "int8_texts_per_second": quantized["texts_per_second"],
+        "speedup": baseline["seconds"] / quantized["seconds"] if quantized["seconds"] else 0.0,
+        "cosine_mean": sum(similarities) / len(similarities),
+        "cosine_min": min(similarities),
+        **recall,
+    }
+    for key, value in report.items():
+        print(f"{key:>22}: {value:.4f}" if isinstance(value, float) else f"{key:>22}: {value}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.min_recall is not None and report.get("recall@5", 1.0) < args.min_recall:
+        print(f"recall@5 {report['recall@5']:.3f} is below the required {args.min_recall:.3f}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# "fp32" runs the model as published; "int8" applies dynamic int8 quantization to its Linear
+# layers, which is considerably faster on CPU at a small cost in embedding fidelity.
+EMBEDDING_BACKENDS = ("fp32", "int8")
+DEFAULT_EMBEDDING_BACKEND = "fp32"
+
+
+def default_embedding_backend() -> str:
+    """
+    Backend used when none is requested: QA_AGENT_EMBEDDING_BACKEND, else fp32.
+    """
+    return os.getenv("QA_AGENT_EMBEDDING_BACKEND", DEFAULT_EMBEDDING_BACKEND)
+
+
+def default_embedding_threads() -> Optional[int]:
+    """
+    Intra-op thread count from QA_AGENT_EMBEDDING_THREADS; None leaves PyTorch's default.
+    """
+    threads = os.getenv("QA_AGENT_EMBEDDING_THREADS")
+    return int(threads) if threads else None
+
+
+class EmbeddingModel:
+    """
+    A tokenizer/transformer pair that turns texts into sentence embeddings.
+
+    Weights are loaded lazily on first use. Pooling mirrors the sentence-transformers
+    pipeline for all-MiniLM-L6-v2 (attention-masked mean pooling followed by L2
+    normalisation), so documents and queries land in the same vector space.
+
+    `backend` selects fp32 or dynamically quantized int8 weights, and `num_threads` sets
+    PyTorch's intra-op thread count when the model loads (it is a process-wide setting).
+    """
+    def __init__(self, model_name: str = DEFAULT_EMBEDDING_MODEL, max_seq_length: int = 256, batch_size: int = 32,
+                 backend: str = DEFAULT_EMBEDDING_BACKEND, num_threads: Optional[int] = None):
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend '{backend}'. Choose one of {', '.join(EMBEDDING_BACKENDS)}.")
+        self.model_name = model_name
+        self.max_seq_length = max_seq_length
+        self.batch_size = batch_size
+        self.backend = backend
+        self.num_threads = num_threads
+        self._tokenizer = None
+        self._model = None
+        self._load_lock = threading.Lock()
+
+    def _load_tokenizer(self) -> None:
+        # The tokenizer alone is enough for counting tokens; the weights load on first encode().
+        if self._tokenizer is not None:
+            return
+        with self._load_lock:
+            if self._tokenizer is None:
+                from transformers import AutoTokenizer
+                self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+
+    def _load(self) -> None:
+        if self._model is not None:
+            return
+        self._load_tokenizer()
+        with self._load_lock:
+            if self._model is not None:
+                return
+            import torch
+            from transformers import AutoModel
+            if self.num_threads:
+                torch.set_num_threads(self.num_threads)
+            model = AutoModel.from_pretrained(self.model_name)
+            model.eval()
+            if self.backend == "int8":
+                if "fbgemm" not in torch.backends.quantized.supported_engines:
+                    torch.backends.quantized.engine = "qnnpack" # ARM CPUs
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            self._model = model
+            print(f"Embedding model {self.model_name} loaded ({self.backend}, {torch.get_num_threads()} threads).")
+
+    @property
+    def key(self) -> str:
+        """
+        Identifies the vector space this model produces, e.g. for ingest manifests: the model
+        name, suffixed with the backend unless it is fp32.
+        """
+        return self.model_name if self.backend == "fp32" else f"{self.model_name}@{self.backend}"
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def tokenizer(self):
+        self._load_tokenizer()
+        return self._tokenizer
+
+    @property
+    def model(self):
+        self._load()
+        return self._model
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Number of tokenizer tokens in `text`, without special tokens or truncation. Loads only the
+        tokenizer, not the model weights.
+        """
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def encode(self, texts: List[str], batch_size: Optional[int] = None) -> List[List[float]]:
+        """
+        Embeds a list of texts, processing them in batches of `batch_size` (defaults to the model's).
+
+        Texts are batched in order of length so each batch pads to similar lengths; results are
+        returned in input order.
+        """
+        if not texts:
+            return []
+        self._load()
+        import torch
+
+        batch_size = batch_size or self.batch_size
+        order = sorted(range(len(texts)), key=lambda index: len(texts[index]), reverse=True)
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            batch_indices = order[start:start + batch_size]
+            batch = [texts[index] for index in batch_indices]
+            inputs = self._tokenizer(
+                batch,
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="pt",
+            )
+            with torch.inference_mode():
+                model_output = self._model(**inputs)
+            # Mean pooling over real tokens only, then unit-normalise.
+            token_embeddings = model_output.last_hidden_state
+            mask = inputs["attention_mask"].unsqueeze(-1).to(token_embeddings.dtype)
+            summed = (token_embeddings * mask).sum(dim=1)
+            counts = mask.sum(dim=1).clamp(min=1e-9)
+            pooled = torch.nn.functional.normalize(summed / counts, p=2, dim=1)
+            for index, vector in zip(batch_indices, pooled.cpu().numpy().tolist()):
+                embeddings[index] = vector
+        return embeddings
+
+
+_registry: Dict[Tuple[str, str], EmbeddingModel] = {}
+_registry_lock = threading.Lock()
+
+
+def get_embedding_model(model_name: str = DEFAULT_EMBEDDING_MODEL, backend: Optional[str] = None) -> EmbeddingModel:
+    """
+    Returns the process-wide EmbeddingModel for `model_name` and `backend` (default: see
+    default_embedding_backend), creating it on first request. Every KnowledgeBase (and every
+    Streamlit session) in the process shares the same weights.
+    """
+    backend = backend or default_embedding_backend()
+    with _registry_lock:
+        embedding_model = _registry.get((model_name, backend))
+        if embedding_model is None:
+            embedding_model = EmbeddingModel(model_name, backend=backend, num_threads=default_embedding_threads())
+            _registry[(model_name, backend)] = embedding_model
+        return embedding_model
+
+
+def loaded_models() -> List[str]:
+    """
+    Lists the keys (see EmbeddingModel.key) of registered models whose weights are in memory.
+    """
+    with _registry_lock:
+        return [embedding_model.key for embedding_model in _registry.values() if embedding_model.is_loaded]
@@ -0,0 +1,76 @@
+import re
+import time
+import json
+import hashlib
+import threading
+from typing import List, Iterator
+
+
+class FakeResponseChunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """
+    Deterministic, offline stand-in for genai.GenerativeModel.
+
+    Test-case prompts get a fenced JSON array of test cases; any other prompt gets a fenced
+    Python Selenium script. Output depends only on the prompt, and every call sleeps for
+    `latency` seconds (spread across chunks when streaming) to imitate API round-trips.
+    Prompts are recorded in `prompts` for inspection.
+    """
+    def __init__(self, model_name: str = "fake-llm", latency: float = 0.0, test_cases_per_prompt: int = 5,
+                 stream_chunk_size: int = 64):
+        self.model_name = model_name
+        self.latency = latency
+        self.test_cases_per_prompt = test_cases_per_prompt
+        self.stream_chunk_size = stream_chunk_size
+        self.prompts: List[str] = []
+        self._lock = threading.Lock()
+
+    def _respond(self, prompt: str) -> str:
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        if "test cases in a JSON array" in prompt:
+            feature_match = re.search(r'User Query: "(.*?)"', prompt)
+            feature = feature_match.group(1)[:60] if feature_match else "Checkout"
+            test_cases = [
+                {
+                    "Test_ID": f"TC-{index:03d}",
+                    "Feature": feature,
+                    "Test_Scenario": f"Scenario {index} for {feature} ({digest})",
+                    "Expected_Result": f"Expected outcome {index} ({digest})",
+                    "Grounded_In": "product_specs.md"
+                }
+                for index in range(1, self.test_cases_per_prompt + 1)
+            ]
+            return "```json\n" + json.dumps(test_cases, indent=2) + "\n```"
+        test_id_match = re.search(r"Test ID: (\S+)", prompt)
+        test_id = test_id_match.group(1) if test_id_match else "TC-000"
+        return (
+            "```python\n"
+            "from selenium import webdriver\n"
+            "from selenium.webdriver.common.by import By\n\n"
+            f"def test_{re.sub(r'[^0-9A-Za-z]+', '_', test_id).lower()}():\n"
+            "    driver = webdriver.Chrome()\n"
+            "    driver.get(\"file:///C:/path/to/checkout.html\")\n"
+            f"    # prompt {digest}\n"
+            "    assert driver.find_element(By.ID, \"pay_now_btn\") is not None\n"
+            "    driver.quit()\n"
+            "```"
+        )
+
+    def generate_content(self, prompt: str, stream: bool = False):
+        with self._lock:
+            self.prompts.append(prompt)
+        text = self._respond(prompt)
+        if not stream:
+            time.sleep(self.latency)
+            return FakeResponseChunk(text)
+        return self._stream(text)
+
+    def _stream(self, text: str) -> Iterator[FakeResponseChunk]:
+        pieces = [text[start:start + self.stream_chunk_size] for start in range(0, len(text), self.stream_chunk_size)]
+        for piece in pieces:
+            time.sleep(self.latency / len(pieces))
+            yield FakeResponseChunk(piece)
@@ -0,0 +1,126 @@
+import re
+from typing import List, Dict, Iterable, Tuple, Optional
+from chunkers import is_text_heading
+
+# Markdown headings below the document title (## and deeper).
+MARKDOWN_HEADING = re.compile(r"^#{2,4}\s+(.+?)\s*#*\s*$")
+
+
+def spec_headings(text: str) -> List[str]:
+    """
+    Section headings of a specification: Markdown `##`-`####` headings or, for plain text, short
+    title-like lines that follow a blank line and are immediately followed by content. A
+    document title (followed by a blank line, or a single `#` heading) is not a section.
+    """
+    lines = text.splitlines()
+    headings = []
+    for index, line in enumerate(lines):
+        stripped = line.strip()
+        match = MARKDOWN_HEADING.match(stripped)
+        if match:
+            headings.append(match.group(1).strip())
+        elif is_text_heading(lines, index):
+            headings.append(stripped)
+    return headings
+
+
+def dom_features(index: Dict) -> List[Tuple[str, List[str]]]:
+    """
+    Testable areas of a page from its DOM index (see dom_index.build_dom_index): one per form,
+    then one per section heading with interactive elements outside those forms. Returns
+    (feature name, element ids) pairs.
+    """
+    features = []
+    for form in index.get("forms", []):
+        form_key = form.get("id") or form.get("name")
+        if not form_key:
+            continue
+        name = form_key.replace("_", " ").replace("-", " ").strip().title()
+        if "form" not in name.lower():
+            name += " Form"
+        features.append((name, [element for element in form.get("elements", []) if not element.startswith(("#", "/"))]))
+
+    sections: Dict[str, List[str]] = {}
+    for element in index.get("elements", []):
+        if element.get("interactive") and not element.get("form") and element.get("section"):
+            sections.setdefault(element["section"], []).append(element.get("id") or element.get("name") or element["css"])
+    features.extend((section, element_ids) for section, element_ids in sections.items())
+    return features
+
+
+def _normalise(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", name.lower()).strip()
+
+
+def plan_features(chunks: Iterable[Tuple[str, Dict]], dom_indexes: Dict[str, Dict],
+                  max_features: int = 12) -> List[Dict]:
+    """
+    Derives the features to test from a knowledge base: the spec sections of the text chunks (their
+    `section` metadata, or the headings in chunks stored before structure-aware chunking) and the
+    forms and sections of every indexed HTML page. Each feature is a dict with `name`, a
+    `retrieval_query` for focused retrieval and its `sources`. Spec and page features are
+    interleaved so both are represented when `max_features` cuts the list.
+    """
+    spec: Dict[str, Dict] = {}
+    for document, metadata in chunks:
+        if metadata.get("type") == "html":
+            continue
+        source = metadata.get("source_document", "unknown")
+        if "structure_path" in metadata:
+            headings = [metadata["section"]] if metadata.get("section") else []
+        else:
+            headings = spec_headings(document)
+        for heading in headings:
+            feature = spec.setdefault(_normalise(heading), {"name": heading, "retrieval_query": heading, "sources": []})
+            if source not in feature["sources"]:
+                feature["sources"].append(source)
+
+    page: Dict[str, Dict] = {}
+    for source, index in dom_indexes.items():
+        for name, element_ids in dom_features(index):
+            feature = page.setdefault(_normalise(name), {"name": name, "retrieval_query": name, "sources": []})
+            feature["retrieval_query"] = " ".join([name] + element_ids[:8])
+            if source not in feature["sources"]:
+                feature["sources"].append(source)
+
+    features: List[Dict] = []
+    spec_features = list(spec.values())
+    page_features = [feature for key, feature in page.items() if key not in spec]
+    for position in range(max(len(spec_features), len(page_features))):
+        for group in (spec_features, page_features):
+            if position < len(group):
+                features.append(group[position])
+    return features[:max_features]
+
+
+def dedupe_by_similarity(items: List[Dict], embeddings: List[List[float]], threshold: float = 0.92) -> Tuple[List[Dict], int]:
+    """
+    Keeps items in order, dropping any whose (unit-length) embedding has cosine similarity of at
+    least `threshold` with an item already kept. Returns (kept items, number dropped).
+    """
+    kept: List[Dict] = []
+    kept_embeddings: List[List[float]] = []
+    for item, embedding in zip(items, embeddings):
+        if any(sum(a * b for a, b in zip(embedding, other)) >= threshold for other in kept_embeddings):
+            continue
+        kept.append(item)
+        kept_embeddings.append(embedding)
+    return kept, len(items) - len(kept)
+
+
+def renumber_test_ids(test_cases: List[Dict], prefix: str = "TC", start: int = 1) -> List[Dict]:
+    """
+    Assigns sequential Test_IDs (TC-001, TC-002, ...) so ids from separate generations never collide.
+    """
+    width = max(3, len(str(start + len(test_cases) - 1)))
+    return [dict(test_case, Test_ID=f"{prefix}-{number:0{width}d}")
+            for number, test_case in enumerate(test_cases, start=start)]
+
+
+def test_case_text(test_case: Dict, feature: Optional[str] = None) -> str:
+    """
+    The text a test case is compared by when de-duplicating.
+    """
+    return " | ".join(str(part) for part in (
+        test_case.get("Feature") or feature or "", test_case.get("Test_Scenario", ""), test_case.get("Expected_Result", "")
+    ))
@@ -0,0 +1,96 @@
+import os
+import json
+import hashlib
+from typing import Dict, List, Optional
+
+
+def content_hash(text: str, metadata: Optional[Dict] = None) -> str:
+    """
+    Stable SHA-256 over a text and (optionally) its metadata.
+    """
+    hasher = hashlib.sha256()
+    if metadata:
+        hasher.update(json.dumps(metadata, sort_keys=True, default=str).encode("utf-8"))
+        hasher.update(b"\0")
+    hasher.update(text.encode("utf-8"))
+    return hasher.hexdigest()
+
+
+class IngestManifest:
+    """
+    Records which documents and chunks are already embedded in a collection, so that
+    ingestion only embeds what changed.
+
+    Layout on disk:
+        {
+            "embedding_model": "<model name>",
+            "documents": {
+                "<source_document>": {
+                    "content_hash": "<sha256>",
+                    "chunks": {"<chunk id>": "<sha256>", ...}
+                }
+            }
+        }
+    """
+    def __init__(self, path: str, embedding_model_name: str):
+        self.path = path
+        self.embedding_model_name = embedding_model_name
+        self.documents: Dict[str, Dict] = {}
+        self.model_changed = False # Set when the file on disk was written for another model
+        self.stored_model_name: Optional[str] = None # That model, kept on disk until mark_migrated()
+        self.load()
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Error reading ingest manifest {self.path}: {e}. Starting from an empty manifest.")
+            return
+        if data.get("embedding_model") != self.embedding_model_name:
+            # Vectors from another model are not comparable, so none of the recorded chunks can be
+            # reused: the manifest starts empty and ingestion embeds every chunk again.
+            print(f"Ingest manifest {self.path} was built with embedding model {data.get('embedding_model')}, "
+                  f"not {self.embedding_model_name}. Ignoring it; documents are embedded again when next ingested.")
+            self.model_changed = True
+            self.stored_model_name = data.get("embedding_model")
+            return
+        self.documents = data.get("documents", {})
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # Until the collection is migrated, some of its chunks still carry the old model's vectors,
+        # so the file keeps naming that model and the next process sees the change too.
+        model_name = self.stored_model_name if self.model_changed else self.embedding_model_name
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"embedding_model": model_name, "documents": self.documents}, f)
+        os.replace(tmp_path, self.path)
+
+    def mark_migrated(self) -> None:
+        """
+        Records that every stored chunk is embedded with the current model; takes effect on save().
+        """
+        self.model_changed = False
+        self.stored_model_name = None
+
+    def clear(self) -> None:
+        self.documents = {}
+
+    def is_unchanged(self, source_document: str, doc_hash: str) -> bool:
+        entry = self.documents.get(source_document)
+        return entry is not None and entry.get("content_hash") == doc_hash
+
+    def has_document(self, source_document: str) -> bool:
+        return source_document in self.documents
+
+    def chunk_ids(self, source_document: str) -> List[str]:
+        return list(self.documents.get(source_document, {}).get("chunks", {}))
+
+    def update(self, source_document: str, doc_hash: Optional[str], chunks: Dict[str, str]) -> None:
+        self.documents[source_document] = {"content_hash": doc_hash, "chunks": chunks}
+
+    def remove(self, source_document: str) -> None:
+        self.documents.pop(source_document, None)
@@ -0,0 +1,309 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from typing import List, Dict, Optional, Iterator, Callable, Any
+
+# The span currently open in this thread / task. Worker threads inherit it only when started
+# through copy_context() (see run_in_context), which is how child spans find their parent.
+_current_span: contextvars.ContextVar = contextvars.ContextVar("qa_agent_current_span", default=None)
+# Trace id for root spans opened in this context; see trace_context().
+_context_trace_id: contextvars.ContextVar = contextvars.ContextVar("qa_agent_trace_id", default=None)
+
+
+class Span:
+    """
+    One timed stage of a request. `start` is wall-clock time (comparable across threads and
+    processes), `duration` is measured with a monotonic clock.
+    """
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "root_id", "start", "duration", "attributes", "thread")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], start: float,
+                 attributes: Optional[Dict] = None, root_id: Optional[str] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        # Span id of the root span this one nests under (its own id for a root span).
+        self.root_id = root_id or self.span_id
+        self.start = start
+        self.duration = 0.0
+        self.attributes = dict(attributes or {})
+        self.thread = threading.current_thread().name
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name, "trace_id": self.trace_id, "span_id": self.span_id,
+            "parent_id": self.parent_id, "start": self.start, "duration": self.duration,
+            "attributes": self.attributes, "thread": self.thread,
+        }
+
+
+class Telemetry:
+    """
+    In-process spans and metrics.
+
+    Spans nest through a context variable; a span opened with no parent starts a new trace,
+    and the trace is kept (up to `max_traces` most recent) once that root span ends. Every
+    finished span also feeds a `stage_seconds` summary labelled with the span name. Counters
+    and summaries can be exported in the Prometheus text format, spans as JSON lines. When
+    `trace_file` is set each finished trace is appended to it as JSON lines.
+    """
+    def __init__(self, max_traces: int = 50, trace_file: Optional[str] = None, namespace: str = "qa_agent"):
+        self.max_traces = max_traces
+        self.trace_file = trace_file
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        # Root span id -> spans opened under that root. Several roots can share a trace id (see
+        # trace_context), so each one collects and finishes only its own spans.
+        self._open_traces: Dict[str, List[Span]] = {}
+        self._traces: "deque[List[Span]]" = deque(maxlen=max_traces)
+        self._counters: "OrderedDict[tuple, float]" = OrderedDict() # (name, labels) -> value
+        self._summaries: "OrderedDict[tuple, List[float]]" = OrderedDict() # (name, labels) -> [count, sum]
+
+    @staticmethod
+    def _labels(labels: Dict) -> tuple:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def increment(self, name: str, value: float = 1.0, **labels) -> None:
+        key = (name, self._labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, self._labels(labels))
+        with self._lock:
+            summary = self._summaries.setdefault(key, [0, 0.0])
+            summary[0] += 1
+            summary[1] += value
+
+    def _open(self, name: str, start: float, attributes: Dict) -> Span:
+        parent = _current_span.get()
+        trace_id = parent.trace_id if parent is not None else (_context_trace_id.get() or uuid.uuid4().hex[:16])
+        span = Span(name, trace_id, parent.span_id if parent is not None else None, start, attributes,
+                    root_id=parent.root_id if parent is not None else None)
+        with self._lock:
+            if parent is None:
+                self._open_traces[span.root_id] = [span]
+            elif span.root_id in self._open_traces:
+                self._open_traces[span.root_id].append(span)
+            # A span opened after its root ended only feeds the stage summary.
+        return span
+
+    def _close(self, span: Span) -> None:
+        self.observe("stage_seconds", span.duration, stage=span.name)
+        if span.parent_id is not None:
+            return
+        with self._lock:
+            trace = self._open_traces.pop(span.root_id, [span])
+            self._traces.append(trace)
+        if self.trace_file:
+            self._append_trace(trace)
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """
+        Times the enclosed block as a child of the current span. Yields the span so callers can
+        attach attributes (counts, cache hits, ...) with span.set().
+        """
+        span = self._open(name, time.time(), attributes)
+        token = _current_span.set(span)
+        start_time = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            span.duration = time.perf_counter() - start_time
+            _current_span.reset(token)
+            self._close(span)
+
+    def record_span(self, name: str, duration: float, start: Optional[float] = None, **attributes) -> Span:
+        """
+        Records a span measured elsewhere (e.g. in a process-pool worker, or across a generator's
+        yields) as a child of the current span. `start` defaults to `duration` seconds ago.
+        """
+        span = self._open(name, start if start is not None else time.time() - duration, attributes)
+        span.duration = duration
+        self._close(span)
+        return span
+
+    def traces(self) -> List[List[Dict]]:
+        """
+        Finished traces, most recent first, each as a list of span dicts ordered by start time.
+        """
+        with self._lock:
+            traces = list(self._traces)
+        return [sorted((span.to_dict() for span in trace), key=lambda span: span["start"])
+                for trace in reversed(traces)]
+
+    def trace(self, trace_id: str) -> List[Dict]:
+        """
+        Spans of finished trace `trace_id`, ordered by start time; empty if it is unknown or has
+        already been dropped. Root spans that joined the same trace through trace_context() are
+        merged into it.
+        """
+        with self._lock:
+            spans = [span.to_dict() for trace in self._traces if trace[0].trace_id == trace_id for span in trace]
+        return sorted(spans, key=lambda span: span["start"])
+
+    def counters(self) -> Dict[str, float]:
+        with self._lock:
+            return {self._series_name(name, labels): value for (name, labels), value in self._counters.items()}
+
+    def _series_name(self, name: str, labels: tuple) -> str:
+        label_text = ",".join(f'{key}="{value}"' for key, value in labels)
+        return f"{self.namespace}_{name}" + (f"{{{label_text}}}" if label_text else "")
+
+    def prometheus_text(self) -> str:
+        """
+        Counters and summaries in the Prometheus text exposition format.
+        """
+        with self._lock:
+            counters = list(self._counters.items())
+            summaries = [(key, list(value)) for key, value in self._summaries.items()]
+        # Series of one metric family must be contiguous; keep families in first-seen order.
+        first_seen = {}
+        for (name, _), _ in counters + summaries:
+            first_seen.setdefault(name, len(first_seen))
+        counters.sort(key=lambda item: first_seen[item[0][0]])
+        summaries.sort(key=lambda item: first_seen[item[0][0]])
+        lines = []
+        declared = set()
+        for (name, labels), value in counters:
+            if name not in declared:
+                lines.append(f"# TYPE {self.namespace}_{name} counter")
+                declared.add(name)
+            lines.append(f"{self._series_name(name, labels)} {value:g}")
+        for (name, labels), (count, total) in summaries:
+            if name not in declared:
+                lines.append(f"# TYPE {self.namespace}_{name} summary")
+                declared.add(name)
+            lines.append(f"{self._series_name(name + '_count', labels)} {count}")
+            lines.append(f"{self._series_name(name + '_sum', labels)} {total:.6f}")
+        return "\n".join(lines) + "\n"
+
+    def to_jsonl(self) -> str:
+        """
+        Every span of the retained traces as JSON lines, oldest trace first.
+        """
+        return "".join(json.dumps(span) + "\n" for trace in reversed(self.traces()) for span in trace)
+
+    def export_jsonl(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.to_jsonl())
+
+    def _append_trace(self, trace: List[Span]) -> None:
+        try:
+            with open(self.trace_file, 'a', encoding='utf-8') as f:
+                for span in sorted(trace, key=lambda span: span.start):
+                    f.write(json.dumps(span.to_dict()) + "\n")
+        except Exception as e:
+            print(f"Error writing trace to {self.trace_file}: {e}")
+
+    def reset(self) -> None:
+        with self._lock:
+            self._open_traces.clear()
+            self._traces.clear()
+            self._counters.clear()
+            self._summaries.clear()
+
+
+@contextmanager
+def trace_context(trace_id: Optional[str] = None) -> Iterator[str]:
+    """
+    Makes root spans opened in the block, and in workers bound with run_in_context, part of
+    trace `trace_id` (a new id by default), which is yielded. Used to group everything one HTTP
+    request does under the id returned to the client.
+    """
+    trace_id = trace_id or uuid.uuid4().hex[:16]
+    token = _context_trace_id.set(trace_id)
+    try:
+        yield trace_id
+    finally:
+        _context_trace_id.reset(token)
+
+
+def run_in_context(fn: Callable) -> Callable:
+    """
+    Binds `fn` to a copy of the caller's context so spans opened in a worker thread nest under
+    the span that was current when the work was submitted.
+    """
+    context = contextvars.copy_context()
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs) -> Any:
+        return context.run(fn, *args, **kwargs)
+    return wrapper
+
+
+def format_waterfall(trace: List[Dict], width: int = 40) -> str:
+    """
+    Renders a trace (as returned by Telemetry.traces()) as a text waterfall: one row per span in
+    tree order, indented by depth, with a bar positioned at its offset from the start of the trace.
+    """
+    if not trace:
+        return ""
+    trace_start = min(span["start"] for span in trace)
+    trace_end = max(span["start"] + span["duration"] for span in trace)
+    total = max(trace_end - trace_start, 1e-9)
+    span_ids = {span["span_id"] for span in trace}
+    children: Dict[Optional[str], List[Dict]] = {}
+    for span in trace:
+        parent_id = span["parent_id"] if span["parent_id"] in span_ids else None
+        children.setdefault(parent_id, []).append(span)
+
+    ordered = [] # (depth, span), depth-first with siblings by start time
+    pending = [(0, span) for span in reversed(children.get(None, []))]
+    while pending:
+        depth, span = pending.pop()
+        ordered.append((depth, span))
+        pending.extend((depth + 1, child) for child in reversed(children.get(span["span_id"], [])))
+
+    label_width = max(2 * depth + len(span["name"]) for depth, span in ordered)
+    rows = []
+    for depth, span in ordered:
+        offset = min(width - 1, int((span["start"] - trace_start) / total * width))
+        length = max(1, int(round(span["duration"] / total * width)))
+        label = "  " * depth + span["name"]
+        bar = " " * offset + "█" * min(length, width - offset)
+        rows.append(f"{label:<{label_width}} |{bar:<{width}}| {span['duration'] * 1000:8.1f} ms")
+    return "\n".join(rows)
+
+
+_telemetry: Optional[Telemetry] = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry() -> Telemetry:
+    """
+    Process-wide telemetry used by the parsers, KnowledgeBase and agents. Set QA_AGENT_TRACE_FILE
+    to also append every finished trace to a JSON lines file.
+    """
+    global _telemetry
+    with _telemetry_lock:
+        if _telemetry is None:
+            _telemetry = Telemetry(trace_file=os.getenv("QA_AGENT_TRACE_FILE"))
+        return _telemetry
+
+
+def traced(name: str) -> Callable:
+    """
+    Decorator that runs the function inside a span of the process-wide telemetry.
+    """
+    def decorator(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with get_telemetry().span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
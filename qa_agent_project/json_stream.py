@@ -0,0 +1,97 @@
+import json
+from typing import List, Iterable, Iterator, Any
+
+
+class JSONArrayStreamParser:
+    """
+    Incrementally parses a JSON array of objects arriving in arbitrary text chunks (e.g. a streamed
+    LLM response, possibly wrapped in a ```json fence) and returns each top-level object as soon
+    as its closing brace arrives.
+
+    The array starts at the first '[' followed (after whitespace) by '{' or ']', so brackets in
+    prose before it ("Here [is] the list: [...]") are skipped. Objects that fail to parse are
+    skipped and counted in `malformed`, so one bad element does not discard the rest of the
+    array. Non-object array elements are ignored.
+    """
+    def __init__(self):
+        self._buffer = ""
+        self._position = 0 # Next character of _buffer to scan
+        self._object_start = None # Index in _buffer where the current top-level object began
+        self._started = False # Seen the opening '[' of the array
+        self._finished = False # Seen the closing ']' of the array
+        self._depth = 0 # Nesting depth inside the array
+        self._in_string = False
+        self._escaped = False
+        self.parsed = 0
+        self.malformed = 0
+
+    @property
+    def finished(self) -> bool:
+        return self._finished
+
+    def feed(self, text: str) -> List[Any]:
+        """
+        Consumes the next chunk of text and returns the objects it completed.
+        """
+        if self._finished:
+            return []
+        self._buffer += text
+        completed = []
+        buffer = self._buffer
+        index = self._position
+        while index < len(buffer):
+            char = buffer[index]
+            if not self._started:
+                if char == "[":
+                    next_index = index + 1
+                    while next_index < len(buffer) and buffer[next_index].isspace():
+                        next_index += 1
+                    if next_index == len(buffer):
+                        break # The next chunk decides whether this '[' opens the array
+                    self._started = buffer[next_index] in "{]"
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0 and char == "{":
+                    self._object_start = index
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0 and char == "]":
+                    self._finished = True
+                    break
+                self._depth -= 1
+                if self._depth == 0 and char == "}" and self._object_start is not None:
+                    candidate = buffer[self._object_start:index + 1]
+                    self._object_start = None
+                    try:
+                        completed.append(json.loads(candidate))
+                        self.parsed += 1
+                    except json.JSONDecodeError:
+                        self.malformed += 1
+            index += 1
+
+        # Drop everything before the object in progress so the buffer stays small.
+        keep_from = self._object_start if self._object_start is not None else index
+        self._buffer = buffer[keep_from:]
+        if self._object_start is not None:
+            self._object_start = 0
+        self._position = index - keep_from
+        return completed
+
+
+def iter_json_array_objects(chunks: Iterable[str]) -> Iterator[Any]:
+    """
+    Yields each complete object of a JSON array streamed as text chunks.
+    """
+    parser = JSONArrayStreamParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+        if parser.finished:
+            return
@@ -1,119 +1,792 @@
 import os
-from typing import List, Dict, Tuple
+import time
+import hashlib
+import queue
+import json
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Tuple, Iterable, Iterator, Union, Optional, Callable
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_core.documents import Document
-from transformers import AutoTokenizer, AutoModel
-import torch
 import chromadb
-from chromadb.utils import embedding_functions
+from embeddings import get_embedding_model, DEFAULT_EMBEDDING_MODEL
+from ingest_manifest import IngestManifest, content_hash
+from parsers import iter_pdf_pages
+from chunkers import chunk_document, CHUNKER_VERSION
+from lexical_index import BM25Index, reciprocal_rank_fusion, is_identifier_query
+from dom_index import DomIndexStore, build_dom_index, select_relevant_elements, format_element_digest
+from instrumentation import get_telemetry, run_in_context
+
+# Retrievers query_records can use; see its docstring.
+QUERY_MODES = ("auto", "vector", "lexical", "hybrid")
 
 class KnowledgeBase:
-    def __init__(self, persist_directory="./chroma_db"):
+    def __init__(self, persist_directory="./chroma_db", embedding_model_name: str = DEFAULT_EMBEDDING_MODEL,
+                 collection_name: str = "qa_agent_knowledge_base", query_cache_size: int = 256,
+                 embedding_backend: str = None, client=None):
         self.persist_directory = persist_directory
-        self.client = chromadb.PersistentClient(path=self.persist_directory)
+        self.collection_name = collection_name
+        # Knowledge bases of several projects can share one client (see projects.ProjectManager).
+        self.client = client if client is not None else chromadb.PersistentClient(path=self.persist_directory)
+        # Shared, lazily loaded encoder used for both ingestion and queries. `embedding_backend`
+        # ("fp32" or "int8") defaults to the QA_AGENT_EMBEDDING_BACKEND environment variable.
+        self.embedding_model = get_embedding_model(embedding_model_name, embedding_backend)
+        # Spans and counters for ingestion and retrieval stages.
+        self.telemetry = get_telemetry()
         try:
-            # Initialize tokenizer and model for internal query embedding
-            self.tokenizer = AutoTokenizer.from_pretrained("sentence-transformers/all-MiniLM-L6-v2")
-            self.model = AutoModel.from_pretrained("sentence-transformers/all-MiniLM-L6-v2")
-
-            # Use ChromaDB's native SentenceTransformerEmbeddingFunction for collection creation
-            self.chroma_embedding_function_instance = embedding_functions.SentenceTransformerEmbeddingFunction(model_name="sentence-transformers/all-MiniLM-L6-v2")
-
+            # Embeddings are always computed by self.embedding_model and passed explicitly,
+            # so the collection itself does not need (or load) an embedding function.
             self.collection = self.client.get_or_create_collection(
-                name="qa_agent_knowledge_base",
-                embedding_function=self.chroma_embedding_function_instance # Pass the ChromaDB embedding function instance
+                name=self.collection_name,
+                embedding_function=None
             )
             print("ChromaDB collection initialized.")
         except Exception as e:
             print(f"Error initializing ChromaDB collection: {e}")
             self.collection = None # Indicate failure to initialize
-            self.tokenizer = None # Also indicate tokenizer/model failure
-            self.model = None
-            self.chroma_embedding_function_instance = None # Also indicate embedding function instance failure
+
+        state_files = self.state_files(self.persist_directory, self.collection_name)
+        # Content hashes of everything already embedded, kept next to the Chroma files.
+        self.manifest = IngestManifest(state_files["manifest"], self.embedding_model.key)
+        if self.collection is not None and self.collection.count() == 0:
+            if self.manifest.documents:
+                print("Collection is empty but ingest manifest is not. Resetting manifest.")
+                self.manifest.clear()
+            self.manifest.mark_migrated() # No chunks from another model to re-embed
+
+        # Structural index of ingested HTML pages (elements, selectors, forms), per source document.
+        self.dom_index = DomIndexStore(state_files["dom_index"])
+
+        # BM25 inverted index over the same chunks, for exact tokens (codes, element ids, paths).
+        self._lexical_lock = threading.Lock()
+        self.lexical_index = BM25Index(state_files["lexical_index"])
+
+        # Query memoization: an LRU of query embeddings plus retrieval results tagged with the
+        # collection version they were computed against. Every write bumps the version.
+        self.query_cache_size = query_cache_size
+        self._collection_version = 0
+        self._query_embedding_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._query_result_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._cache_stats = {"embedding_hits": 0, "embedding_misses": 0, "result_hits": 0, "result_misses": 0}
+        # Optional str -> embedding callable for query misses (e.g. a MicroBatcher's submit, so
+        # concurrent queries share one forward pass). Defaults to encoding each query on its own.
+        self.query_encoder: Optional[Callable[[str], List[float]]] = None
         
+        self.chunk_size = 1000
+        self.chunk_overlap = 200
+        # Documents are chunked by structure (chunkers.py); PDF page text has none to go by and
+        # keeps this splitter.
         self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap,
             length_function=len,
             is_separator_regex=False,
         )
         print("Text splitter initialized.")
 
+        # Migrating can take minutes on a large collection, so it is never done implicitly here.
+        if self.needs_migration:
+            print(f"Collection {self.collection_name} needs migrating (embedding model changed or lexical index "
+                  f"out of date). Run `python service.py --migrate` or call KnowledgeBase.migrate().")
+
+    @staticmethod
+    def state_files(persist_directory: str, collection_name: str) -> Dict[str, str]:
+        """
+        Paths of the files kept next to the Chroma data for a collection.
+        """
+        return {
+            "manifest": os.path.join(persist_directory, f"{collection_name}_manifest.json"),
+            "dom_index": os.path.join(persist_directory, f"{collection_name}_dom_index.json"),
+            "lexical_index": os.path.join(persist_directory, f"{collection_name}_bm25.jsonl"),
+        }
+
     def _get_embedding_function(self):
         """
-        Returns an internal embedding function for query texts using the loaded tokenizer and model.
-        This is separate from the embedding function used for collection creation.
+        Returns the embedding function shared by ingestion and queries.
         """
-        if not self.tokenizer or not self.model:
-            raise Exception("Tokenizer or model not initialized for embedding.")
-        
-        def embed_documents_for_query(texts: List[str]) -> List[List[float]]:
-            inputs = self.tokenizer(texts, padding=True, truncation=True, return_tensors="pt")
-            with torch.no_grad():
-                model_output = self.model(**inputs)
-            embeddings = model_output.last_hidden_state[:, 0, :].cpu().numpy()
-            return embeddings.tolist()
-        return embed_documents_for_query
+        if not self.embedding_model:
+            raise Exception("Embedding model not initialized.")
+        return self.embedding_model.encode
 
 
-    def add_documents(self, contents: List[str], metadatas: List[Dict]) -> None:
+    @staticmethod
+    def _chunk_id(source_document: str, chunk_content: str, metadata: Dict, seen: Dict[str, int]) -> Tuple[str, str]:
+        """
+        Derives a (chunk id, chunk hash) pair from chunk content, so an unchanged chunk keeps
+        its id no matter where it sits in the document. `seen` tracks ids already issued for
+        the document so that repeated identical chunks get distinct ids.
+        """
+        chunk_hash = content_hash(chunk_content, metadata)
+        chunk_id = f"{source_document}_{chunk_hash[:16]}"
+        occurrence = seen.get(chunk_id, 0)
+        seen[chunk_id] = occurrence + 1
+        if occurrence:
+            chunk_id = f"{chunk_id}_{occurrence}" # Identical chunks repeated within one document
+        return chunk_id, chunk_hash
+
+    @classmethod
+    def _chunk_ids(cls, source_document: str, chunks: List[Tuple[str, Dict]]) -> List[Tuple[str, str]]:
+        """
+        _chunk_id for each (text, chunk metadata) pair of a document, so a chunk's own metadata
+        (e.g. its `structure_path` and `section`) is part of its id.
+        """
+        seen: Dict[str, int] = {}
+        return [cls._chunk_id(source_document, chunk_content, chunk_metadata, seen)
+                for chunk_content, chunk_metadata in chunks]
+
+    def _existing_chunk_ids(self, source_document: str) -> List[str]:
+        """
+        Ids currently stored for a document. Falls back to the collection itself for documents
+        that were ingested before the manifest existed.
+        """
+        if self.manifest.has_document(source_document):
+            return self.manifest.chunk_ids(source_document)
+        existing = self.collection.get(where={"source_document": source_document}, include=[])
+        return existing["ids"]
+
+    def _upsert_chunks(self, records: List[Tuple[str, str, Dict]], embeddings: List[List[float]]) -> None:
+        """
+        Single write path for (id, text, metadata) chunk records; keeps derived state in sync.
+        """
+        self.collection.upsert(
+            ids=[chunk_id for chunk_id, _, _ in records],
+            documents=[text for _, text, _ in records],
+            metadatas=[metadata for _, _, metadata in records],
+            embeddings=embeddings
+        )
+        with self._lexical_lock:
+            for chunk_id, text, metadata in records:
+                self.lexical_index.add(chunk_id, text, metadata)
+        self._collection_changed()
+
+    def _delete_chunks(self, chunk_ids: List[str]) -> None:
+        """
+        Single delete path for chunk ids; keeps derived state in sync.
+        """
+        self.collection.delete(ids=chunk_ids)
+        self.telemetry.increment("chunks_deleted_total", len(chunk_ids))
+        with self._lexical_lock:
+            for chunk_id in chunk_ids:
+                self.lexical_index.remove(chunk_id)
+        self._collection_changed()
+
+    def _save_ingest_state(self) -> None:
+        """
+        Persists the ingest manifest and lexical index after a batch of writes.
+        """
+        self.manifest.save()
+        with self._lexical_lock:
+            self.lexical_index.save()
+
+    @property
+    def needs_migration(self) -> bool:
+        """
+        Whether migrate() has work to do: stored chunks embedded with another model or backend, or
+        a BM25 index that does not cover the collection.
+        """
+        if self.collection is None:
+            return False
+        count = self.collection.count()
+        return (self.manifest.model_changed and count > 0) or len(self.lexical_index) != count
+
+    def migrate(self) -> Dict:
+        """
+        Brings a collection written by an earlier version or another embedding backend up to date:
+        rebuilds the BM25 index if it does not match the stored chunks and re-embeds every chunk
+        after an embedding model change. Does nothing when needs_migration is False. Callers must
+        keep other writes to the collection out while it runs (see ProjectManager.write_lock).
+        Returns {"lexical_index_rebuilt": bool, "chunks_reembedded": int}.
+        """
+        result = {"lexical_index_rebuilt": False, "chunks_reembedded": 0}
+        if not self.needs_migration:
+            return result
+        print(f"Migrating collection {self.collection_name}...")
+        with self.telemetry.span("kb.migrate", collection=self.collection_name) as migrate_span:
+            if len(self.lexical_index) != self.collection.count():
+                self._rebuild_lexical_index()
+                result["lexical_index_rebuilt"] = True
+            if self.manifest.model_changed:
+                result["chunks_reembedded"] = self._reembed_collection()
+            migrate_span.set(**result)
+        print(f"Migrated collection {self.collection_name}.")
+        return result
+
+    def _rebuild_lexical_index(self) -> None:
+        """
+        Rebuilds the BM25 index from the collection (e.g. for collections created before it existed).
+        """
+        print("Rebuilding lexical index from the collection...")
+        existing = self.collection.get(include=['documents', 'metadatas'])
+        with self._lexical_lock:
+            self.lexical_index.clear()
+            for chunk_id, document, metadata in zip(existing['ids'], existing['documents'], existing['metadatas']):
+                self.lexical_index.add(chunk_id, document or "", metadata or {})
+            self.lexical_index.save()
+        legacy_path = os.path.splitext(self.lexical_index.path)[0] + ".json"
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path) # Full-text JSON written by earlier versions
+
+    def _reembed_collection(self) -> int:
+        """
+        Re-encodes every stored chunk with the current embedding model, after the collection was
+        built with another model or backend (their vectors are not comparable). Ids, documents
+        and metadata are kept. Returns the number of chunks re-embedded.
+        """
+        print(f"Re-embedding the collection with {self.embedding_model.key}...")
+        existing = self.collection.get(include=['documents', 'metadatas'])
+        records = [(chunk_id, document or "", metadata or {})
+                   for chunk_id, document, metadata in zip(existing['ids'], existing['documents'], existing['metadatas'])]
+        stats = self._embed_and_write(iter(records))
+        self.manifest.mark_migrated()
+        self._save_ingest_state()
+        print(f"Re-embedded {stats['chunks_embedded']} chunks.")
+        return stats["chunks_embedded"]
+
+    def export_snapshot(self) -> Dict:
+        """
+        Everything needed to recreate the collection elsewhere: chunks with their embeddings, the
+        ingest manifest and the DOM indexes. The BM25 index is rebuilt from the chunks on import.
+        """
+        with self.telemetry.span("kb.export_snapshot") as export_span:
+            existing = self.collection.get(include=['documents', 'metadatas', 'embeddings'])
+            chunks = [
+                {"id": chunk_id, "document": document or "", "metadata": metadata or {},
+                 "embedding": [float(value) for value in embedding]}
+                for chunk_id, document, metadata, embedding in zip(
+                    existing['ids'], existing['documents'], existing['metadatas'], existing['embeddings'])
+            ]
+            export_span.set(chunks=len(chunks))
+        return {"embedding_model": self.embedding_model.key, "chunks": chunks,
+                "manifest": self.manifest.documents, "dom_index": self.dom_index.indexes}
+
+    def import_snapshot(self, snapshot: Dict, batch_size: int = 256) -> int:
+        """
+        Loads a snapshot from export_snapshot() into this collection and returns the number of
+        chunks written. Stored embeddings are reused when they come from the same model and
+        backend; otherwise the chunks are re-embedded.
+        """
+        records = [(chunk["id"], chunk["document"], chunk["metadata"]) for chunk in snapshot["chunks"]]
+        with self.telemetry.span("kb.import_snapshot", chunks=len(records)) as import_span:
+            reuse_embeddings = snapshot.get("embedding_model") == self.embedding_model.key
+            import_span.set(reembedded=not reuse_embeddings)
+            if reuse_embeddings:
+                for start in range(0, len(records), batch_size):
+                    self._upsert_chunks(records[start:start + batch_size],
+                                        [chunk["embedding"] for chunk in snapshot["chunks"][start:start + batch_size]])
+            else:
+                self._embed_and_write(iter(records), batch_size=min(batch_size, 64))
+            self.manifest.documents.update(snapshot.get("manifest", {}))
+            self.dom_index.indexes.update(snapshot.get("dom_index", {}))
+            self.dom_index.save()
+            self._save_ingest_state()
+        return len(records)
+
+    def _collection_changed(self) -> None:
+        with self._cache_lock:
+            self._collection_version += 1
+            self._query_result_cache.clear()
+
+    def _embed_and_write(self, chunk_records: Iterable[Tuple[str, str, Dict]], batch_size: int = 64,
+                         queue_size: int = 4, write_batches: int = 4) -> Dict:
+        """
+        Embeds (id, text, metadata) chunk records in batches and upserts them into the collection.
+
+        A producer thread pulls records from `chunk_records` (which may chunk lazily) and encodes
+        them batch by batch; the calling thread drains a bounded queue of encoded batches and writes
+        them to Chroma every `write_batches` batches (within the client's maximum batch size).
+        Encoding the next batches therefore overlaps with writing the previous ones, and at most
+        `queue_size` + `write_batches` encoded batches are held in memory, however many records
+        there are.
+        """
+        encoded_batches: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        done = object()
+        stop = threading.Event()
+        embed = self._get_embedding_function()
+
+        def embed_batch(batch: List[Tuple[str, str, Dict]]) -> List[List[float]]:
+            with self.telemetry.span("kb.embed_batch", chunks=len(batch)):
+                return embed([text for _, text, _ in batch], batch_size)
+
+        def produce():
+            try:
+                batch = []
+                for record in chunk_records:
+                    if stop.is_set():
+                        return
+                    batch.append(record)
+                    if len(batch) >= batch_size:
+                        encoded_batches.put((batch, embed_batch(batch)))
+                        batch = []
+                if batch:
+                    encoded_batches.put((batch, embed_batch(batch)))
+                encoded_batches.put(done)
+            except Exception as e:
+                encoded_batches.put(e)
+
+        producer = threading.Thread(target=run_in_context(produce), name="kb-embed-producer", daemon=True)
+        producer.start()
+
+        max_write_size = self.client.get_max_batch_size()
+        write_size = min(max_write_size, batch_size * max(1, write_batches))
+        pending_records: List[Tuple[str, str, Dict]] = []
+        pending_embeddings: List[List[float]] = []
+        stats = {"chunks_embedded": 0, "write_calls": 0}
+
+        def flush():
+            if not pending_records:
+                return
+            with self.telemetry.span("kb.write", chunks=len(pending_records)):
+                self._upsert_chunks(pending_records, pending_embeddings)
+            self.telemetry.increment("chunks_embedded_total", len(pending_records))
+            stats["write_calls"] += 1
+            stats["chunks_embedded"] += len(pending_records)
+            pending_records.clear()
+            pending_embeddings.clear()
+
+        try:
+            while True:
+                item = encoded_batches.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                records, embeddings = item
+                if len(pending_records) + len(records) > max_write_size:
+                    flush()
+                pending_records.extend(records)
+                pending_embeddings.extend(embeddings)
+                if len(pending_records) >= write_size:
+                    flush()
+            flush()
+        finally:
+            stop.set()
+            # Unblock the producer if it is waiting on a full queue after a failure.
+            while producer.is_alive():
+                try:
+                    encoded_batches.get_nowait()
+                except queue.Empty:
+                    producer.join(timeout=0.05)
+        return stats
+
+    def ingest_documents(self, contents: List[str], metadatas: List[Dict], batch_size: int = 64,
+                         queue_size: int = 4) -> Dict:
         """
-        Adds documents to the knowledge base after chunking. Embeddings are handled by ChromaDB.
+        Bulk, incremental ingestion of many documents at once.
+
+        Unchanged documents are skipped. The rest are chunked along their structure (Markdown and
+        text headings, JSON records, HTML forms and sections), each chunk carrying its
+        `structure_path` in its metadata. Chunks from every remaining document are pooled, so
+        embedding batches span document boundaries, and are written a few batches at a time while
+        the next ones are encoded. Chunks that disappeared from a document are deleted in a single call.
+        Returns ingestion statistics, including throughput in chunks per second.
+        """
+        stats = {
+            "documents": len(contents), "documents_skipped": 0, "documents_failed": 0,
+            "chunks_embedded": 0, "chunks_unchanged": 0, "chunks_deleted": 0,
+            "write_calls": 0, "seconds": 0.0, "chunks_per_second": 0.0, "batch_size": batch_size
+        }
+        if not self.collection or not self.embedding_model:
+            print("Cannot add documents: ChromaDB collection or embedding model not initialized.")
+            return stats
+
+        with self.telemetry.span("kb.ingest_documents", documents=len(contents)) as ingest_span:
+            start_time = time.perf_counter()
+            manifest_updates: Dict[str, Tuple[str, Dict[str, str]]] = {}
+            dom_index_updates: Dict[str, Dict] = {}
+            stale_ids: List[str] = []
+
+            def new_chunk_records() -> Iterator[Tuple[str, str, Dict]]:
+                for content, metadata in zip(contents, metadatas):
+                    source_document = metadata.get('source_document', 'unknown')
+                    try:
+                        # The chunker version is part of the hash, so new chunking rules re-chunk stored documents.
+                        doc_hash = content_hash(content, dict(metadata, chunker=CHUNKER_VERSION))
+                        unchanged = self.manifest.is_unchanged(source_document, doc_hash)
+                        if metadata.get("type") == "html" and (not unchanged or source_document not in self.dom_index.indexes):
+                            with self.telemetry.span("kb.dom_index", document=source_document):
+                                dom_index_updates[source_document] = build_dom_index(content)
+                        if unchanged:
+                            print(f"Skipping unchanged document {source_document}")
+                            stats["documents_skipped"] += 1
+                            continue
+
+                        # Split along the document's headings, records or forms (see chunkers.py)
+                        with self.telemetry.span("kb.chunk", document=source_document) as chunk_span:
+                            chunks = [(text, dict(metadata, **extra)) for text, extra in chunk_document(
+                                content, metadata, max_chars=self.chunk_size, overlap=self.chunk_overlap)]
+                            chunk_span.set(chunks=len(chunks))
+                        id_hash_pairs = self._chunk_ids(source_document, chunks)
+                        existing_ids = set(self._existing_chunk_ids(source_document))
+                        # Stored vectors from another embedding model are replaced, never reused.
+                        reusable_ids = set() if self.manifest.model_changed else existing_ids
+                    except Exception as e:
+                        print(f"Error adding document {source_document}: {e}")
+                        stats["documents_failed"] += 1
+                        continue
+
+                    stale_ids.extend(existing_ids - {chunk_id for chunk_id, _ in id_hash_pairs})
+                    manifest_updates[source_document] = (doc_hash, dict(id_hash_pairs))
+                    if not chunks:
+                        print(f"No chunks generated for {source_document}")
+                    for (chunk_content, chunk_metadata), (chunk_id, _) in zip(chunks, id_hash_pairs):
+                        if chunk_id in reusable_ids:
+                            stats["chunks_unchanged"] += 1
+                        else:
+                            yield chunk_id, chunk_content, chunk_metadata
+
+            try:
+                write_stats = self._embed_and_write(new_chunk_records(), batch_size=batch_size, queue_size=queue_size)
+                stats.update(write_stats)
+                if stale_ids:
+                    self._delete_chunks(stale_ids)
+                    stats["chunks_deleted"] = len(stale_ids)
+                for source_document, (doc_hash, chunk_hashes) in manifest_updates.items():
+                    self.manifest.update(source_document, doc_hash, chunk_hashes)
+                self._save_ingest_state()
+                for source_document, index in dom_index_updates.items():
+                    self.dom_index.update(source_document, index)
+            except Exception as e:
+                print(f"Error ingesting documents: {e}")
+
+            stats["seconds"] = time.perf_counter() - start_time
+            if stats["seconds"] > 0:
+                stats["chunks_per_second"] = stats["chunks_embedded"] / stats["seconds"]
+            print(f"Ingested {stats['documents']} documents: {stats['chunks_embedded']} chunks embedded "
+                  f"({stats['chunks_per_second']:.1f} chunks/s) in {stats['write_calls']} writes, "
+                  f"{stats['chunks_unchanged']} unchanged, {stats['chunks_deleted']} removed, "
+                  f"{stats['documents_skipped']} documents skipped")
+            ingest_span.set(**{key: stats[key] for key in ("documents_skipped", "documents_failed",
+                                                            "chunks_embedded", "chunks_unchanged",
+                                                            "chunks_deleted", "write_calls")})
+        return stats
+
+    def _split_pages(self, pages: Iterable[Tuple[int, str]]) -> Iterator[Tuple[str, int, int]]:
+        """
+        Incrementally chunks a stream of (page_number, text) pages, yielding
+        (chunk_text, first_page, last_page).
+
+        Only a window of roughly two chunks plus the current page is buffered. Every chunk but
+        the last one in the window is emitted; the last one is carried over to be re-split with
+        the next page, so chunk boundaries and overlap continue seamlessly across pages.
+        """
+        buffer = ""
+        page_starts: List[Tuple[int, int]] = [] # (offset in buffer, page number)
+
+        def page_at(offset: int) -> int:
+            page_number = page_starts[0][1]
+            for page_offset, number in page_starts:
+                if page_offset > offset:
+                    break
+                page_number = number
+            return page_number
+
+        def located(chunks: List[str]) -> List[Tuple[str, int]]:
+            search_from = 0
+            located_chunks = []
+            for chunk in chunks:
+                offset = buffer.find(chunk, search_from)
+                if offset == -1:
+                    offset = search_from
+                located_chunks.append((chunk, offset))
+                search_from = offset + 1
+            return located_chunks
+
+        for page_number, page_text in pages:
+            if not page_text:
+                continue
+            page_starts.append((len(buffer), page_number))
+            buffer += page_text
+            if len(buffer) < 2 * self.chunk_size:
+                continue
+            chunks = located(self.text_splitter.split_text(buffer))
+            if len(chunks) < 2:
+                continue
+            for chunk, offset in chunks[:-1]:
+                yield chunk, page_at(offset), page_at(offset + len(chunk) - 1)
+            carry_offset = chunks[-1][1]
+            carry_page = page_at(carry_offset)
+            buffer = buffer[carry_offset:]
+            page_starts = [(0, carry_page)] + [
+                (page_offset - carry_offset, number) for page_offset, number in page_starts if page_offset > carry_offset
+            ]
+
+        if buffer:
+            for chunk, offset in located(self.text_splitter.split_text(buffer)):
+                yield chunk, page_at(offset), page_at(offset + len(chunk) - 1)
+
+    def ingest_pages(self, pages: Iterable[Tuple[int, str]], metadata: Dict, doc_hash: str = None,
+                     batch_size: int = 64, queue_size: int = 4) -> Dict:
+        """
+        Streams a paged document (e.g. from parsers.iter_pdf_pages) into the knowledge base.
+
+        Pages are chunked incrementally and fed to the embedder in batches, so peak memory stays
+        flat regardless of document size. Each chunk records `page_start`/`page_end` in its
+        metadata. When `doc_hash` is given and matches the manifest the document is skipped
+        without reading any page; otherwise only new chunks are embedded and stale ones deleted.
         """
-        if not self.collection or not self.chroma_embedding_function_instance:
-            print("Cannot add documents: ChromaDB collection or its embedding function not initialized.")
-            return
+        source_document = metadata.get('source_document', 'unknown')
+        stats = {
+            "documents": 1, "documents_skipped": 0, "documents_failed": 0,
+            "chunks_embedded": 0, "chunks_unchanged": 0, "chunks_deleted": 0,
+            "write_calls": 0, "seconds": 0.0, "chunks_per_second": 0.0, "batch_size": batch_size
+        }
+        if not self.collection or not self.embedding_model:
+            print("Cannot add documents: ChromaDB collection or embedding model not initialized.")
+            return stats
+        if doc_hash is not None and self.manifest.is_unchanged(source_document, doc_hash):
+            print(f"Skipping unchanged document {source_document}")
+            stats["documents_skipped"] = 1
+            return stats
+
+        with self.telemetry.span("kb.ingest_pages", document=source_document) as ingest_span:
+            start_time = time.perf_counter()
+            existing_ids = set(self._existing_chunk_ids(source_document))
+            reusable_ids = set() if self.manifest.model_changed else existing_ids
+            chunk_hashes: Dict[str, str] = {}
+
+            def new_chunk_records() -> Iterator[Tuple[str, str, Dict]]:
+                seen: Dict[str, int] = {}
+                for chunk_text, page_start, page_end in self._split_pages(pages):
+                    chunk_metadata = dict(metadata, page_start=page_start, page_end=page_end)
+                    chunk_id, chunk_hash = self._chunk_id(source_document, chunk_text, chunk_metadata, seen)
+                    chunk_hashes[chunk_id] = chunk_hash
+                    if chunk_id in reusable_ids:
+                        stats["chunks_unchanged"] += 1
+                    else:
+                        yield chunk_id, chunk_text, chunk_metadata
 
-        for i, content in enumerate(contents):
             try:
-                # Create a Langchain Document for chunking
-                doc = Document(page_content=content, metadata=metadatas[i])
-                chunks = self.text_splitter.split_documents([doc])
-
-                # Prepare data for ChromaDB
-                ids = [f"{metadatas[i].get('source_document', 'unknown')}_{j}" for j in range(len(chunks))]
-                chunk_contents = [chunk.page_content for chunk in chunks]
-                chunk_metadatas = [chunk.metadata for chunk in chunks]
-
-                if chunk_contents:
-                    # ChromaDB's native embedding function handles embedding during add.
-                    self.collection.add(
-                        documents=chunk_contents,
-                        metadatas=chunk_metadatas,
-                        ids=ids
-                    )
-                    print(f"Added {len(chunks)} chunks from {metadatas[i].get('source_document', 'unknown')}")
-                else:
-                    print(f"No chunks generated for {metadatas[i].get('source_document', 'unknown')}")
+                stats.update(self._embed_and_write(new_chunk_records(), batch_size=batch_size, queue_size=queue_size))
+                stale_ids = list(existing_ids - set(chunk_hashes))
+                if stale_ids:
+                    self._delete_chunks(stale_ids)
+                    stats["chunks_deleted"] = len(stale_ids)
+                self.manifest.update(source_document, doc_hash, chunk_hashes)
+                self._save_ingest_state()
             except Exception as e:
-                print(f"Error adding document {metadatas[i].get('source_document', 'unknown')}: {e}")
+                print(f"Error adding document {source_document}: {e}")
+                stats["documents_failed"] = 1
+
+            stats["seconds"] = time.perf_counter() - start_time
+            if stats["seconds"] > 0:
+                stats["chunks_per_second"] = stats["chunks_embedded"] / stats["seconds"]
+            print(f"Streamed {source_document}: {stats['chunks_embedded']} chunks embedded "
+                  f"({stats['chunks_per_second']:.1f} chunks/s), {stats['chunks_unchanged']} unchanged, "
+                  f"{stats['chunks_deleted']} removed")
+            ingest_span.set(**{key: stats[key] for key in ("documents_failed", "chunks_embedded",
+                                                            "chunks_unchanged", "chunks_deleted", "write_calls")})
+        return stats
+
+    def ingest_pdf(self, source: Union[str, bytes], metadata: Dict, batch_size: int = 64) -> Dict:
+        """
+        Streams a PDF (path or bytes) into the knowledge base page by page; see ingest_pages.
+        """
+        if isinstance(source, (bytes, bytearray)):
+            doc_hash = content_hash(hashlib.sha256(source).hexdigest(), metadata)
+        else:
+            file_hasher = hashlib.sha256()
+            with open(source, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    file_hasher.update(block)
+            doc_hash = content_hash(file_hasher.hexdigest(), metadata)
+        return self.ingest_pages(iter_pdf_pages(source), metadata, doc_hash=doc_hash, batch_size=batch_size)
+
+    def add_documents(self, contents: List[str], metadatas: List[Dict]) -> None:
+        """
+        Adds documents to the knowledge base after chunking, embedding chunks with the shared model.
+        Ingestion is incremental; see ingest_documents.
+        """
+        self.ingest_documents(contents, metadatas)
+
+    def chunk_texts(self) -> List[Tuple[str, Dict]]:
+        """
+        (document, metadata) of every stored chunk.
+        """
+        stored = self.collection.get(include=['documents', 'metadatas'])
+        return [(document or "", metadata or {}) for document, metadata in zip(stored['documents'], stored['metadatas'])]
+
+    def element_digest(self, query_text: str, max_elements: int = 30, source_document: str = None) -> str:
+        """
+        Returns a compact selector digest of the HTML elements relevant to `query_text`, drawn from
+        the structural index built at ingestion. Empty when no HTML page has been indexed.
+        """
+        sections = []
+        with self.telemetry.span("kb.element_digest") as digest_span:
+            for source, index in self.dom_index.indexes.items():
+                if source_document is not None and source != source_document:
+                    continue
+                elements = select_relevant_elements(index, query_text, max_elements=max_elements)
+                if elements:
+                    sections.append(f"# {source}\n{format_element_digest(elements)}")
+            digest_span.set(pages=len(sections))
+        return "\n\n".join(sections)
+
+    def embed_query(self, query_text: str) -> List[float]:
+        """
+        Embeds a query, reusing the embedding of an identical earlier query when available.
+        """
+        with self._cache_lock:
+            cached = self._query_embedding_cache.get(query_text)
+            if cached is not None:
+                self._query_embedding_cache.move_to_end(query_text)
+                self._cache_stats["embedding_hits"] += 1
+                return cached
+            self._cache_stats["embedding_misses"] += 1
 
-    def query(self, query_text: str, n_results: int = 5, where: Dict = None) -> Tuple[List[str], List[Dict]]:
+        # Embed the query with the same encoder and pooling used for ingestion
+        with self.telemetry.span("kb.embed_query"):
+            if self.query_encoder is not None:
+                query_embedding = self.query_encoder(query_text)
+            else:
+                query_embedding = self._get_embedding_function()([query_text])[0]
+        with self._cache_lock:
+            self._query_embedding_cache[query_text] = query_embedding
+            while len(self._query_embedding_cache) > self.query_cache_size:
+                self._query_embedding_cache.popitem(last=False)
+        return query_embedding
+
+    def cache_stats(self) -> Dict:
+        """
+        Hit/miss counters and sizes of the query embedding and retrieval result caches.
+        """
+        with self._cache_lock:
+            stats = dict(self._cache_stats)
+            stats["embedding_cache_size"] = len(self._query_embedding_cache)
+            stats["result_cache_size"] = len(self._query_result_cache)
+            stats["collection_version"] = self._collection_version
+            return stats
+
+    def clear_query_cache(self) -> None:
+        with self._cache_lock:
+            self._query_embedding_cache.clear()
+            self._query_result_cache.clear()
+
+    def query(self, query_text: str, n_results: int = 5, where: Dict = None,
+              mode: str = "auto") -> Tuple[List[str], List[Dict]]:
         """
         Queries the knowledge base for relevant documents.
         """
+        records = self.query_records(query_text, n_results=n_results, where=where, mode=mode)
+        return [record["document"] for record in records], [record["metadata"] for record in records]
+
+    def _vector_records(self, query_text: str, n_results: int, where: Dict = None) -> List[Dict]:
+        query_embedding = self.embed_query(query_text)
+
+        query_params = {
+            "query_embeddings": [query_embedding],
+            "n_results": n_results,
+            "include": ['documents', 'metadatas', 'distances', 'embeddings']
+        }
+        if where is not None:
+            query_params["where"] = where
+
+        with self.telemetry.span("kb.vector_search", n_results=n_results):
+            results = self.collection.query(**query_params)
+        return [
+            {"id": chunk_id, "document": document, "metadata": metadata or {}, "distance": distance,
+             "embedding": [float(value) for value in embedding]}
+            for chunk_id, document, metadata, distance, embedding in zip(
+                results['ids'][0], results['documents'][0], results['metadatas'][0],
+                results['distances'][0], results['embeddings'][0]
+            )
+        ]
+
+    def _lexical_records(self, query_text: str, n_results: int, where: Dict = None) -> List[Dict]:
+        with self.telemetry.span("kb.lexical_search", n_results=n_results), self._lexical_lock:
+            hits = self.lexical_index.search(query_text, n_results=n_results, where=where)
+            entries = [(chunk_id, score, self.lexical_index.get(chunk_id)) for chunk_id, score in hits]
+        if not entries:
+            return []
+        # The index keeps no text; it comes from Chroma in one lookup.
+        fetched = self.collection.get(ids=[chunk_id for chunk_id, _, _ in entries], include=['documents'])
+        documents = dict(zip(fetched['ids'], fetched['documents']))
+        return [
+            {"id": chunk_id, "document": documents.get(chunk_id) or "", "metadata": dict(entry["metadata"]),
+             "distance": None, "embedding": None, "score": score}
+            for chunk_id, score, entry in entries
+        ]
+
+    def _hybrid_records(self, query_text: str, n_results: int, where: Dict = None) -> List[Dict]:
+        """
+        Fuses vector and BM25 rankings with reciprocal rank fusion.
+        """
+        vector_records = self._vector_records(query_text, n_results, where)
+        lexical_records = self._lexical_records(query_text, n_results, where)
+        if not lexical_records:
+            return vector_records
+        by_id = {record["id"]: record for record in lexical_records}
+        by_id.update({record["id"]: record for record in vector_records})
+        fused = reciprocal_rank_fusion([
+            [record["id"] for record in vector_records],
+            [record["id"] for record in lexical_records],
+        ])[:n_results]
+        records = [dict(by_id[chunk_id], score=score) for chunk_id, score in fused]
+
+        # Lexical-only hits lack embeddings; fetch them so downstream MMR can use every record.
+        missing_ids = [record["id"] for record in records if record["embedding"] is None]
+        if missing_ids:
+            fetched = self.collection.get(ids=missing_ids, include=['embeddings'])
+            embeddings = {chunk_id: [float(value) for value in embedding]
+                          for chunk_id, embedding in zip(fetched['ids'], fetched['embeddings'])}
+            for record in records:
+                if record["embedding"] is None:
+                    record["embedding"] = embeddings.get(record["id"])
+        return records
+
+    def query_records(self, query_text: str, n_results: int = 5, where: Dict = None,
+                      mode: str = "auto") -> List[Dict]:
+        """
+        Queries the knowledge base and returns one record per hit with its `id`, `document`,
+        `metadata`, `distance` and `embedding` (treat embeddings as read-only).
+
+        `mode` selects the retriever: "vector" (dense MiniLM search), "lexical" (BM25 only, no
+        transformer forward pass), "hybrid" (both, fused with reciprocal rank fusion) or "auto"
+        (lexical for identifier-like queries such as `SAVE15` or `#pay_now_btn` when they match,
+        hybrid otherwise). Results are memoized per (query, n_results, where, mode) until the
+        collection next changes. Any other mode raises ValueError.
+        """
+        if mode not in QUERY_MODES:
+            raise ValueError(f"Unknown query mode {mode!r}; expected one of {', '.join(QUERY_MODES)}.")
         if not self.collection:
             print("Cannot query: ChromaDB collection not initialized.")
-            return [], []
+            return []
 
-        if not self.collection or not self.tokenizer or not self.model:
+        if not self.collection or not self.embedding_model:
             print("Cannot query: ChromaDB collection or internal embedding model not initialized.")
-            return [], []
+            return []
 
-        try:
-            # Generate embedding for the query text using the internal model
-            query_embedding = self._get_embedding_function()([query_text])[0]
+        with self.telemetry.span("kb.query", mode=mode, n_results=n_results) as query_span:
+            result_key = (query_text, n_results, json.dumps(where, sort_keys=True, default=str), mode)
+            with self._cache_lock:
+                cached = self._query_result_cache.get(result_key)
+                if cached is not None and cached[0] == self._collection_version:
+                    self._query_result_cache.move_to_end(result_key)
+                    self._cache_stats["result_hits"] += 1
+                    query_span.set(cache_hit=True, results=len(cached[1]))
+                    self.telemetry.increment("query_cache_total", result="hit")
+                    return [dict(record, metadata=dict(record["metadata"])) for record in cached[1]]
+                self._cache_stats["result_misses"] += 1
+                version = self._collection_version
+            query_span.set(cache_hit=False)
+            self.telemetry.increment("query_cache_total", result="miss")
 
-            query_params = {
-                "query_embeddings": [query_embedding],
-                "n_results": n_results,
-                "include": ['documents', 'metadatas']
-            }
-            if where is not None:
-                query_params["where"] = where
+            try:
+                records = []
+                if mode in ("lexical", "auto") and (mode == "lexical" or is_identifier_query(query_text)):
+                    records = self._lexical_records(query_text, n_results, where)
+                if mode == "vector":
+                    records = self._vector_records(query_text, n_results, where)
+                elif mode == "hybrid" or (mode == "auto" and not records):
+                    records = self._hybrid_records(query_text, n_results, where)
+            except Exception as e:
+                print(f"Error querying ChromaDB: {e}")
+                return []
+            query_span.set(results=len(records))
 
-            results = self.collection.query(**query_params)
-            return results['documents'][0], results['metadatas'][0]
-        except Exception as e:
-            print(f"Error querying ChromaDB: {e}")
-            return [], []
+            with self._cache_lock:
+                # Skip caching if an ingestion landed while this query was running.
+                if version == self._collection_version:
+                    self._query_result_cache[result_key] = (version, [dict(record, metadata=dict(record["metadata"])) for record in records])
+                    while len(self._query_result_cache) > self.query_cache_size:
+                        self._query_result_cache.popitem(last=False)
+        return records
@@ -0,0 +1,216 @@
+import os
+import re
+import json
+import math
+from collections import Counter
+from typing import List, Dict, Tuple, Optional
+
+# Identifiers such as SAVE15, #pay_now_btn or /api/apply_coupon are kept whole and also split
+# into their parts, so both "pay_now_btn" and "pay" match.
+_TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_#./@-]+")
+_PART_PATTERN = re.compile(r"[A-Za-z0-9]+")
+_IDENTIFIER_PATTERN = re.compile(r"^(?=.*(?:[0-9_#/@]|[a-z][A-Z]))[A-Za-z0-9_#./@-]+$")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for raw in _TOKEN_PATTERN.findall(text):
+        whole = raw.strip("#./@-").lower()
+        if not whole:
+            continue
+        tokens.append(whole)
+        parts = [part.lower() for part in _PART_PATTERN.findall(raw)]
+        if len(parts) > 1 or (parts and parts[0] != whole):
+            tokens.extend(parts)
+    return tokens
+
+
+def is_identifier_query(query_text: str) -> bool:
+    """
+    True when every term of the query looks like an exact identifier (codes, ids, paths, rule
+    numbers), i.e. contains a digit, underscore, '#', '/', '@' or camelCase.
+    """
+    terms = query_text.split()
+    return 0 < len(terms) <= 3 and all(_IDENTIFIER_PATTERN.match(term) for term in terms)
+
+
+def matches_where(metadata: Dict, where: Optional[Dict]) -> bool:
+    """
+    Evaluates a Chroma-style metadata filter ($eq, $ne, $in, $nin, $gt, $gte, $lt, $lte, $and, $or).
+    """
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+            continue
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for operator, operand in condition.items():
+            if operator == "$eq" and value != operand:
+                return False
+            if operator == "$ne" and value == operand:
+                return False
+            if operator == "$in" and value not in operand:
+                return False
+            if operator == "$nin" and value in operand:
+                return False
+            if operator in ("$gt", "$gte", "$lt", "$lte"):
+                if value is None:
+                    return False
+                if operator == "$gt" and not value > operand:
+                    return False
+                if operator == "$gte" and not value >= operand:
+                    return False
+                if operator == "$lt" and not value < operand:
+                    return False
+                if operator == "$lte" and not value <= operand:
+                    return False
+    return True
+
+
+class BM25Index:
+    """
+    In-process inverted index with Okapi BM25 scoring, updated incrementally as chunks are
+    upserted or deleted.
+
+    Only what scoring and filtering need is kept: per chunk its term frequencies, length and
+    metadata (the text itself stays in Chroma). It is persisted next to the Chroma collection as
+    an append-only JSON lines log: save() appends just the chunks added or removed since the
+    last save, and load() replays the log without re-tokenizing anything. The log is rewritten
+    compactly once superseded lines outnumber the live chunks.
+    """
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.documents: Dict[str, Dict] = {} # id -> {"terms": {term: frequency}, "length", "metadata"}
+        self.postings: Dict[str, Dict[str, int]] = {} # term -> {id: term frequency}
+        self.total_length = 0
+        self._changes: Dict[str, Optional[Dict]] = {} # id -> entry (None when removed) since the last save
+        self._log_lines = 0 # Lines in the file at `path`
+        self._rewrite = False # Set by clear(): the next save() rewrites the file
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def _insert(self, chunk_id: str, entry: Dict) -> None:
+        self._delete(chunk_id)
+        for term, count in entry["terms"].items():
+            self.postings.setdefault(term, {})[chunk_id] = count
+        self.documents[chunk_id] = entry
+        self.total_length += entry["length"]
+
+    def _delete(self, chunk_id: str) -> Optional[Dict]:
+        entry = self.documents.pop(chunk_id, None)
+        if entry is None:
+            return None
+        self.total_length -= entry["length"]
+        for term in entry["terms"]:
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self.postings[term]
+        return entry
+
+    def add(self, chunk_id: str, document: str, metadata: Dict) -> None:
+        term_counts = Counter(tokenize(document))
+        entry = {"terms": dict(term_counts), "length": sum(term_counts.values()), "metadata": metadata}
+        self._insert(chunk_id, entry)
+        self._changes[chunk_id] = entry
+
+    def remove(self, chunk_id: str) -> None:
+        if self._delete(chunk_id) is not None:
+            self._changes[chunk_id] = None
+
+    def clear(self) -> None:
+        self.documents, self.postings, self.total_length = {}, {}, 0
+        self._changes = {}
+        self._rewrite = True
+
+    def search(self, query_text: str, n_results: int = 5, where: Optional[Dict] = None) -> List[Tuple[str, float]]:
+        """
+        Returns up to `n_results` (chunk id, BM25 score) pairs, best first.
+        """
+        if not self.documents:
+            return []
+        average_length = self.total_length / len(self.documents) or 1.0
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query_text)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.documents) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, frequency in postings.items():
+                length = self.documents[chunk_id]["length"]
+                denominator = frequency + self.k1 * (1 - self.b + self.b * length / average_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * frequency * (self.k1 + 1) / denominator
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        if where:
+            ranked = [item for item in ranked if matches_where(self.documents[item[0]]["metadata"], where)]
+        return ranked[:n_results]
+
+    def get(self, chunk_id: str) -> Optional[Dict]:
+        return self.documents.get(chunk_id)
+
+    def load(self) -> None:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    self._log_lines += 1
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A save interrupted mid-line; the rest still applies, and the next save
+                        # rewrites the file rather than appending to the broken line.
+                        self._rewrite = True
+                        continue
+                    if record.get("removed"):
+                        self._delete(record["id"])
+                    else:
+                        self._insert(record["id"], {"terms": record["terms"], "length": record["length"],
+                                                    "metadata": record["metadata"]})
+        except Exception as e:
+            print(f"Error reading lexical index {self.path}: {e}")
+
+    @staticmethod
+    def _log_line(chunk_id: str, entry: Optional[Dict]) -> str:
+        record = {"id": chunk_id, "removed": True} if entry is None else dict(entry, id=chunk_id)
+        return json.dumps(record) + "\n"
+
+    def save(self) -> None:
+        if not self.path or not (self._changes or self._rewrite):
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if self._rewrite or self._log_lines + len(self._changes) > 2 * len(self.documents) + 100:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.writelines(self._log_line(chunk_id, entry) for chunk_id, entry in self.documents.items())
+            os.replace(tmp_path, self.path)
+            self._log_lines = len(self.documents)
+            self._rewrite = False
+        else:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.writelines(self._log_line(chunk_id, entry) for chunk_id, entry in self._changes.items())
+            self._log_lines += len(self._changes)
+        self._changes = {}
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuses several ranked id lists: score(id) = sum over lists of 1 / (k + rank).
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
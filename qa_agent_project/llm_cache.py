@@ -0,0 +1,187 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Callable
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalises a prompt for cache keying: trims every line and collapses runs of whitespace,
+    so indentation changes in the prompt templates do not invalidate the cache.
+    """
+    lines = [re.sub(r"\s+", " ", line).strip() for line in prompt.strip().splitlines()]
+    return "\n".join(line for line in lines if line)
+
+
+class ResponseCache:
+    """
+    Two-level cache of LLM responses keyed by model name plus a normalised prompt hash.
+
+    An in-memory LRU sits in front of an on-disk SQLite store. Entries expire after
+    `ttl_seconds` (None disables expiry) and the store is trimmed to `max_disk_entries`
+    by least recent access. Pass `path=None` for a memory-only cache.
+    """
+    def __init__(self, path: Optional[str] = "./llm_cache.sqlite3", max_memory_entries: int = 256,
+                 max_disk_entries: int = 10000, ttl_seconds: Optional[float] = 7 * 24 * 3600):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict() # key -> (response, created_at)
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0, "expired": 0}
+
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT NOT NULL, response TEXT NOT NULL, "
+                "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)")
+            self._db.commit()
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def _remember(self, key: str, response: str, created_at: float) -> None:
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def get(self, model_name: str, prompt: str) -> Optional[str]:
+        """
+        Returns the cached response for this model and prompt, or None on a miss.
+        """
+        key = self.make_key(model_name, prompt)
+        now = time.time()
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                if not self._is_expired(cached[1], now):
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return cached[0]
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    response, created_at = row
+                    if self._is_expired(created_at, now):
+                        self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                        self._db.commit()
+                        self._stats["expired"] += 1
+                    else:
+                        self._db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        self._remember(key, response, created_at)
+                        self._stats["disk_hits"] += 1
+                        return response
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, model_name: str, prompt: str, response: str) -> None:
+        """
+        Stores a response, evicting the least recently used disk entries beyond `max_disk_entries`.
+        """
+        key = self.make_key(model_name, prompt)
+        now = time.time()
+        with self._lock:
+            self._remember(key, response, now)
+            self._stats["writes"] += 1
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, model_name, response, now, now)
+            )
+            (count,) = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()
+            overflow = count - self.max_disk_entries
+            if overflow > 0:
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                    (overflow,)
+                )
+                self._stats["evictions"] += overflow
+            self._db.commit()
+
+    def get_or_generate(self, model_name: str, prompt: str, generate: Callable[[], str]) -> str:
+        """
+        Returns the cached response, or calls `generate()` and caches its result.
+        """
+        response = self.get(model_name, prompt)
+        if response is None:
+            response = generate()
+            self.set(model_name, prompt, response)
+        return response
+
+    def prune_expired(self) -> int:
+        """
+        Deletes expired entries from both levels. Returns the number of disk rows removed.
+        """
+        if self.ttl_seconds is None:
+            return 0
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            for key in [key for key, (_, created_at) in self._memory.items() if created_at < cutoff]:
+                del self._memory[key]
+            if self._db is None:
+                return 0
+            removed = self._db.execute("DELETE FROM responses WHERE created_at < ?", (cutoff,)).rowcount
+            self._db.commit()
+            self._stats["expired"] += removed
+            return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self) -> Dict:
+        """
+        Hit/miss counters plus current sizes of both cache levels.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_entries"] = (
+                self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] if self._db is not None else 0
+            )
+            return stats
+
+
+_default_cache: Optional[ResponseCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_response_cache() -> ResponseCache:
+    """
+    Process-wide cache shared by TestCaseAgent and SeleniumAgent. The SQLite file location can be
+    set with the QA_AGENT_LLM_CACHE environment variable.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache(os.getenv("QA_AGENT_LLM_CACHE", "./llm_cache.sqlite3"))
+        return _default_cache
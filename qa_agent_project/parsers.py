@@ -1,8 +1,17 @@
+import io
+import os
 import json
-from typing import List, Dict, Union
+import time
+import atexit
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Union, Iterable, Iterator, Optional, BinaryIO, Tuple
 from unstructured.partition.auto import partition
 import fitz # PyMuPDF
+from instrumentation import get_telemetry, traced
 
+@traced("parsers.parse_document")
 def parse_document(file_path: str, file_type: str) -> str:
     """
     Parses various document types to extract text content.
@@ -10,22 +19,34 @@ def parse_document(file_path: str, file_type: str) -> str:
     elements = partition(filename=file_path)
     return "\n\n".join([str(el) for el in elements])
 
-def parse_pdf(file_path: str) -> str:
+def iter_pdf_pages(source: Union[str, bytes]) -> Iterator[Tuple[int, str]]:
     """
-    Parses a PDF file to extract text content using PyMuPDF.
+    Lazily yields (page_number, text) for each page of a PDF given as a path or bytes.
+    Page numbers are 1-based. Only one page's text is held in memory at a time.
     """
-    text_content = ""
+    if isinstance(source, (bytes, bytearray)):
+        document = fitz.open(stream=source, filetype="pdf")
+    else:
+        document = fitz.open(source)
     try:
-        document = fitz.open(file_path)
         for page_num in range(document.page_count):
             page = document.load_page(page_num)
-            text_content += page.get_text()
+            yield page_num + 1, page.get_text()
+    finally:
         document.close()
+
+@traced("parsers.parse_pdf")
+def parse_pdf(file_path: str) -> str:
+    """
+    Parses a PDF file to extract text content using PyMuPDF.
+    """
+    try:
+        return "".join(text for _, text in iter_pdf_pages(file_path))
     except Exception as e:
         print(f"Error parsing PDF {file_path}: {e}")
         return ""
-    return text_content
 
+@traced("parsers.parse_json")
 def parse_json(file_path: str) -> Union[Dict, List, None]:
     """
     Parses a JSON file.
@@ -37,6 +58,7 @@ def parse_json(file_path: str) -> Union[Dict, List, None]:
         print(f"Error parsing JSON {file_path}: {e}")
         return None
 
+@traced("parsers.parse_html")
 def parse_html(file_path: str) -> str:
     """
     Reads the raw content of an HTML file.
@@ -47,3 +69,194 @@ def parse_html(file_path: str) -> str:
     except Exception as e:
         print(f"Error parsing HTML {file_path}: {e}")
         return ""
+
+
+def parse_document_bytes(data: bytes, file_name: str) -> str:
+    """
+    Parses an in-memory document of another type (DOCX, RTF, ...) with unstructured, using the file
+    name as a type hint.
+    """
+    elements = partition(file=io.BytesIO(data), metadata_filename=file_name)
+    return "\n\n".join([str(el) for el in elements])
+
+def parse_pdf_bytes(data: bytes) -> str:
+    """
+    Extracts the text of an in-memory PDF using PyMuPDF.
+    """
+    return "".join(text for _, text in iter_pdf_pages(data))
+
+def parse_json_bytes(data: bytes) -> Union[Dict, List]:
+    """
+    Parses in-memory JSON.
+    """
+    return json.loads(data.decode('utf-8'))
+
+def parse_text_bytes(data: bytes) -> str:
+    """
+    Decodes an in-memory Markdown or plain-text file as is, so the chunker sees its headings.
+    """
+    return data.decode('utf-8')
+
+def parse_html_bytes(data: bytes) -> str:
+    """
+    Decodes the raw content of an in-memory HTML file.
+    """
+    return data.decode('utf-8')
+
+def _file_kind(file_name: str, file_type: Optional[str]) -> str:
+    extension = os.path.splitext(file_name)[1].lower()
+    if file_type == "application/pdf" or extension == ".pdf":
+        return "pdf"
+    if file_type == "application/json" or extension == ".json":
+        return "json"
+    if file_type == "text/html" or extension in (".html", ".htm"):
+        return "html"
+    if file_type == "text/markdown" or extension in (".md", ".markdown"):
+        return "markdown"
+    if file_type == "text/plain" or extension == ".txt":
+        return "text"
+    return "document"
+
+def parse_upload(file_name: str, data: Union[bytes, BinaryIO], file_type: Optional[str] = None) -> Dict:
+    """
+    Parses one uploaded file from bytes or a file-like object, without touching the filesystem.
+
+    Returns a dict with the text `content` ready for the knowledge base, its `metadata`, the
+    parse time in `seconds` and an `error` message (None on success). Exceptions never escape,
+    so a single bad file cannot break a batch.
+    """
+    started_at = time.time()
+    start_time = time.perf_counter()
+    result = {"name": file_name, "kind": _file_kind(file_name, file_type), "content": "",
+              "metadata": {"source_document": file_name}, "error": None, "started_at": started_at, "seconds": 0.0}
+    try:
+        if not isinstance(data, (bytes, bytearray)):
+            data = data.read()
+        kind = result["kind"]
+        if kind == "pdf":
+            result["content"] = parse_pdf_bytes(data)
+        elif kind == "json":
+            # Parsed only to validate it; the chunker splits the source text by object path.
+            json_data = parse_json_bytes(data)
+            result["content"] = data.decode('utf-8') if json_data else ""
+            result["metadata"]["type"] = "json"
+        elif kind == "html":
+            result["content"] = parse_html_bytes(data)
+            result["metadata"]["type"] = "html"
+        elif kind in ("markdown", "text"):
+            result["content"] = parse_text_bytes(data)
+            result["metadata"]["type"] = kind
+        else:
+            result["content"] = parse_document_bytes(data, file_name)
+    except Exception as e:
+        print(f"Error parsing {file_name}: {e}")
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - start_time
+    return result
+
+def _upload_fields(upload) -> tuple:
+    """
+    Normalises an upload into a picklable (name, bytes, mime type) tuple. Accepts such tuples
+    directly or objects exposing `name`, `getvalue()` and optionally `type` (e.g. Streamlit uploads).
+    """
+    if isinstance(upload, tuple):
+        file_name, data = upload[0], upload[1]
+        file_type = upload[2] if len(upload) > 2 else None
+    else:
+        file_name, data, file_type = upload.name, upload.getvalue(), getattr(upload, "type", None)
+    if not isinstance(data, (bytes, bytearray)):
+        data = data.read()
+    return file_name, bytes(data), file_type
+
+def _record_parse(result: Dict) -> Dict:
+    # Workers run in other processes, so their timings are recorded here in the parent.
+    telemetry = get_telemetry()
+    telemetry.record_span("parsers.parse_upload", result["seconds"], start=result.get("started_at"),
+                          file=result["name"], kind=result.get("kind"), chars=len(result["content"]),
+                          error=result["error"])
+    telemetry.increment("documents_parsed_total", kind=result.get("kind"), status="error" if result["error"] else "ok")
+    return result
+
+def _failed_parse(job: Tuple, error: Exception) -> Dict:
+    file_name, _, file_type = job
+    print(f"Error parsing {file_name}: {error}")
+    return {"name": file_name, "kind": _file_kind(file_name, file_type), "content": "",
+            "metadata": {"source_document": file_name}, "error": str(error) or type(error).__name__,
+            "started_at": None, "seconds": 0.0}
+
+# One process pool for every parse_uploads call, so worker start-up is paid once per process.
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+def _shared_executor(max_workers: int) -> ProcessPoolExecutor:
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != max_workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False) # Work already submitted to it still finishes
+            _executor = ProcessPoolExecutor(max_workers=max_workers)
+            _executor_workers = max_workers
+        return _executor
+
+def _discard_executor(executor: ProcessPoolExecutor) -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+@atexit.register
+def _shutdown_executor() -> None:
+    with _executor_lock:
+        executor = _executor
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+def _parse_isolated(job: Tuple) -> Dict:
+    # A process of its own, so a crash fails only this file.
+    try:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            return executor.submit(parse_upload, *job).result()
+    except Exception as e:
+        return _failed_parse(job, e)
+
+def parse_uploads(uploads: Iterable, max_workers: Optional[int] = None) -> Iterator[Dict]:
+    """
+    Parses many uploads in parallel on a shared process pool sized to the machine, yielding each
+    parse_upload result as soon as it finishes (not in submission order).
+
+    When a worker process dies (e.g. a crash inside a native parser), the pool breaks and every
+    file it had not finished fails with it. Those files are parsed again one by one, each in a
+    fresh process, so only the file that crashes is reported as an error; the pool is replaced
+    for the next call.
+    """
+    jobs = [_upload_fields(upload) for upload in uploads]
+    if not jobs:
+        return
+    max_workers = max_workers or os.cpu_count() or 1
+    if min(max_workers, len(jobs)) == 1:
+        # Not worth a process round trip for a single worker.
+        for job in jobs:
+            yield _record_parse(parse_upload(*job))
+        return
+
+    executor = _shared_executor(max_workers)
+    unfinished: List[Tuple] = []
+    futures = {}
+    for job in jobs:
+        try:
+            futures[executor.submit(parse_upload, *job)] = job
+        except BrokenProcessPool:
+            unfinished.append(job)
+    for future in as_completed(futures):
+        try:
+            yield _record_parse(future.result())
+        except BrokenProcessPool:
+            unfinished.append(futures[future])
+        except Exception as e:
+            yield _record_parse(_failed_parse(futures[future], e))
+    if unfinished:
+        _discard_executor(executor)
+        for job in unfinished:
+            yield _record_parse(_parse_isolated(job))
@@ -0,0 +1,377 @@
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Callable, Iterator
+import chromadb
+from knowledge_base import KnowledgeBase
+from embeddings import get_embedding_model, DEFAULT_EMBEDDING_MODEL
+from instrumentation import get_telemetry
+
+DEFAULT_PROJECT = "default"
+# The default project keeps the collection used before projects existed, so old data stays visible.
+DEFAULT_PROJECT_COLLECTION = "qa_agent_knowledge_base"
+# Chroma collection names are 3-63 characters; "project_" takes 8 of them.
+PROJECT_NAME_PATTERN = re.compile(r"^[A-Za-z0-9](?:[A-Za-z0-9_-]{0,53}[A-Za-z0-9])?$")
+# Snapshots are addressed by plain file name inside the snapshot directory, never by path.
+SNAPSHOT_NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,200}\.json$")
+SNAPSHOT_FORMAT = 1
+
+
+class ProjectError(Exception):
+    """
+    Raised for invalid project names and other project management errors.
+    """
+
+
+class ProjectNotFoundError(ProjectError):
+    """
+    Raised when a project (or snapshot) that does not exist is requested without creating it.
+    """
+
+
+class ProjectManager:
+    """
+    One knowledge base per project, each in its own Chroma collection with its own manifest,
+    BM25 and DOM index files, all under `persist_directory` and sharing one Chroma client and
+    embedding model.
+
+    Projects are opened lazily on first use and kept in an LRU of at most `max_open_projects`
+    KnowledgeBase objects; the least recently used one is dropped from memory (its data stays on
+    disk) when another has to be opened. Projects in use (see use()) are pinned and never
+    dropped, so there is only ever one KnowledgeBase, with one manifest, BM25 index, DOM index and
+    query cache, per project; the LRU may exceed its size while every open project is pinned.
+    Project metadata lives in `projects.json`.
+    """
+    def __init__(self, persist_directory: str = "./chroma_db", max_open_projects: int = 8,
+                 embedding_model_name: str = DEFAULT_EMBEDDING_MODEL, embedding_backend: Optional[str] = None,
+                 query_encoder: Optional[Callable[[str], List[float]]] = None):
+        self.persist_directory = persist_directory
+        self.max_open_projects = max(1, max_open_projects)
+        self.embedding_model_name = embedding_model_name
+        self.embedding_backend = embedding_backend
+        # Registry-shared, so every project's KnowledgeBase uses this same encoder.
+        self.embedding_model = get_embedding_model(embedding_model_name, embedding_backend)
+        # Assigned to KnowledgeBase.query_encoder of every project opened from now on.
+        self.query_encoder = query_encoder
+        self.client = chromadb.PersistentClient(path=persist_directory)
+        self.telemetry = get_telemetry()
+        self.metadata_path = os.path.join(persist_directory, "projects.json")
+        self._lock = threading.Lock()
+        self._open_locks: Dict[str, threading.Lock] = {}
+        self._write_locks: Dict[str, threading.Lock] = {}
+        self._pins: Dict[str, int] = {}
+        self._open: "OrderedDict[str, KnowledgeBase]" = OrderedDict()
+        self._stats = {"hits": 0, "opened": 0, "evicted": 0}
+        self._projects: Dict[str, Dict] = self._load_metadata()
+        if DEFAULT_PROJECT not in self._projects:
+            self._projects[DEFAULT_PROJECT] = self._new_metadata(DEFAULT_PROJECT, "")
+            self._save_metadata()
+
+    @staticmethod
+    def collection_name(name: str) -> str:
+        return DEFAULT_PROJECT_COLLECTION if name == DEFAULT_PROJECT else f"project_{name}"
+
+    @staticmethod
+    def validate_name(name: str) -> str:
+        if not isinstance(name, str) or not PROJECT_NAME_PATTERN.match(name):
+            raise ProjectError(
+                f"Invalid project name {name!r}: use 1-55 letters, digits, '_' or '-', "
+                "starting and ending with a letter or digit."
+            )
+        return name
+
+    def _new_metadata(self, name: str, description: str) -> Dict:
+        return {"collection": self.collection_name(name), "description": description,
+                "created_at": time.time(), "last_opened": None}
+
+    def _load_metadata(self) -> Dict[str, Dict]:
+        if not os.path.exists(self.metadata_path):
+            return {}
+        try:
+            with open(self.metadata_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error reading project metadata {self.metadata_path}: {e}")
+            return {}
+
+    def _save_metadata(self) -> None:
+        # Callers hold self._lock (or are the constructor).
+        os.makedirs(self.persist_directory, exist_ok=True)
+        tmp_path = f"{self.metadata_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._projects, f, indent=2)
+        os.replace(tmp_path, self.metadata_path)
+
+    def create(self, name: str, description: str = "") -> Dict:
+        """
+        Registers a project (a no-op if it already exists) and returns its metadata.
+        """
+        self.validate_name(name)
+        with self._lock:
+            if name not in self._projects:
+                self._projects[name] = self._new_metadata(name, description)
+                self._save_metadata()
+            return dict(self._projects[name], name=name)
+
+    def exists(self, name: str) -> bool:
+        with self._lock:
+            return name in self._projects
+
+    def write_lock(self, name: str) -> threading.Lock:
+        """
+        The lock that serialises writes to one project: ingestion, restore and drop. Writes to
+        other projects do not wait for it. Take it before use(), as restore() and drop() do.
+        """
+        self.validate_name(name)
+        with self._lock:
+            return self._write_locks.setdefault(name, threading.Lock())
+
+    def get(self, name: str, create: bool = False) -> KnowledgeBase:
+        """
+        Returns the project's KnowledgeBase, opening it if needed. Unknown projects raise
+        ProjectNotFoundError unless `create` is set. The project is not pinned, so it may be closed
+        as soon as others are opened; wrap work on it in use() instead.
+        """
+        return self._open_project(name, create, pin=False)
+
+    @contextmanager
+    def use(self, name: str, create: bool = False) -> Iterator[KnowledgeBase]:
+        """
+        Like get(), but pins the project until the block exits, so it is not closed (and later
+        reopened as a second instance) while the block works on it.
+        """
+        knowledge_base = self._open_project(name, create, pin=True)
+        try:
+            yield knowledge_base
+        finally:
+            with self._lock:
+                self._pins[name] -= 1
+                if not self._pins[name]:
+                    del self._pins[name]
+                self._evict_unused()
+
+    def _open_project(self, name: str, create: bool, pin: bool) -> KnowledgeBase:
+        self.validate_name(name)
+        with self._lock:
+            knowledge_base = self._open.get(name)
+            if knowledge_base is not None:
+                self._open.move_to_end(name)
+                self._stats["hits"] += 1
+                if pin:
+                    self._pins[name] = self._pins.get(name, 0) + 1
+                return knowledge_base
+            if name not in self._projects and not create:
+                raise ProjectNotFoundError(f"Project {name!r} does not exist.")
+            open_lock = self._open_locks.setdefault(name, threading.Lock())
+
+        # Opening reads the project's state files (BM25 log, manifest, DOM index), so only requests
+        # for the same project wait for it.
+        with open_lock:
+            with self._lock:
+                knowledge_base = self._open.get(name)
+                if knowledge_base is not None:
+                    self._open.move_to_end(name)
+                    if pin:
+                        self._pins[name] = self._pins.get(name, 0) + 1
+                    return knowledge_base
+            if create:
+                self.create(name)
+            with self.telemetry.span("projects.open", project=name):
+                knowledge_base = KnowledgeBase(
+                    persist_directory=self.persist_directory, embedding_model_name=self.embedding_model_name,
+                    collection_name=self.collection_name(name), embedding_backend=self.embedding_backend,
+                    client=self.client
+                )
+            knowledge_base.query_encoder = self.query_encoder
+            with self._lock:
+                self._open[name] = knowledge_base
+                if pin:
+                    self._pins[name] = self._pins.get(name, 0) + 1
+                self._stats["opened"] += 1
+                if name in self._projects:
+                    self._projects[name]["last_opened"] = time.time()
+                    self._save_metadata()
+                self._evict_unused(keep=name)
+            return knowledge_base
+
+    def _evict_unused(self, keep: Optional[str] = None) -> None:
+        # Callers hold self._lock. Closes least recently used, unpinned projects other than `keep`
+        # until the LRU fits max_open_projects again.
+        for name in list(self._open):
+            if len(self._open) <= self.max_open_projects:
+                break
+            if name == keep or self._pins.get(name):
+                continue
+            del self._open[name]
+            self._forget_open_lock(name)
+            self._stats["evicted"] += 1
+            self.telemetry.increment("projects_evicted_total")
+            print(f"Closed project {name} (least recently used).")
+
+    def _forget_open_lock(self, name: str) -> None:
+        # Callers hold self._lock. A lock another request is opening the project under stays.
+        open_lock = self._open_locks.get(name)
+        if open_lock is not None and not open_lock.locked():
+            del self._open_locks[name]
+
+    def evict(self, name: str) -> bool:
+        """
+        Drops an open project from memory, unless it is pinned by use(). Returns whether it was dropped.
+        """
+        with self._lock:
+            if self._pins.get(name) or self._open.pop(name, None) is None:
+                return False
+            self._forget_open_lock(name)
+            return True
+
+    def open_projects(self) -> List[str]:
+        """
+        Names of the projects currently in memory, least recently used first.
+        """
+        with self._lock:
+            return list(self._open)
+
+    def list_projects(self) -> List[Dict]:
+        """
+        Metadata of every project, with its chunk count and whether it is currently open.
+        """
+        with self._lock:
+            projects = {name: dict(metadata) for name, metadata in self._projects.items()}
+            open_names = set(self._open)
+        collections = {}
+        for collection in self.client.list_collections():
+            # Older Chroma versions return Collection objects, newer ones names.
+            collections[getattr(collection, "name", collection)] = collection
+        listing = []
+        for name, metadata in sorted(projects.items()):
+            chunks = 0
+            if metadata["collection"] in collections:
+                chunks = self.client.get_collection(metadata["collection"]).count()
+            listing.append(dict(metadata, name=name, chunks=chunks, open=name in open_names))
+        return listing
+
+    def snapshot(self, name: str, path: str) -> Dict:
+        """
+        Writes the project (metadata, chunks with embeddings, manifest and DOM indexes) to a JSON
+        file that restore() can load. Returns a summary.
+        """
+        with self.use(name) as knowledge_base, self.telemetry.span("projects.snapshot", project=name):
+            with self._lock:
+                metadata = dict(self._projects.get(name, {}))
+            snapshot = {"format": SNAPSHOT_FORMAT, "project": name, "metadata": metadata, "created_at": time.time(),
+                        **knowledge_base.export_snapshot()}
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, path)
+        return {"project": name, "path": path, "snapshot": os.path.basename(path), "chunks": len(snapshot["chunks"]),
+                "bytes": os.path.getsize(path)}
+
+    @property
+    def snapshot_directory(self) -> str:
+        return os.path.join(self.persist_directory, "snapshots")
+
+    def snapshot_path(self, snapshot: str) -> str:
+        """
+        Path of snapshot file `snapshot` in snapshot_directory. Anything but a plain `.json` file
+        name (separators, `..`, absolute paths) is rejected, as is a file that does not exist.
+        """
+        if not isinstance(snapshot, str) or not SNAPSHOT_NAME_PATTERN.match(snapshot) or ".." in snapshot:
+            raise ProjectError(f"Invalid snapshot name {snapshot!r}: use the file name returned by snapshot().")
+        directory = os.path.realpath(self.snapshot_directory)
+        path = os.path.realpath(os.path.join(directory, snapshot))
+        if os.path.dirname(path) != directory:
+            raise ProjectError(f"Invalid snapshot name {snapshot!r}.")
+        if not os.path.isfile(path):
+            raise ProjectNotFoundError(f"Snapshot {snapshot!r} does not exist.")
+        return path
+
+    def list_snapshots(self) -> List[Dict]:
+        """
+        Snapshot files in snapshot_directory, newest first.
+        """
+        if not os.path.isdir(self.snapshot_directory):
+            return []
+        snapshots = []
+        for entry in os.scandir(self.snapshot_directory):
+            if entry.is_file() and SNAPSHOT_NAME_PATTERN.match(entry.name):
+                stat = entry.stat()
+                snapshots.append({"snapshot": entry.name, "bytes": stat.st_size, "created_at": stat.st_mtime})
+        return sorted(snapshots, key=lambda snapshot: -snapshot["created_at"])
+
+    def restore(self, path: str, name: Optional[str] = None) -> Dict:
+        """
+        Loads a snapshot into project `name` (default: the project it was taken from), which must
+        not exist yet or be empty. Returns a summary.
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+        if snapshot.get("format") != SNAPSHOT_FORMAT:
+            raise ProjectError(f"Unsupported snapshot format {snapshot.get('format')!r} in {path}.")
+        name = self.validate_name(name or snapshot["project"])
+        with self.write_lock(name), self.telemetry.span("projects.restore", project=name), \
+                self.use(name, create=True) as knowledge_base:
+            if knowledge_base.collection.count() > 0:
+                raise ProjectError(f"Project {name!r} already has data; drop it before restoring.")
+            with self._lock:
+                self._projects[name]["description"] = snapshot.get("metadata", {}).get("description", "")
+                self._save_metadata()
+            chunks = knowledge_base.import_snapshot(snapshot)
+        return {"project": name, "chunks": chunks}
+
+    def drop(self, name: str) -> None:
+        """
+        Deletes the project's collection, its state files and its metadata.
+        """
+        with self.write_lock(name):
+            with self._lock:
+                if name not in self._projects:
+                    raise ProjectNotFoundError(f"Project {name!r} does not exist.")
+                if self._pins.get(name):
+                    raise ProjectError(f"Project {name!r} is in use; drop it once its requests have finished.")
+                collection_name = self._projects[name]["collection"]
+                self._open.pop(name, None)
+                self._forget_open_lock(name)
+                del self._projects[name]
+                self._save_metadata()
+            try:
+                self.client.delete_collection(collection_name)
+            except Exception as e:
+                print(f"Error deleting collection {collection_name}: {e}")
+            for path in KnowledgeBase.state_files(self.persist_directory, collection_name).values():
+                if os.path.exists(path):
+                    os.remove(path)
+        self.telemetry.increment("projects_dropped_total")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._stats, known=len(self._projects), open=len(self._open),
+                        pinned=len(self._pins), max_open=self.max_open_projects)
+
+    def migrate(self) -> Dict[str, Dict]:
+        """
+        Runs KnowledgeBase.migrate() on every project that needs it, one at a time and under its
+        write lock. Returns the result per migrated project.
+        """
+        with self._lock:
+            names = sorted(self._projects)
+        results = {}
+        for name in names:
+            with self.write_lock(name), self.use(name) as knowledge_base:
+                if knowledge_base.needs_migration:
+                    results[name] = knowledge_base.migrate()
+        print(f"Migrated {len(results)} of {len(names)} projects.")
+        return results
+
+    def cache_stats(self) -> Dict[str, Dict]:
+        """
+        Query cache statistics of the projects currently open.
+        """
+        with self._lock:
+            open_projects = list(self._open.items())
+        return {name: knowledge_base.cache_stats() for name, knowledge_base in open_projects}
@@ -0,0 +1,748 @@
+import os
+import re
+import ast
+import sys
+import json
+import time
+import queue
+import types
+import signal
+import argparse
+import builtins
+import importlib.util
+import tempfile
+import unittest
+import threading
+import traceback
+import subprocess
+import urllib.request
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Set, Optional, Callable, Any
+from dom_index import build_dom_index
+from instrumentation import get_telemetry, run_in_context
+
+try:
+    from selenium.common.exceptions import NoSuchElementException
+except ImportError: # Scripts are skipped without selenium (see selenium_available), FakeDriver included
+    class NoSuchElementException(Exception):
+        pass
+
+try:
+    import resource
+except ImportError: # Not available on Windows; isolated runs then go without resource limits
+    resource = None
+
+# Upper bound for one generated script, and for one isolated run_scripts_isolated() call.
+DEFAULT_SCRIPT_TIMEOUT = 120.0
+DEFAULT_RUN_TIMEOUT = 600.0
+# Environment variables matching this are not passed to the process that runs generated scripts.
+_SECRET_ENV_PATTERN = re.compile(r"KEY|TOKEN|SECRET|PASSWORD|CREDENTIAL", re.IGNORECASE)
+_MAX_WRITTEN_FILE_BYTES = 256 * 1024 * 1024
+_STDERR_TAIL_BYTES = 4000
+
+# file:// URLs in generated scripts point at a placeholder path; only the file name is kept.
+_FILE_URL_PATTERN = re.compile(r"^file://.*?([^/\\]+)$")
+_XPATH_ATTRIBUTE_PATTERN = re.compile(r"""@(id|name)\s*=\s*["']([^"']+)["']""")
+SELENIUM_MISSING = ("selenium is not installed, so the script was not run. Install the project requirements "
+                    "(pip install -r requirements.txt) to run scripts, dry runs with FakeDriver included.")
+
+
+def selenium_available() -> bool:
+    """
+    Whether the selenium package can be imported. Generated scripts import it, so without it
+    every script is reported as "skipped".
+    """
+    return importlib.util.find_spec("selenium") is not None
+
+
+def chrome_driver_factory(headless: bool = True, window_size: str = "1280,900") -> Callable[[], Any]:
+    """
+    Returns a factory for local Chrome drivers, headless by default.
+    """
+    def create():
+        from selenium import webdriver
+        options = webdriver.ChromeOptions()
+        if headless:
+            options.add_argument("--headless=new")
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        options.add_argument(f"--window-size={window_size}")
+        return webdriver.Chrome(options=options)
+    return create
+
+
+class FakeElement:
+    """
+    Element returned by FakeDriver, backed by a dom_index element record. Keeps typed text and
+    checked state so simple scripts behave plausibly; no JavaScript runs.
+    """
+    def __init__(self, record: Dict):
+        self.record = record
+        self.tag_name = record.get("tag") or "div"
+        self._value = record.get("value") or ""
+        self._selected = bool(record.get("checked"))
+
+    @property
+    def text(self) -> str:
+        return self.record.get("text") or ""
+
+    def click(self) -> None:
+        if self.record.get("type") in ("radio", "checkbox"):
+            self._selected = True if self.record.get("type") == "radio" else not self._selected
+
+    def send_keys(self, *values) -> None:
+        self._value += "".join(str(value) for value in values)
+
+    def clear(self) -> None:
+        self._value = ""
+
+    def submit(self) -> None:
+        pass
+
+    def get_attribute(self, name: str) -> Optional[str]:
+        if name == "value":
+            return self._value
+        if name in ("disabled", "required", "checked", "hidden"):
+            return "true" if self.record.get(name) else None
+        return self.record.get(name)
+
+    def get_property(self, name: str) -> Any:
+        return self.get_attribute(name)
+
+    def value_of_css_property(self, name: str) -> str:
+        return ""
+
+    def is_displayed(self) -> bool:
+        return not self.record.get("hidden")
+
+    def is_enabled(self) -> bool:
+        return not self.record.get("disabled")
+
+    def is_selected(self) -> bool:
+        return self._selected
+
+    def find_element(self, by: str = "id", value: Optional[str] = None) -> "FakeElement":
+        return self
+
+    def find_elements(self, by: str = "id", value: Optional[str] = None) -> List["FakeElement"]:
+        return [self]
+
+
+class FakeDriver:
+    """
+    Browser-free stand-in for a Selenium WebDriver, for running the pipeline in tests and CI.
+
+    Pages are fetched over HTTP and indexed with dom_index, so locators by id, name, tag, link
+    text, the indexed CSS selector or an XPath with @id/@name resolve against the real page and
+    raise NoSuchElementException otherwise. Other locator strategies match leniently.
+    """
+    def __init__(self):
+        self.current_url = "about:blank"
+        self.title = ""
+        self.page_source = ""
+        self.visited: List[str] = []
+        self.quit_called = False
+        self._elements: List[Dict] = []
+
+    def get(self, url: str) -> None:
+        self.current_url = url
+        self.visited.append(url)
+        if url.startswith(("http://", "https://")):
+            with urllib.request.urlopen(url, timeout=10) as response:
+                self.page_source = response.read().decode("utf-8", errors="replace")
+            index = build_dom_index(self.page_source)
+            self.title = index["title"] or ""
+            self._elements = index["elements"]
+        else:
+            self.page_source, self.title, self._elements = "", "", []
+
+    def _matches(self, record: Dict, by: str, value: str) -> bool:
+        if by == "id":
+            return record.get("id") == value
+        if by == "name":
+            return record.get("name") == value
+        if by == "tag name":
+            return record.get("tag") == value.lower()
+        if by in ("link text", "partial link text"):
+            return record.get("tag") == "a" and (value == record.get("text") if by == "link text" else value in record.get("text", ""))
+        if by == "css selector":
+            if value == record.get("css"):
+                return True
+            id_match = re.search(r"#([\w-]+)\s*$", value)
+            return bool(id_match) and record.get("id") == id_match.group(1)
+        if by == "xpath":
+            if value == record.get("xpath"):
+                return True
+            attribute_match = _XPATH_ATTRIBUTE_PATTERN.search(value)
+            return bool(attribute_match) and record.get(attribute_match.group(1)) == attribute_match.group(2)
+        return True # class name and anything else: match leniently
+
+    def find_elements(self, by: str = "id", value: Optional[str] = None) -> List[FakeElement]:
+        return [FakeElement(record) for record in self._elements if self._matches(record, by, value or "")]
+
+    def find_element(self, by: str = "id", value: Optional[str] = None) -> FakeElement:
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException(f"No element matches {by}={value!r} on {self.current_url}")
+        return elements[0]
+
+    def execute_script(self, script: str, *args) -> Any:
+        return None
+
+    def delete_all_cookies(self) -> None:
+        pass
+
+    def implicitly_wait(self, seconds: float) -> None:
+        pass
+
+    def set_page_load_timeout(self, seconds: float) -> None:
+        pass
+
+    def set_window_size(self, width: int, height: int) -> None:
+        pass
+
+    def maximize_window(self) -> None:
+        pass
+
+    def refresh(self) -> None:
+        self.get(self.current_url)
+
+    def save_screenshot(self, path: str) -> bool:
+        return False
+
+    def close(self) -> None:
+        pass
+
+    def quit(self) -> None:
+        self.quit_called = True
+
+
+class PooledDriver:
+    """
+    Hands a pooled driver to a generated script. quit()/close() are no-ops so the driver survives
+    the script, and file:// URLs are redirected to the locally served copy of the page.
+    """
+    def __init__(self, driver, base_url: str):
+        self._driver = driver
+        self._base_url = base_url
+
+    def get(self, url: str) -> None:
+        file_match = _FILE_URL_PATTERN.match(url)
+        if file_match:
+            url = f"{self._base_url}/{file_match.group(1)}"
+        self._driver.get(url)
+
+    def quit(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._driver, name)
+
+
+class DriverPool:
+    """
+    Fixed-size pool of reusable WebDrivers, created lazily with `driver_factory`. Drivers are
+    reset on release (cookies, storage, blank page); a driver that fails to reset is discarded
+    and replaced on demand.
+    """
+    def __init__(self, driver_factory: Callable[[], Any], size: int = 2):
+        self.driver_factory = driver_factory
+        self.size = max(1, size)
+        self._idle: "queue.Queue" = queue.Queue()
+        self._created = 0
+        self._all: List[Any] = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if not create:
+            return self._idle.get()
+        try:
+            with get_telemetry().span("script_runner.start_driver"):
+                driver = self.driver_factory()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+        with self._lock:
+            self._all.append(driver)
+        return driver
+
+    def release(self, driver) -> None:
+        try:
+            try:
+                driver.execute_script("window.localStorage.clear(); window.sessionStorage.clear();")
+            except Exception:
+                pass # No storage on about:blank or file:// origins
+            driver.delete_all_cookies()
+            driver.get("about:blank")
+        except Exception as e:
+            print(f"Discarding WebDriver that failed to reset: {e}")
+            self.discard(driver)
+            return
+        self._idle.put(driver)
+
+    def discard(self, driver) -> None:
+        """
+        Quits a driver that must not be reused (e.g. one a timed-out script may still be using);
+        a replacement is created on demand.
+        """
+        with self._lock:
+            self._created -= 1
+            if driver in self._all:
+                self._all.remove(driver)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def close(self) -> None:
+        with self._lock:
+            drivers, self._all = self._all, []
+            self._created = 0
+        self._idle = queue.Queue()
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception as e:
+                print(f"Error quitting WebDriver: {e}")
+
+
+class _ModuleShim(types.ModuleType):
+    """
+    Module stand-in that overrides some attributes and forwards the rest to the real module.
+    """
+    def __init__(self, module: types.ModuleType, **overrides):
+        super().__init__(module.__name__)
+        self._module = module
+        self.__dict__.update(overrides)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._module, name)
+
+
+class _PageServer:
+    """
+    Serves a directory on an ephemeral localhost port from a background thread.
+    """
+    def __init__(self, directory: str):
+        handler = partial(_QuietHandler, directory=directory)
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="script-runner-http", daemon=True)
+        self.thread.start()
+
+    def close(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def _module_level_calls(tree: ast.AST) -> Set[str]:
+    """
+    Names of the functions a script calls itself when executed: calls outside function and class
+    bodies and outside `if __name__ == "__main__":` blocks (the script does not run as __main__).
+    """
+    names: Set[str] = set()
+
+    def is_main_guard(node: ast.AST) -> bool:
+        test = node.test if isinstance(node, ast.If) else None
+        return (isinstance(test, ast.Compare) and isinstance(test.left, ast.Name) and test.left.id == "__name__"
+                and any(isinstance(comparator, ast.Constant) and comparator.value == "__main__"
+                        for comparator in test.comparators))
+
+    def visit(node: ast.AST) -> None:
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+                continue
+            if is_main_guard(child):
+                for orelse in child.orelse:
+                    visit(orelse)
+                continue
+            if isinstance(child, ast.Call) and isinstance(child.func, ast.Name):
+                names.add(child.func.id)
+            visit(child)
+
+    visit(tree)
+    return names
+
+
+class ScriptRunner:
+    """
+    Executes generated Selenium scripts against a locally served copy of the target page, on a
+    pool of `workers` reusable drivers.
+
+    Each script runs in its own namespace. Its `webdriver.Chrome()` (or Firefox/Edge/Remote) calls
+    return the pooled driver instead of launching a browser, `driver.quit()` is a no-op and
+    file:// URLs ending in a page name are rewritten to the local server. The test is whatever
+    the script runs: its `unittest.TestCase` classes, else its `test_*` functions, else a `main()`
+    function, else its top-level code. Functions the script already calls at module level are not
+    called again.
+
+    A script still running after `script_timeout` seconds is reported as an error and its driver
+    is quit and replaced, which ends any WebDriver call it is blocked in. Its thread cannot be
+    killed, so a script stuck in pure Python keeps running in the background; run untrusted
+    scripts through run_scripts_isolated, whose process is killed at its own deadline.
+
+    Pass `driver_factory=FakeDriver` to run without a browser.
+    """
+    def __init__(self, page_directory: str, driver_factory: Optional[Callable[[], Any]] = None, workers: int = 2,
+                 script_timeout: Optional[float] = DEFAULT_SCRIPT_TIMEOUT):
+        self.page_directory = page_directory
+        self.workers = max(1, workers)
+        self.script_timeout = script_timeout
+        self.pool = DriverPool(driver_factory or chrome_driver_factory(), size=self.workers)
+        self.server: Optional[_PageServer] = None
+        self.telemetry = get_telemetry()
+
+    def start(self) -> "ScriptRunner":
+        if self.server is None:
+            self.server = _PageServer(self.page_directory)
+        return self
+
+    def close(self) -> None:
+        self.pool.close()
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+
+    def __enter__(self) -> "ScriptRunner":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _namespace(self, driver_for_script: Callable[..., PooledDriver]) -> Dict:
+        real_import = builtins.__import__
+        shims: Dict[str, _ModuleShim] = {}
+
+        def selenium_shims():
+            if not shims:
+                import selenium
+                import selenium.webdriver
+                overrides = {browser: driver_for_script for browser in ("Chrome", "Firefox", "Edge", "Safari", "Remote")}
+                shims["webdriver"] = _ModuleShim(selenium.webdriver, **overrides)
+                shims["selenium"] = _ModuleShim(selenium, webdriver=shims["webdriver"])
+            return shims
+
+        def import_shim(name, globals=None, locals=None, fromlist=(), level=0):
+            module = real_import(name, globals, locals, fromlist, level)
+            if level == 0 and name == "selenium":
+                return selenium_shims()["selenium"]
+            if level == 0 and name == "selenium.webdriver":
+                return selenium_shims()["webdriver" if fromlist else "selenium"]
+            return module
+
+        script_builtins = dict(builtins.__dict__)
+        script_builtins["__import__"] = import_shim
+        return {"__name__": "__generated_test__", "__builtins__": script_builtins}
+
+    def run_script(self, script: str, test_id: str = "N/A") -> Dict:
+        """
+        Runs one generated script. Returns a dict with `Test_ID`, `status` ("passed", "failed"
+        for assertion failures, "skipped" when selenium is not installed, "error" otherwise),
+        `passed`, `seconds`, `tests_run`, `error` and `traceback`.
+        """
+        if not selenium_available():
+            self.telemetry.increment("scripts_run_total", status="skipped")
+            return _skipped_result(test_id)
+        result = {"Test_ID": test_id, "status": "passed", "passed": True, "seconds": 0.0,
+                  "tests_run": 0, "error": None, "traceback": None}
+        start_time = time.perf_counter()
+        pooled: List[PooledDriver] = []
+        driver_lock = threading.Lock()
+        timed_out = threading.Event()
+
+        def driver_for_script(*args, **kwargs) -> PooledDriver:
+            # A script gets one pooled driver however many times it asks for a browser.
+            with driver_lock:
+                if timed_out.is_set():
+                    raise TimeoutError("The script timed out")
+                if not pooled:
+                    pooled.append(PooledDriver(self.pool.acquire(), self.server.base_url))
+                return pooled[0]
+
+        def execute() -> None:
+            try:
+                self._execute(script, test_id, driver_for_script, result)
+            except AssertionError as e:
+                result.update(status="failed", error=str(e) or "AssertionError", traceback=traceback.format_exc())
+            except BaseException as e:
+                result.update(status="error", error=f"{type(e).__name__}: {e}", traceback=traceback.format_exc())
+
+        with self.telemetry.span("script_runner.run_script", test_id=test_id) as script_span:
+            thread = threading.Thread(target=run_in_context(execute), name=f"script-{test_id}", daemon=True)
+            thread.start()
+            thread.join(self.script_timeout)
+            with driver_lock:
+                if thread.is_alive():
+                    timed_out.set()
+                    # A copy, so whatever the abandoned thread still writes does not leak into the result.
+                    result = dict(result, status="error", traceback=None,
+                                  error=f"TimeoutError: the script did not finish within {self.script_timeout:.0f}s")
+                if pooled:
+                    if timed_out.is_set():
+                        self.pool.discard(pooled[0]._driver) # The script may still be using it
+                    else:
+                        self.pool.release(pooled[0]._driver)
+            result["passed"] = result["status"] == "passed"
+            result["seconds"] = time.perf_counter() - start_time
+            script_span.set(status=result["status"], tests_run=result["tests_run"], timed_out=timed_out.is_set())
+        self.telemetry.increment("scripts_run_total", status=result["status"])
+        return result
+
+    def _execute(self, script: str, test_id: str, driver_for_script: Callable[..., PooledDriver], result: Dict) -> None:
+        code = compile(script, f"<generated {test_id}>", "exec")
+        called = _module_level_calls(ast.parse(script))
+        namespace = self._namespace(driver_for_script)
+        exec(code, namespace)
+        test_classes = [value for value in namespace.values() if isinstance(value, type)
+                        and issubclass(value, unittest.TestCase) and value is not unittest.TestCase]
+        test_functions = {name: value for name, value in namespace.items()
+                          if name.startswith("test") and callable(value) and not isinstance(value, type)}
+        if test_classes:
+            suite = unittest.TestSuite(unittest.defaultTestLoader.loadTestsFromTestCase(test_class)
+                                       for test_class in test_classes)
+            outcome = unittest.TestResult()
+            suite.run(outcome)
+            result["tests_run"] = outcome.testsRun
+            problems = outcome.errors + outcome.failures
+            if problems:
+                result["status"] = "failed" if outcome.failures and not outcome.errors else "error"
+                result["traceback"] = "\n".join(text for _, text in problems)
+                result["error"] = result["traceback"].strip().splitlines()[-1]
+        elif test_functions:
+            # The ones the script called itself already ran during exec.
+            result["tests_run"] = sum(1 for name in test_functions if name in called)
+            for name, test_function in test_functions.items():
+                if name not in called:
+                    result["tests_run"] += 1
+                    test_function()
+        elif callable(namespace.get("main")) and "main" not in called:
+            namespace["main"]()
+            result["tests_run"] = 1
+        else:
+            result["tests_run"] = 1 # The top-level code was the test
+
+    def run_scripts(self, scripts: List[Dict],
+                    progress_callback: Optional[Callable[[int, int, Dict], None]] = None) -> List[Dict]:
+        """
+        Runs many generated scripts on the driver pool, `workers` at a time. `scripts` holds dicts
+        with `Test_ID` and `script` (as returned by SeleniumAgent.generate_selenium_scripts);
+        entries without a script are skipped. Results come back in input order.
+        """
+        self.start()
+        runnable = [item for item in scripts if item.get("script")]
+        results: List[Optional[Dict]] = [None] * len(runnable)
+        with self.telemetry.span("script_runner.run_scripts", scripts=len(runnable), workers=self.workers) as batch_span:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {executor.submit(run_in_context(self.run_script), item["script"], item.get("Test_ID", "N/A")): index
+                           for index, item in enumerate(runnable)}
+                for done, future in enumerate(as_completed(futures), start=1):
+                    index = futures[future]
+                    results[index] = future.result()
+                    if progress_callback is not None:
+                        progress_callback(done, len(runnable), results[index])
+            batch_span.set(passed=sum(1 for result in results if result["passed"]))
+        return results
+
+
+def write_page(html: str, directory: str, page_name: str = "checkout.html") -> str:
+    """
+    Writes the target page into `directory` for ScriptRunner to serve. Returns its path.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, page_name)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(html)
+    return path
+
+
+def _resource_limits(cpu_seconds: int, memory_bytes: Optional[int]) -> Callable[[], None]:
+    """
+    Returns a preexec_fn that caps CPU time, written file size and (optionally) address space of
+    the script process and the browsers it starts, and disables core dumps.
+    """
+    def apply() -> None:
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 5))
+        resource.setrlimit(resource.RLIMIT_FSIZE, (_MAX_WRITTEN_FILE_BYTES, _MAX_WRITTEN_FILE_BYTES))
+        if memory_bytes:
+            resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    return apply
+
+
+def _kill_process_group(process: subprocess.Popen) -> None:
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(process.pid, signal.SIGKILL) # The runner and every browser it started
+        else:
+            process.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _error_result(test_id: str, error: str, details: Optional[str] = None) -> Dict:
+    return {"Test_ID": test_id, "status": "error", "passed": False, "seconds": 0.0, "tests_run": 0,
+            "error": error, "traceback": details}
+
+
+def _skipped_result(test_id: str) -> Dict:
+    return dict(_error_result(test_id, SELENIUM_MISSING), status="skipped")
+
+
+def run_scripts_isolated(scripts: List[Dict], html: str, workers: int = 2, dry_run: bool = False,
+                         timeout: float = DEFAULT_RUN_TIMEOUT, script_timeout: float = DEFAULT_SCRIPT_TIMEOUT,
+                         memory_limit_mb: Optional[int] = None,
+                         progress_callback: Optional[Callable[[int, int, Dict], None]] = None) -> List[Dict]:
+    """
+    Runs generated scripts like ScriptRunner.run_scripts, but in a separate Python process (this
+    module's main()) so a script cannot touch the caller's memory, and a crash or hang cannot
+    take the caller down.
+
+    The process gets a fresh temporary directory holding the page, an environment without
+    secrets (variables named like keys, tokens or passwords), resource limits where the platform
+    has them (CPU time, written file size, no core dumps, and address space when
+    `memory_limit_mb` is given; leave it unset for Chrome, which reserves far more address space
+    than it uses) and a hard `timeout` for the whole run; each script also has `script_timeout`
+    (see ScriptRunner). When the run timeout passes, the process and every browser it
+    started are killed and the scripts without a result are reported as errors. Results come
+    back in input order; `progress_callback(done, total, result)` is called as each one arrives.
+    """
+    runnable = [item for item in scripts if item.get("script")]
+    results: List[Optional[Dict]] = [None] * len(runnable)
+    telemetry = get_telemetry()
+    if not runnable:
+        return []
+    if not selenium_available():
+        # Nothing could run, so no process is started.
+        print(f"Skipping {len(runnable)} scripts: {SELENIUM_MISSING}")
+        for done, item in enumerate(runnable, start=1):
+            results[done - 1] = _skipped_result(item.get("Test_ID", "N/A"))
+            telemetry.increment("scripts_run_total", status="skipped")
+            if progress_callback is not None:
+                progress_callback(done, len(runnable), results[done - 1])
+        return results
+    with telemetry.span("script_runner.run_scripts_isolated", scripts=len(runnable), workers=workers) as batch_span, \
+            tempfile.TemporaryDirectory(prefix="qa_agent_page_") as page_directory, \
+            tempfile.TemporaryFile() as stderr:
+        write_page(html, page_directory)
+        command = [sys.executable, os.path.abspath(__file__), "--workers", str(max(1, workers)),
+                   "--script-timeout", str(script_timeout), "--page-directory", page_directory]
+        if dry_run:
+            command.append("--dry-run")
+        env = {key: value for key, value in os.environ.items() if not _SECRET_ENV_PATTERN.search(key)}
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)),
+                                                          env.get("PYTHONPATH")]))
+        preexec_fn = None
+        if resource is not None:
+            memory_bytes = memory_limit_mb * 1024 * 1024 if memory_limit_mb else None
+            preexec_fn = _resource_limits(int(timeout) + 1, memory_bytes)
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr,
+                                   cwd=page_directory, env=env, preexec_fn=preexec_fn,
+                                   start_new_session=hasattr(os, "killpg"))
+        timed_out = threading.Event()
+
+        def on_timeout() -> None:
+            timed_out.set()
+            _kill_process_group(process)
+
+        timer = threading.Timer(timeout, on_timeout)
+        timer.daemon = True
+        timer.start()
+        done = 0
+        try:
+            try:
+                process.stdin.write(json.dumps(runnable).encode("utf-8"))
+                process.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass # The process died on start-up; reported below
+            for line in process.stdout:
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                index = message.pop("index", None) if isinstance(message, dict) else None
+                if not isinstance(index, int) or not 0 <= index < len(results) or results[index] is not None:
+                    continue
+                results[index] = message
+                done += 1
+                telemetry.record_span("script_runner.run_script", message.get("seconds", 0.0),
+                                      test_id=message.get("Test_ID"), status=message.get("status"))
+                telemetry.increment("scripts_run_total", status=message.get("status"))
+                if progress_callback is not None:
+                    progress_callback(done, len(runnable), message)
+            process.wait()
+        finally:
+            timer.cancel()
+            if process.poll() is None:
+                _kill_process_group(process)
+                process.wait()
+
+        stderr.seek(0, os.SEEK_END)
+        stderr.seek(max(0, stderr.tell() - _STDERR_TAIL_BYTES))
+        stderr_tail = stderr.read().decode("utf-8", errors="replace").strip() or None
+        for index, item in enumerate(runnable):
+            if results[index] is not None:
+                continue
+            if timed_out.is_set():
+                error = f"TimeoutError: the script run exceeded {timeout:.0f}s and was killed"
+            else:
+                error = f"Script runner process exited with code {process.returncode}"
+            results[index] = _error_result(item.get("Test_ID", "N/A"), error, stderr_tail)
+            telemetry.increment("scripts_run_total", status="error")
+            done += 1
+            if progress_callback is not None:
+                progress_callback(done, len(runnable), results[index])
+        batch_span.set(passed=sum(1 for result in results if result["passed"]), timed_out=timed_out.is_set())
+    return results
+
+
+def main() -> int:
+    """
+    Entry point of the process started by run_scripts_isolated: reads a JSON list of
+    {"Test_ID", "script"} items on stdin and writes one JSON result (with its input `index`) per
+    line to stdout as each script finishes.
+    """
+    parser = argparse.ArgumentParser(description="Run generated Selenium scripts (used by run_scripts_isolated).")
+    parser.add_argument("--page-directory", required=True)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--script-timeout", type=float, default=DEFAULT_SCRIPT_TIMEOUT)
+    parser.add_argument("--dry-run", action="store_true", help="Use FakeDriver instead of headless Chrome.")
+    args = parser.parse_args()
+
+    # Scripts may print; keep the real stdout for results and send everything else to stderr.
+    results_out = os.fdopen(os.dup(1), "w", encoding="utf-8", buffering=1)
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+    items = json.load(sys.stdin)
+    driver_factory = FakeDriver if args.dry_run else chrome_driver_factory(headless=True)
+    with ScriptRunner(args.page_directory, driver_factory=driver_factory, workers=args.workers,
+                      script_timeout=args.script_timeout) as runner, \
+            ThreadPoolExecutor(max_workers=runner.workers) as executor:
+        futures = {executor.submit(runner.run_script, item["script"], item.get("Test_ID", "N/A")): index
+                   for index, item in enumerate(items)}
+        for future in as_completed(futures):
+            results_out.write(json.dumps(dict(future.result(), index=futures[future]), default=str) + "\n")
+    results_out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,37 @@
 import os
 import json
-from typing import Dict, Union, List
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Union, List, Optional, Callable
 from knowledge_base import KnowledgeBase
+from llm_cache import ResponseCache, get_default_response_cache
+from context_assembler import ContextAssembler
+from concurrency import TokenBucket, call_with_retries
+from instrumentation import get_telemetry, run_in_context
 import google.generativeai as genai
 
 class SeleniumAgent:
-    def __init__(self, knowledge_base: KnowledgeBase, api_key: str, llm_model: str = "gemini-2.5-flash"):
+    def __init__(self, knowledge_base: KnowledgeBase, api_key: str, llm_model: str = "gemini-2.5-flash",
+                 response_cache: Optional[ResponseCache] = None, context_token_budget: int = 600,
+                 retrieval_candidates: int = 12, llm=None):
         self.knowledge_base = knowledge_base
-        genai.configure(api_key=api_key)
-        self.llm = genai.GenerativeModel(llm_model)
+        # Over-fetch documentation candidates, then pack a diverse, de-duplicated subset within budget.
+        self.retrieval_candidates = retrieval_candidates
+        self.context_assembler = ContextAssembler(token_budget=context_token_budget)
+        self.llm_model = llm_model
+        # Identical (model, prompt) pairs are answered from the shared cache instead of the API.
+        self.response_cache = response_cache if response_cache is not None else get_default_response_cache()
+        self.telemetry = get_telemetry()
+        if llm is not None:
+            # Any object with a compatible generate_content(), e.g. fake_llm.FakeGenerativeModel
+            self.llm = llm
+        else:
+            genai.configure(api_key=api_key)
+            self.llm = genai.GenerativeModel(llm_model)
 
-    def generate_selenium_script(self, test_case: Dict) -> Union[str, Dict]:
+    def _build_prompt(self, test_case: Dict) -> str:
         """
-        Generates a runnable Selenium Python script for a given test case.
+        Retrieves the HTML and documentation context for a test case and builds the LLM prompt.
         """
         test_id = test_case.get("Test_ID", "N/A")
         feature = test_case.get("Feature", "N/A")
@@ -20,28 +39,42 @@ class SeleniumAgent:
         expected_result = test_case.get("Expected_Result", "N/A")
         grounded_in = test_case.get("Grounded_In", "N/A")
 
-        # Retrieve the full content of checkout.html
-        html_docs, html_metadatas = self.knowledge_base.query(
-            "checkout.html content", 
-            n_results=10, # Retrieve more chunks to ensure full HTML is captured
-            where={"type": "html"}
-        )
-        full_html_content = "\n".join(html_docs) if html_docs else "No checkout.html content found."
+        # Selector digest of only the checkout.html elements relevant to this test case
+        html_context = self.knowledge_base.element_digest(f"{feature} {test_scenario} {expected_result}")
+        if html_context:
+            html_context_title = "Relevant `checkout.html` elements (tag#id, attributes, labels, CSS selector, XPath, form, section)"
+            html_context_language = "text"
+        else:
+            # No structural index available (e.g. a knowledge base built before indexing existed)
+            html_docs, html_metadatas = self.knowledge_base.query(
+                "checkout.html content", 
+                n_results=10, # Retrieve more chunks to ensure full HTML is captured
+                where={"type": "html"}
+            )
+            html_context = "\n".join(html_docs) if html_docs else "No checkout.html content found."
+            html_context_title = "Full `checkout.html` content"
+            html_context_language = "html"
         
         # Retrieve relevant documentation snippets from the vector DB for the feature
-        relevant_docs, relevant_metadatas = self.knowledge_base.query(
-            f"Documentation for {feature} related to {test_scenario}",
-            n_results=5,
-            where={"type": {"!=": "html"}} # Exclude HTML content here, already retrieved
+        documentation_query = f"Documentation for {feature} related to {test_scenario}"
+        relevant_records = self.knowledge_base.query_records(
+            documentation_query,
+            n_results=self.retrieval_candidates,
+            where={"type": {"$ne": "html"}} # Exclude HTML content here, already retrieved
         )
-        documentation_context = "\n\n".join(relevant_docs) if relevant_docs else "No specific documentation context found."
+        with self.telemetry.span("context.assemble", retrieved=len(relevant_records)) as assemble_span:
+            context = self.context_assembler.assemble(
+                relevant_records, self.knowledge_base.embed_query(documentation_query) if relevant_records else None
+            )
+            assemble_span.set(used=context["used"], context_tokens=context["tokens"])
+        documentation_context = context["text"] or "No specific documentation context found."
 
         prompt = f"""
         You are an expert Selenium (Python) test engineer. Your task is to generate a fully executable
         Python Selenium script to automate the given test case on the provided HTML structure.
 
         Follow these instructions carefully:
-        1.  **Use appropriate selectors**: Identify elements using their IDs, names, CSS selectors, or XPath based on the provided HTML. Prioritize IDs where available.
+        1.  **Use appropriate selectors**: Identify elements using their IDs, names, CSS selectors, or XPath based on the provided HTML elements. Prioritize IDs where available and only use selectors that appear in the provided HTML context.
         2.  **Chrome WebDriver**: Assume Chrome is installed and use `webdriver.Chrome()`.
         3.  **Local HTML File**: The script should open the `checkout.html` file directly using its local path. Provide a placeholder path like `file:///C:/path/to/checkout.html` and mention in comments that the user needs to update it.
         4.  **Action Steps**: Translate the `Test_Scenario` into concrete Selenium actions (e.g., `send_keys`, `click`).
@@ -59,9 +92,9 @@ class SeleniumAgent:
         Grounded In: {grounded_in}
 
         ---
-        Full `checkout.html` content:
-        ```html
-        {full_html_content}
+        {html_context_title}:
+        ```{html_context_language}
+        {html_context}
         ```
 
         ---
@@ -75,17 +108,113 @@ class SeleniumAgent:
         # Your Python Selenium script here
         ```
         """
+        return prompt
+
+    @staticmethod
+    def _extract_code(llm_output: str) -> str:
+        """
+        Extracts only the Python code block from the LLM output.
+        """
+        if "```python" in llm_output and "```" in llm_output:
+            start = llm_output.find("```python") + len("```python")
+            end = llm_output.find("```", start)
+            if start != -1 and end != -1:
+                return llm_output[start:end].strip()
+        return llm_output # Fallback if code block not found
+
+    def _record_llm_call(self, prompt: str, response_text: str, cached: bool) -> Dict:
+        """
+        Counts prompt/response tokens and cache hits for one LLM request; returns them as span attributes.
+        """
+        prompt_tokens = self.context_assembler.token_counter(prompt)
+        response_tokens = self.context_assembler.token_counter(response_text) if response_text else 0
+        self.telemetry.increment("llm_requests_total", agent="selenium", cache="hit" if cached else "miss")
+        self.telemetry.increment("llm_prompt_tokens_total", prompt_tokens, agent="selenium")
+        self.telemetry.increment("llm_response_tokens_total", response_tokens, agent="selenium")
+        return {"model": self.llm_model, "cache_hit": cached,
+                "prompt_tokens": prompt_tokens, "response_tokens": response_tokens}
+
+    def _generate(self, prompt: str) -> str:
+        """
+        Calls the LLM once, inside an `llm.generate_content` span.
+        """
+        with self.telemetry.span("llm.generate_content", agent="selenium") as llm_span:
+            response_text = self.llm.generate_content(prompt).text
+            llm_span.set(**self._record_llm_call(prompt, response_text, cached=False))
+        return response_text
+
+    def _cached_output(self, prompt: str) -> Optional[str]:
+        cached_output = self.response_cache.get(self.llm_model, prompt)
+        if cached_output is not None:
+            self._record_llm_call(prompt, cached_output, cached=True)
+        return cached_output
+
+    def generate_selenium_script(self, test_case: Dict) -> Union[str, Dict]:
+        """
+        Generates a runnable Selenium Python script for a given test case.
+        """
+        with self.telemetry.span("selenium_agent.generate_script", test_id=test_case.get("Test_ID", "N/A")):
+            with self.telemetry.span("selenium_agent.build_prompt"):
+                prompt = self._build_prompt(test_case)
+            try:
+                llm_output = self._cached_output(prompt)
+                if llm_output is None:
+                    llm_output = self._generate(prompt)
+                    self.response_cache.set(self.llm_model, prompt, llm_output)
+                return self._extract_code(llm_output)
+            except Exception as e:
+                return {"error": f"Failed to generate Selenium script with Gemini API: {e}. Ensure your API key is correct and you have access to the '{self.llm_model}' model."}
+
+    def generate_selenium_scripts(self, test_cases: List[Dict], max_concurrency: int = 4,
+                                  requests_per_second: float = 1.0, max_retries: int = 3,
+                                  base_delay: float = 1.0,
+                                  progress_callback: Optional[Callable[[int, int, Dict], None]] = None) -> List[Dict]:
+        """
+        Generates Selenium scripts for many test cases concurrently.
+
+        At most `max_concurrency` cases are in flight and LLM calls are throttled by a token bucket
+        of `requests_per_second`. Calls that fail with a transient error (rate limiting, timeouts,
+        5xx) are retried with exponential backoff and jitter; other errors fail the case at once.
+        Returns one result per test case, in input order, with keys `Test_ID`, `script` (None on
+        failure), `error`, `attempts` and `seconds`. `progress_callback(done, total, result)` is
+        invoked from the calling thread as each case finishes.
+        """
+        rate_limiter = TokenBucket(requests_per_second, capacity=max(1.0, float(max_concurrency)))
+        results: List[Optional[Dict]] = [None] * len(test_cases)
+
+        def generate_one(test_case: Dict) -> Dict:
+            start_time = time.perf_counter()
+            result = {"Test_ID": test_case.get("Test_ID", "N/A"), "script": None, "error": None,
+                      "attempts": 0, "seconds": 0.0}
+            with self.telemetry.span("selenium_agent.generate_script", test_id=result["Test_ID"]) as script_span:
+                try:
+                    with self.telemetry.span("selenium_agent.build_prompt"):
+                        prompt = self._build_prompt(test_case)
+                    llm_output = self._cached_output(prompt)
+                    if llm_output is None:
+                        llm_output, result["attempts"] = call_with_retries(
+                            lambda: self._generate(prompt),
+                            max_retries=max_retries,
+                            base_delay=base_delay,
+                            rate_limiter=rate_limiter
+                        )
+                        self.response_cache.set(self.llm_model, prompt, llm_output)
+                    result["script"] = self._extract_code(llm_output)
+                except Exception as e:
+                    result["error"] = f"Failed to generate Selenium script with Gemini API: {e}"
+                script_span.set(attempts=result["attempts"], error=result["error"] is not None)
+            result["seconds"] = time.perf_counter() - start_time
+            return result
 
-        try:
-            response = self.llm.generate_content(prompt)
-            llm_output = response.text
-            
-            # Extract only the code block
-            if "```python" in llm_output and "```" in llm_output:
-                start = llm_output.find("```python") + len("```python")
-                end = llm_output.find("```", start)
-                if start != -1 and end != -1:
-                    return llm_output[start:end].strip()
-            return llm_output # Fallback if code block not found
-        except Exception as e:
-            return {"error": f"Failed to generate Selenium script with Gemini API: {e}. Ensure your API key is correct and you have access to the '{self.llm_model}' model."}
+        with self.telemetry.span("selenium_agent.generate_scripts", test_cases=len(test_cases)) as batch_span:
+            with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+                # Each worker runs in a copy of this context so its spans nest under the batch span.
+                futures = {executor.submit(run_in_context(generate_one), test_case): index
+                           for index, test_case in enumerate(test_cases)}
+                for done, future in enumerate(as_completed(futures), start=1):
+                    index = futures[future]
+                    results[index] = future.result()
+                    if progress_callback is not None:
+                        progress_callback(done, len(test_cases), results[index])
+            batch_span.set(failed=sum(1 for result in results if result["error"]))
+        return results
@@ -0,0 +1,600 @@
+"""
+HTTP backend for the QA agent.
+
+One process holds the project knowledge bases (see projects.py), the embedding model and the
+Gemini model, and every Streamlit session (see service_client.py) shares them. Every pipeline
+request names a project; the "default" project is used when it does not. Blocking pipeline work
+runs on a bounded worker pool. Identical generation requests that arrive while one is already in
+flight share its result, and concurrent query embeddings are encoded together in micro-batches.
+
+    python service.py --port 8000 --workers 8
+
+After changing the embedding model or backend, run `python service.py --migrate` once first: it
+re-embeds the stored chunks of every project, which the service never does on its own.
+
+When QA_AGENT_SERVICE_TOKEN is set, every endpoint but /health requires it as a bearer token.
+Running generated scripts (/run-scripts) is off unless QA_AGENT_ENABLE_SCRIPT_RUNNER is set, and
+needs the token; the scripts then run in a separate, resource-limited process with a hard timeout.
+"""
+import os
+import hmac
+import json
+import base64
+import asyncio
+import argparse
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from functools import partial
+from typing import List, Dict, Tuple, Optional, Any, Callable, Iterator, Union, Literal
+from dotenv import load_dotenv
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from parsers import parse_uploads, _file_kind
+from projects import ProjectManager, ProjectError, ProjectNotFoundError, DEFAULT_PROJECT
+from test_case_agent import TestCaseAgent
+from selenium_agent import SeleniumAgent
+from llm_cache import get_default_response_cache
+from concurrency import RequestCoalescer, MicroBatcher
+from instrumentation import get_telemetry, run_in_context, trace_context
+from script_runner import run_scripts_isolated, DEFAULT_RUN_TIMEOUT, DEFAULT_SCRIPT_TIMEOUT
+import google.generativeai as genai
+
+load_dotenv()
+
+DEFAULT_SERVICE_WORKERS = 8
+DEFAULT_MAX_OPEN_PROJECTS = 8
+LLM_MODEL = "gemini-2.5-flash"
+# Address-space cap for dry runs; real Chrome runs are capped by CPU time and the timeout only.
+DRY_RUN_MEMORY_LIMIT_MB = 1024
+
+
+class LLMNotConfiguredError(RuntimeError):
+    """
+    Raised when a generation endpoint is called but no Gemini API key is configured.
+    """
+
+
+class ScriptRunnerDisabledError(RuntimeError):
+    """
+    Raised when /run-scripts is called but running generated scripts is not enabled.
+    """
+
+
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+class QAService:
+    """
+    Process-wide state behind the HTTP API: the project knowledge bases and one Gemini model shared
+    by all clients, a worker pool for the blocking calls, a coalescer for identical in-flight
+    generation requests and a micro-batcher for query embeddings.
+    """
+    def __init__(self, projects: Optional[ProjectManager] = None, api_key: Optional[str] = None, llm=None,
+                 workers: Optional[int] = None, query_batch_size: int = 32, query_batch_wait: float = 0.005,
+                 api_token: Optional[str] = None, script_runner_enabled: Optional[bool] = None,
+                 script_run_timeout: Optional[float] = None, script_timeout: Optional[float] = None):
+        self.projects = projects if projects is not None else ProjectManager(
+            max_open_projects=int(os.getenv("QA_AGENT_MAX_OPEN_PROJECTS", DEFAULT_MAX_OPEN_PROJECTS))
+        )
+        self.api_key = api_key if api_key is not None else os.getenv("GEMINI_API_KEY")
+        self.api_token = api_token if api_token is not None else os.getenv("QA_AGENT_SERVICE_TOKEN") or None
+        self.script_runner_enabled = (script_runner_enabled if script_runner_enabled is not None
+                                      else _env_flag("QA_AGENT_ENABLE_SCRIPT_RUNNER"))
+        self.script_run_timeout = script_run_timeout or float(os.getenv("QA_AGENT_SCRIPT_RUN_TIMEOUT", DEFAULT_RUN_TIMEOUT))
+        self.script_timeout = script_timeout or float(os.getenv("QA_AGENT_SCRIPT_TIMEOUT", DEFAULT_SCRIPT_TIMEOUT))
+        self.llm = llm # Optional stand-in for the Gemini model, e.g. fake_llm.FakeGenerativeModel
+        self.workers = workers or int(os.getenv("QA_AGENT_SERVICE_WORKERS", DEFAULT_SERVICE_WORKERS))
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="qa-service")
+        self.telemetry = get_telemetry()
+        self.coalescer = RequestCoalescer()
+        # Query embedding misses from concurrent requests share one forward pass.
+        self.query_batcher = MicroBatcher(self._encode_queries, max_batch_size=query_batch_size,
+                                          max_wait=query_batch_wait, name="query-embedding-batcher")
+        self.projects.query_encoder = self.query_batcher.submit
+        self._llm_lock = threading.Lock()
+
+    @property
+    def llm_configured(self) -> bool:
+        return self.llm is not None or bool(self.api_key)
+
+    def _encode_queries(self, texts: List[str]) -> List[List[float]]:
+        unique = list(dict.fromkeys(texts))
+        embeddings = dict(zip(unique, self.projects.embedding_model.encode(unique)))
+        self.telemetry.increment("query_embedding_batches_total")
+        self.telemetry.observe("query_embedding_batch_size", len(texts))
+        return [embeddings[text] for text in texts]
+
+    def _llm(self):
+        """
+        The shared Gemini model; genai.configure() runs once per process rather than per request.
+        """
+        if not self.llm_configured:
+            raise LLMNotConfiguredError("Gemini API key not found. Set GEMINI_API_KEY in the service's .env file.")
+        with self._llm_lock:
+            if self.llm is None:
+                genai.configure(api_key=self.api_key)
+                self.llm = genai.GenerativeModel(LLM_MODEL)
+            return self.llm
+
+    @contextmanager
+    def _agents(self, project: str) -> Iterator[Tuple[TestCaseAgent, SeleniumAgent]]:
+        """
+        Agents bound to the project's knowledge base, which stays pinned open while they are in use.
+        They are cheap to build around the shared model, so they are not kept.
+        """
+        llm = self._llm()
+        with self.projects.use(project) as knowledge_base:
+            yield (TestCaseAgent(knowledge_base, self.api_key, llm_model=LLM_MODEL, llm=llm),
+                   SeleniumAgent(knowledge_base, self.api_key, llm_model=LLM_MODEL, llm=llm))
+
+    def check_agents(self, project: str) -> None:
+        """
+        Raises what _agents would (LLM not configured, unknown project) before a stream starts.
+        """
+        with self._agents(project):
+            pass
+
+    async def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Runs a blocking method on the worker pool without blocking the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, run_in_context(partial(fn, *args, **kwargs)))
+
+    def health(self) -> Dict:
+        return {"status": "ok", "projects": len(self.projects.list_projects()),
+                "open_projects": self.projects.open_projects(), "llm_configured": self.llm_configured,
+                "workers": self.workers, "auth_required": self.api_token is not None,
+                "script_runner_enabled": self.script_runner_enabled and self.api_token is not None}
+
+    def authorized(self, authorization: Optional[str]) -> bool:
+        """
+        True when no token is configured, or `authorization` is "Bearer <token>" with the right token.
+        """
+        if self.api_token is None:
+            return True
+        scheme, _, token = (authorization or "").partition(" ")
+        return scheme.lower() == "bearer" and hmac.compare_digest(token.strip().encode(), self.api_token.encode())
+
+    def stats(self) -> Dict:
+        return {
+            "response_cache": get_default_response_cache().stats(),
+            "projects": self.projects.stats(),
+            "query_cache": self.projects.cache_stats(),
+            "coalescer": self.coalescer.stats(),
+            "query_batcher": self.query_batcher.stats(),
+        }
+
+    def list_projects(self) -> List[Dict]:
+        return self.projects.list_projects()
+
+    def create_project(self, name: str, description: str = "") -> Dict:
+        return self.projects.create(name, description)
+
+    def drop_project(self, name: str) -> None:
+        self.projects.drop(name)
+
+    def snapshot_project(self, name: str) -> Dict:
+        file_name = f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+        return self.projects.snapshot(name, os.path.join(self.projects.snapshot_directory, file_name))
+
+    def list_snapshots(self) -> List[Dict]:
+        return self.projects.list_snapshots()
+
+    def restore_project(self, snapshot: str, name: Optional[str] = None) -> Dict:
+        """
+        Restores a snapshot taken by snapshot_project, named by its file name; clients cannot
+        point the service at other files.
+        """
+        return self.projects.restore(self.projects.snapshot_path(snapshot), name)
+
+    def ingest(self, uploads: List[Tuple[str, bytes, Optional[str]]], batch_size: int = 64,
+               project: str = DEFAULT_PROJECT, progress_callback: Optional[Callable[[int, int, str], None]] = None) -> Dict:
+        """
+        Parses and ingests (name, bytes, mime type) uploads into a project, creating it if needed.
+        PDFs are streamed page by page, the rest are parsed in parallel and embedded in bulk.
+        Ingestions into the same project are serialised; other projects ingest concurrently.
+        `progress_callback(done, total, text)` is called after each parsed file, the bulk embedding
+        step and each PDF.
+        """
+        warnings = []
+        steps = len(uploads) + 1
+        done = 0
+
+        def report(text: str) -> None:
+            nonlocal done
+            done += 1
+            if progress_callback is not None:
+                progress_callback(done, steps, text)
+
+        with self.projects.write_lock(project), self.projects.use(project, create=True) as knowledge_base, \
+                self.telemetry.span("request.build_knowledge_base", project=project, documents=len(uploads)):
+            # Same rule as the parsers, so a PDF sent without its MIME type is still streamed.
+            pdf_uploads = [upload for upload in uploads if _file_kind(upload[0], upload[2]) == "pdf"]
+            other_uploads = [upload for upload in uploads if _file_kind(upload[0], upload[2]) != "pdf"]
+            contents = []
+            metadatas = []
+            for parsed in parse_uploads(other_uploads):
+                if parsed["error"]:
+                    warnings.append(f"Could not parse {parsed['name']}: {parsed['error']}")
+                elif parsed["content"]:
+                    contents.append(parsed["content"])
+                    metadatas.append(parsed["metadata"])
+                report(f"Parsed {parsed['name']}")
+
+            ingest_stats = knowledge_base.ingest_documents(contents, metadatas, batch_size=batch_size)
+            report(f"Embedded {len(contents)} documents")
+            for file_name, data, _ in pdf_uploads:
+                pdf_stats = knowledge_base.ingest_pdf(data, {"source_document": file_name}, batch_size=batch_size)
+                if pdf_stats["documents_failed"]:
+                    warnings.append(f"Could not ingest {file_name}.")
+                for key in ("chunks_embedded", "chunks_unchanged", "chunks_deleted", "documents_skipped", "seconds"):
+                    ingest_stats[key] += pdf_stats[key]
+                report(f"Ingested {file_name}")
+            if ingest_stats["seconds"] > 0:
+                ingest_stats["chunks_per_second"] = ingest_stats["chunks_embedded"] / ingest_stats["seconds"]
+        return {"stats": ingest_stats, "warnings": warnings}
+
+    def query(self, query_text: str, n_results: int = 5, mode: str = "auto", project: str = DEFAULT_PROJECT) -> List[Dict]:
+        with self.telemetry.span("request.query", project=project, mode=mode):
+            with self.projects.use(project) as knowledge_base:
+                records = knowledge_base.query_records(query_text, n_results=n_results, mode=mode)
+        return [{key: value for key, value in record.items() if key != "embedding"} for record in records]
+
+    def generate_test_cases(self, user_query: str, project: str = DEFAULT_PROJECT,
+                            map_reduce: bool = False) -> Union[List[Dict], Dict]:
+        """
+        With `map_reduce`, test cases are generated per feature in parallel and merged
+        (TestCaseAgent.generate_test_cases_map_reduce).
+        """
+        with self._agents(project) as (test_case_agent, _), \
+                self.telemetry.span("request.generate_test_cases", project=project, map_reduce=map_reduce) as request_span:
+            generate = test_case_agent.generate_test_cases_map_reduce if map_reduce else test_case_agent.generate_test_cases
+            result, coalesced = self.coalescer.run(
+                ("test_cases", project, map_reduce, user_query), lambda: generate(user_query)
+            )
+            request_span.set(coalesced=coalesced)
+        return result
+
+    def generate_test_cases_stream(self, user_query: str, project: str = DEFAULT_PROJECT) -> Iterator[Dict]:
+        with self._agents(project) as (test_case_agent, _), \
+                self.telemetry.span("request.generate_test_cases", project=project, stream=True):
+            yield from test_case_agent.generate_test_cases_stream(user_query)
+
+    def generate_selenium_script(self, test_case: Dict, project: str = DEFAULT_PROJECT) -> Dict:
+        with self._agents(project) as (_, selenium_agent), \
+                self.telemetry.span("request.generate_selenium_script", project=project) as request_span:
+            script, coalesced = self.coalescer.run(
+                ("selenium_script", project, json.dumps(test_case, sort_keys=True)),
+                lambda: selenium_agent.generate_selenium_script(test_case)
+            )
+            request_span.set(coalesced=coalesced)
+        return script if isinstance(script, dict) else {"script": script}
+
+    def generate_selenium_scripts(self, test_cases: List[Dict], max_concurrency: int = 4,
+                                  requests_per_second: float = 1.0, project: str = DEFAULT_PROJECT,
+                                  progress_callback: Optional[Callable[[int, int, Dict], None]] = None) -> List[Dict]:
+        with self._agents(project) as (_, selenium_agent), \
+                self.telemetry.span("request.generate_selenium_scripts", project=project):
+            return selenium_agent.generate_selenium_scripts(
+                test_cases, max_concurrency=max_concurrency, requests_per_second=requests_per_second,
+                progress_callback=progress_callback
+            )
+
+    def check_script_runner(self) -> None:
+        """
+        Raises ScriptRunnerDisabledError unless running generated scripts is enabled.
+        """
+        if not self.script_runner_enabled:
+            raise ScriptRunnerDisabledError("Running generated scripts is disabled. Set QA_AGENT_ENABLE_SCRIPT_RUNNER=1 "
+                                            "and QA_AGENT_SERVICE_TOKEN in the service's .env file to enable it.")
+        if self.api_token is None:
+            raise ScriptRunnerDisabledError("Running generated scripts requires QA_AGENT_SERVICE_TOKEN to be set.")
+
+    def run_scripts(self, scripts: List[Dict], html: str, workers: int = 2, dry_run: bool = False,
+                    progress_callback: Optional[Callable[[int, int, Dict], None]] = None) -> List[Dict]:
+        """
+        Runs client-supplied Python, so only when enabled and behind the service token, and never in
+        this process: see script_runner.run_scripts_isolated.
+        """
+        self.check_script_runner()
+        with self.telemetry.span("request.run_scripts", workers=workers, dry_run=dry_run):
+            return run_scripts_isolated(scripts, html, workers=workers, dry_run=dry_run,
+                                        timeout=self.script_run_timeout, script_timeout=self.script_timeout,
+                                        memory_limit_mb=DRY_RUN_MEMORY_LIMIT_MB if dry_run else None,
+                                        progress_callback=progress_callback)
+
+    def close(self) -> None:
+        self.query_batcher.close()
+        self.executor.shutdown(wait=True)
+
+
+class UploadedDocument(BaseModel):
+    name: str
+    data: str # base64
+    type: Optional[str] = None
+
+
+class CreateProjectRequest(BaseModel):
+    name: str
+    description: str = ""
+
+
+class RestoreProjectRequest(BaseModel):
+    snapshot: str # File name returned by /projects/{name}/snapshot
+    name: Optional[str] = None
+
+
+class IngestRequest(BaseModel):
+    documents: List[UploadedDocument]
+    batch_size: int = 64
+    project: str = DEFAULT_PROJECT
+
+
+class QueryRequest(BaseModel):
+    query: str
+    n_results: int = 5
+    mode: Literal["auto", "vector", "lexical", "hybrid"] = "auto" # knowledge_base.QUERY_MODES
+    project: str = DEFAULT_PROJECT
+
+
+class TestCasesRequest(BaseModel):
+    query: str
+    project: str = DEFAULT_PROJECT
+    map_reduce: bool = False
+
+
+class SeleniumScriptRequest(BaseModel):
+    test_case: Dict[str, Any]
+    project: str = DEFAULT_PROJECT
+
+
+class SeleniumScriptsRequest(BaseModel):
+    test_cases: List[Dict[str, Any]]
+    max_concurrency: int = 4
+    requests_per_second: float = 1.0
+    project: str = DEFAULT_PROJECT
+
+
+class RunScriptsRequest(BaseModel):
+    scripts: List[Dict[str, Any]]
+    html: str
+    workers: int = 2
+    dry_run: bool = False
+
+
+def create_app(service_factory: Callable[[], QAService] = QAService) -> FastAPI:
+    """
+    Builds the FastAPI app. The QAService is created on startup and closed on shutdown.
+    """
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        app.state.service = service_factory()
+        try:
+            yield
+        finally:
+            app.state.service.close()
+
+    app = FastAPI(title="Autonomous QA Agent", lifespan=lifespan)
+
+    def service(request: Request) -> QAService:
+        return request.app.state.service
+
+    @app.exception_handler(LLMNotConfiguredError)
+    async def llm_not_configured(request: Request, exc: LLMNotConfiguredError):
+        return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+    @app.exception_handler(ScriptRunnerDisabledError)
+    async def script_runner_disabled(request: Request, exc: ScriptRunnerDisabledError):
+        return JSONResponse(status_code=403, content={"detail": str(exc)})
+
+    @app.middleware("http")
+    async def require_token(request: Request, call_next):
+        if request.url.path != "/health" and not service(request).authorized(request.headers.get("authorization")):
+            return JSONResponse(status_code=401, content={"detail": "Missing or invalid service token."},
+                                headers={"WWW-Authenticate": "Bearer"})
+        return await call_next(request)
+
+    @app.middleware("http")
+    async def trace_request(request: Request, call_next):
+        # Everything the request does is one trace; clients fetch it with GET /traces/{id}.
+        with trace_context() as trace_id:
+            response = await call_next(request)
+        response.headers["X-Trace-Id"] = trace_id
+        return response
+
+    @app.exception_handler(ProjectError)
+    async def project_error(request: Request, exc: ProjectError):
+        status_code = 404 if isinstance(exc, ProjectNotFoundError) else 400
+        return JSONResponse(status_code=status_code, content={"detail": str(exc)})
+
+    @app.get("/health")
+    async def health(request: Request):
+        return await service(request).call(service(request).health)
+
+    @app.get("/stats")
+    async def stats(request: Request):
+        return await service(request).call(service(request).stats)
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics(request: Request):
+        return await service(request).call(service(request).telemetry.prometheus_text)
+
+    @app.get("/traces")
+    async def traces(request: Request, limit: int = 50):
+        return {"traces": (await service(request).call(service(request).telemetry.traces))[:limit]}
+
+    @app.get("/traces/{trace_id}")
+    async def trace(request: Request, trace_id: str):
+        return {"trace_id": trace_id, "spans": await service(request).call(service(request).telemetry.trace, trace_id)}
+
+    @app.get("/projects")
+    async def list_projects(request: Request):
+        return {"projects": await service(request).call(service(request).list_projects)}
+
+    @app.post("/projects")
+    async def create_project(request: Request, body: CreateProjectRequest):
+        return await service(request).call(service(request).create_project, body.name, body.description)
+
+    @app.delete("/projects/{name}")
+    async def drop_project(request: Request, name: str):
+        await service(request).call(service(request).drop_project, name)
+        return {"dropped": name}
+
+    @app.post("/projects/{name}/snapshot")
+    async def snapshot_project(request: Request, name: str):
+        return await service(request).call(service(request).snapshot_project, name)
+
+    @app.get("/snapshots")
+    async def list_snapshots(request: Request):
+        return {"snapshots": await service(request).call(service(request).list_snapshots)}
+
+    @app.post("/projects/restore")
+    async def restore_project(request: Request, body: RestoreProjectRequest):
+        return await service(request).call(service(request).restore_project, body.snapshot, body.name)
+
+    @app.post("/ingest")
+    async def ingest(request: Request, body: IngestRequest):
+        uploads = [(document.name, base64.b64decode(document.data), document.type) for document in body.documents]
+        return await service(request).call(service(request).ingest, uploads, batch_size=body.batch_size,
+                                           project=body.project)
+
+    @app.post("/query")
+    async def query(request: Request, body: QueryRequest):
+        records = await service(request).call(service(request).query, body.query, n_results=body.n_results,
+                                              mode=body.mode, project=body.project)
+        return {"records": records}
+
+    @app.post("/test-cases")
+    async def test_cases(request: Request, body: TestCasesRequest):
+        return await service(request).call(service(request).generate_test_cases, body.query, project=body.project,
+                                           map_reduce=body.map_reduce)
+
+    def ndjson_stream(qa_service: QAService, produce: Callable[[Callable[[Dict], None]], None],
+                      failure: str) -> StreamingResponse:
+        """
+        Streams the dicts that produce(emit) emits as newline-delimited JSON. produce runs in one
+        worker, so its request span stays open across items; an exception ends the stream with
+        {"error": "<failure>: <exception>"}.
+        """
+        loop = asyncio.get_running_loop()
+        items: asyncio.Queue = asyncio.Queue()
+        done = object()
+
+        def emit(item: Dict) -> None:
+            loop.call_soon_threadsafe(items.put_nowait, item)
+
+        def run():
+            try:
+                produce(emit)
+            except Exception as e:
+                emit({"error": f"{failure}: {e}"})
+            finally:
+                loop.call_soon_threadsafe(items.put_nowait, done)
+
+        async def ndjson():
+            producer = asyncio.ensure_future(qa_service.call(run))
+            while True:
+                item = await items.get()
+                if item is done:
+                    break
+                yield json.dumps(item) + "\n"
+            await producer
+
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+    def progress_stream(qa_service: QAService, fn: Callable, failure: str, *args, **kwargs) -> StreamingResponse:
+        """
+        Streams {"progress": {"done", "total", ...}} lines from fn's progress_callback, then
+        {"result": <return value>}.
+        """
+        def produce(emit):
+            def progress(done, total, item):
+                details = {"text": item} if isinstance(item, str) else {"result": item}
+                emit({"progress": {"done": done, "total": total, **details}})
+            emit({"result": fn(*args, progress_callback=progress, **kwargs)})
+        return ndjson_stream(qa_service, produce, failure)
+
+    @app.post("/ingest/stream")
+    async def ingest_stream(request: Request, body: IngestRequest):
+        uploads = [(document.name, base64.b64decode(document.data), document.type) for document in body.documents]
+        return progress_stream(service(request), service(request).ingest, "Ingestion failed", uploads,
+                               batch_size=body.batch_size, project=body.project)
+
+    @app.post("/test-cases/stream")
+    async def test_cases_stream(request: Request, body: TestCasesRequest):
+        qa_service = service(request)
+        await qa_service.call(qa_service.check_agents, body.project) # Fail with 503/404 before the stream starts
+
+        def produce(emit):
+            for item in qa_service.generate_test_cases_stream(body.query, project=body.project):
+                emit(item)
+        return ndjson_stream(qa_service, produce, "Test case stream failed")
+
+    @app.post("/selenium-script")
+    async def selenium_script(request: Request, body: SeleniumScriptRequest):
+        return await service(request).call(service(request).generate_selenium_script, body.test_case,
+                                           project=body.project)
+
+    @app.post("/selenium-scripts")
+    async def selenium_scripts(request: Request, body: SeleniumScriptsRequest):
+        results = await service(request).call(
+            service(request).generate_selenium_scripts, body.test_cases,
+            max_concurrency=body.max_concurrency, requests_per_second=body.requests_per_second,
+            project=body.project
+        )
+        return {"results": results}
+
+    @app.post("/selenium-scripts/stream")
+    async def selenium_scripts_stream(request: Request, body: SeleniumScriptsRequest):
+        qa_service = service(request)
+        await qa_service.call(qa_service.check_agents, body.project) # Fail with 503/404 before the stream starts
+        return progress_stream(qa_service, qa_service.generate_selenium_scripts, "Script generation failed",
+                               body.test_cases, max_concurrency=body.max_concurrency,
+                               requests_per_second=body.requests_per_second, project=body.project)
+
+    @app.post("/run-scripts")
+    async def run_scripts(request: Request, body: RunScriptsRequest):
+        results = await service(request).call(
+            service(request).run_scripts, body.scripts, body.html, workers=body.workers, dry_run=body.dry_run
+        )
+        return {"results": results}
+
+    @app.post("/run-scripts/stream")
+    async def run_scripts_stream(request: Request, body: RunScriptsRequest):
+        qa_service = service(request)
+        qa_service.check_script_runner() # Fail with 403 before the stream starts
+        return progress_stream(qa_service, qa_service.run_scripts, "Script run failed", body.scripts, body.html,
+                               workers=body.workers, dry_run=body.dry_run)
+
+    return app
+
+
+app = create_app()
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the QA agent pipeline over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=None,
+                        help=f"Worker threads for pipeline calls (default: QA_AGENT_SERVICE_WORKERS or {DEFAULT_SERVICE_WORKERS}).")
+    parser.add_argument("--migrate", action="store_true",
+                        help="Re-embed projects stored with another embedding model or backend, rebuild "
+                             "out-of-date BM25 indexes, then exit.")
+    args = parser.parse_args()
+    if args.migrate:
+        ProjectManager(max_open_projects=int(os.getenv("QA_AGENT_MAX_OPEN_PROJECTS", DEFAULT_MAX_OPEN_PROJECTS))).migrate()
+        return
+    # A single process on purpose: the knowledge base and models are shared through it.
+    uvicorn.run(create_app(partial(QAService, workers=args.workers)), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import os
+import json
+import threading
+import base64
+import urllib.parse
+import urllib.request
+import urllib.error
+from typing import List, Dict, Tuple, Optional, Union, Iterable, Iterator, Callable, Any
+
+DEFAULT_SERVICE_URL = "http://127.0.0.1:8000"
+DEFAULT_PROJECT = "default"
+
+
+class ServiceError(Exception):
+    """
+    Raised when the QA service cannot be reached or answers with an error status.
+    """
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class ServiceClient:
+    """
+    Thin HTTP client for service.py, using only the standard library. The base URL defaults to
+    QA_AGENT_SERVICE_URL, then http://127.0.0.1:8000, and the bearer token to
+    QA_AGENT_SERVICE_TOKEN. Pipeline methods take the project to work on. Generation methods
+    return the same shapes as the agents they front (a result, or an {"error": ...} dict).
+    `last_trace_id` is the trace id of the calling thread's last request, and take_trace_ids()
+    returns those of its pipeline (non-GET) requests (see trace()).
+    """
+    def __init__(self, base_url: Optional[str] = None, timeout: float = 600.0, token: Optional[str] = None):
+        self.base_url = (base_url or os.getenv("QA_AGENT_SERVICE_URL") or DEFAULT_SERVICE_URL).rstrip("/")
+        self.token = token or os.getenv("QA_AGENT_SERVICE_TOKEN") or None
+        self.timeout = timeout
+        # Per thread, so sessions sharing one client (e.g. Streamlit's) see their own requests.
+        self._local = threading.local()
+
+    @property
+    def last_trace_id(self) -> Optional[str]:
+        return getattr(self._local, "trace_id", None)
+
+    def take_trace_ids(self) -> List[str]:
+        """
+        Trace ids of the pipeline requests this thread made since the last call, oldest first.
+        """
+        trace_ids = getattr(self._local, "trace_ids", [])
+        self._local.trace_ids = []
+        return trace_ids
+
+    def _remember_trace(self, method: str, headers) -> None:
+        self._local.trace_id = headers.get("X-Trace-Id") if headers else None
+        if method != "GET" and self._local.trace_id:
+            self._local.trace_ids = getattr(self._local, "trace_ids", []) + [self._local.trace_id]
+
+    def _open(self, method: str, path: str, payload: Optional[Dict] = None):
+        data = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if data is not None else {}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        request = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers)
+        try:
+            response = urllib.request.urlopen(request, timeout=self.timeout)
+            self._remember_trace(method, response.headers)
+            return response
+        except urllib.error.HTTPError as e:
+            self._remember_trace(method, e.headers)
+            try:
+                detail = json.loads(e.read().decode("utf-8")).get("detail", e.reason)
+            except Exception:
+                detail = e.reason
+            raise ServiceError(f"{method} {path} failed ({e.code}): {detail}", status=e.code) from e
+        except (urllib.error.URLError, OSError) as e:
+            raise ServiceError(f"Could not reach the QA service at {self.base_url}: {e}") from e
+
+    def _request(self, method: str, path: str, payload: Optional[Dict] = None) -> Union[Dict, List, str]:
+        with self._open(method, path, payload) as response:
+            body = response.read().decode("utf-8")
+            if response.headers.get_content_type() == "application/json":
+                return json.loads(body)
+            return body
+
+    def _progress_stream(self, path: str, payload: Dict, progress_callback: Callable[..., None]) -> Any:
+        """
+        Calls a progress streaming endpoint: passes each {"progress": ...} line to
+        progress_callback(done, total, text or result) and returns the final {"result": ...}.
+        """
+        with self._open("POST", path, payload) as response:
+            for line in response:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                if "progress" in item:
+                    progress = item["progress"]
+                    progress_callback(progress["done"], progress["total"], progress.get("text", progress.get("result")))
+                elif "error" in item:
+                    raise ServiceError(f"POST {path} failed: {item['error']}")
+                elif "result" in item:
+                    return item["result"]
+        raise ServiceError(f"POST {path} ended without a result")
+
+    def health(self) -> Dict:
+        return self._request("GET", "/health")
+
+    def stats(self) -> Dict:
+        return self._request("GET", "/stats")
+
+    def metrics(self) -> str:
+        return self._request("GET", "/metrics")
+
+    def traces(self, limit: int = 50) -> List[List[Dict]]:
+        return self._request("GET", f"/traces?limit={int(limit)}")["traces"]
+
+    def trace(self, trace_id: str) -> List[Dict]:
+        """
+        Spans of one request's trace, e.g. last_trace_id after a pipeline call; empty once the
+        service has dropped it.
+        """
+        return self._request("GET", f"/traces/{urllib.parse.quote(trace_id, safe='')}")["spans"]
+
+    def projects(self) -> List[Dict]:
+        return self._request("GET", "/projects")["projects"]
+
+    def create_project(self, name: str, description: str = "") -> Dict:
+        return self._request("POST", "/projects", {"name": name, "description": description})
+
+    def drop_project(self, name: str) -> None:
+        self._request("DELETE", f"/projects/{urllib.parse.quote(name)}")
+
+    def snapshot_project(self, name: str) -> Dict:
+        """
+        Writes a snapshot file on the service side. Returns its `snapshot` file name, path, chunk
+        count and size.
+        """
+        return self._request("POST", f"/projects/{urllib.parse.quote(name)}/snapshot")
+
+    def snapshots(self) -> List[Dict]:
+        return self._request("GET", "/snapshots")["snapshots"]
+
+    def restore_project(self, snapshot: str, name: Optional[str] = None) -> Dict:
+        """
+        Restores a snapshot by the file name snapshot_project returned.
+        """
+        return self._request("POST", "/projects/restore", {"snapshot": snapshot, "name": name})
+
+    def ingest(self, uploads: Iterable[Tuple[str, bytes, Optional[str]]], batch_size: int = 64,
+               project: str = DEFAULT_PROJECT,
+               progress_callback: Optional[Callable[[int, int, str], None]] = None) -> Dict:
+        """
+        Sends (name, bytes, mime type) uploads to be parsed and ingested into a project (created if
+        needed). Returns {"stats", "warnings"}. With a progress_callback(done, total, text) the
+        service streams progress as each file is parsed and ingested.
+        """
+        documents = [{"name": name, "data": base64.b64encode(data).decode("ascii"), "type": file_type}
+                     for name, data, file_type in uploads]
+        payload = {"documents": documents, "batch_size": batch_size, "project": project}
+        if progress_callback is not None:
+            return self._progress_stream("/ingest/stream", payload, progress_callback)
+        return self._request("POST", "/ingest", payload)
+
+    def query(self, query_text: str, n_results: int = 5, mode: str = "auto",
+              project: str = DEFAULT_PROJECT) -> List[Dict]:
+        return self._request("POST", "/query", {"query": query_text, "n_results": n_results, "mode": mode,
+                                                "project": project})["records"]
+
+    def generate_test_cases(self, user_query: str, project: str = DEFAULT_PROJECT,
+                            map_reduce: bool = False) -> Union[List[Dict], Dict]:
+        return self._request("POST", "/test-cases", {"query": user_query, "project": project, "map_reduce": map_reduce})
+
+    def generate_test_cases_stream(self, user_query: str, project: str = DEFAULT_PROJECT) -> Iterator[Dict]:
+        """
+        Yields test cases as the service streams them (newline-delimited JSON); a final
+        {"error": ...} dict signals failure.
+        """
+        with self._open("POST", "/test-cases/stream", {"query": user_query, "project": project}) as response:
+            for line in response:
+                if line.strip():
+                    yield json.loads(line)
+
+    def generate_selenium_script(self, test_case: Dict, project: str = DEFAULT_PROJECT) -> Union[str, Dict]:
+        result = self._request("POST", "/selenium-script", {"test_case": test_case, "project": project})
+        return result["script"] if "script" in result else result
+
+    def generate_selenium_scripts(self, test_cases: List[Dict], max_concurrency: int = 4,
+                                  requests_per_second: float = 1.0, project: str = DEFAULT_PROJECT,
+                                  progress_callback: Optional[Callable[[int, int, Dict], None]] = None) -> List[Dict]:
+        """
+        With a progress_callback(done, total, result) the results are streamed as each script is generated.
+        """
+        payload = {"test_cases": test_cases, "max_concurrency": max_concurrency,
+                   "requests_per_second": requests_per_second, "project": project}
+        if progress_callback is not None:
+            return self._progress_stream("/selenium-scripts/stream", payload, progress_callback)
+        return self._request("POST", "/selenium-scripts", payload)["results"]
+
+    def run_scripts(self, scripts: List[Dict], html: str, workers: int = 2, dry_run: bool = False,
+                    progress_callback: Optional[Callable[[int, int, Dict], None]] = None) -> List[Dict]:
+        """
+        With a progress_callback(done, total, result) the results are streamed as each script finishes.
+        """
+        payload = {"scripts": scripts, "html": html, "workers": workers, "dry_run": dry_run}
+        if progress_callback is not None:
+            return self._progress_stream("/run-scripts/stream", payload, progress_callback)
+        return self._request("POST", "/run-scripts", payload)["results"]
@@ -1,24 +1,52 @@
 import os
 import json
-from typing import List, Dict, Union, Tuple
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Union, Tuple, Optional, Iterator
 from knowledge_base import KnowledgeBase
+from llm_cache import ResponseCache, get_default_response_cache
+from context_assembler import ContextAssembler
+from json_stream import JSONArrayStreamParser, iter_json_array_objects
+from concurrency import TokenBucket, call_with_retries
+from feature_planner import plan_features, dedupe_by_similarity, renumber_test_ids, test_case_text
+from instrumentation import get_telemetry, run_in_context
 import google.generativeai as genai
 
 class TestCaseAgent:
-    def __init__(self, knowledge_base: KnowledgeBase, api_key: str, llm_model: str = "gemini-2.5-flash"):
+    def __init__(self, knowledge_base: KnowledgeBase, api_key: str, llm_model: str = "gemini-2.5-flash",
+                 response_cache: Optional[ResponseCache] = None, context_token_budget: int = 1500,
+                 retrieval_candidates: int = 20, llm=None):
         self.knowledge_base = knowledge_base
-        genai.configure(api_key=api_key)
-        self.llm = genai.GenerativeModel(llm_model)
+        # Over-fetch candidates, then let the assembler pick a diverse, de-duplicated subset within budget.
+        self.retrieval_candidates = retrieval_candidates
+        self.context_assembler = ContextAssembler(token_budget=context_token_budget)
+        self.llm_model = llm_model
+        # Identical (model, prompt) pairs are answered from the shared cache instead of the API.
+        self.response_cache = response_cache if response_cache is not None else get_default_response_cache()
+        self.telemetry = get_telemetry()
+        if llm is not None:
+            # Any object with a compatible generate_content(), e.g. fake_llm.FakeGenerativeModel
+            self.llm = llm
+        else:
+            genai.configure(api_key=api_key)
+            self.llm = genai.GenerativeModel(llm_model)
 
-    def generate_test_cases(self, user_query: str) -> Union[str, Dict]:
+    def _build_prompt(self, user_query: str, retrieval_query: Optional[str] = None) -> str:
         """
-        Generates test cases based on user query and retrieved context using an LLM.
+        Retrieves and assembles context for the user query (or a separate `retrieval_query`) and
+        builds the LLM prompt.
         """
         # 1. Embed the user's query and retrieve relevant chunks
-        retrieved_documents, retrieved_metadatas = self.knowledge_base.query(user_query, n_results=7)
+        retrieval_query = retrieval_query or user_query
+        retrieved_records = self.knowledge_base.query_records(retrieval_query, n_results=self.retrieval_candidates)
+        with self.telemetry.span("context.assemble", retrieved=len(retrieved_records)) as assemble_span:
+            context = self.context_assembler.assemble(
+                retrieved_records, self.knowledge_base.embed_query(retrieval_query) if retrieved_records else None
+            )
+            assemble_span.set(used=context["used"], context_tokens=context["tokens"])
 
-        context_str = "\n\n".join([doc for doc in retrieved_documents])
-        source_documents = ", ".join(list(set([meta['source_document'] for meta in retrieved_metadatas])))
+        context_str = context["text"]
+        source_documents = ", ".join(context["sources"])
 
         # 2. Construct the prompt for the LLM
         prompt = f"""
@@ -60,11 +88,54 @@ class TestCaseAgent:
             }}
         ]
         """
+        return prompt
+
+    def _record_llm_call(self, prompt: str, response_text: str, cached: bool, **attributes) -> Dict:
+        """
+        Counts prompt/response tokens and cache hits for one LLM request; returns them as span attributes.
+        """
+        prompt_tokens = self.context_assembler.token_counter(prompt)
+        response_tokens = self.context_assembler.token_counter(response_text) if response_text else 0
+        self.telemetry.increment("llm_requests_total", agent="test_case", cache="hit" if cached else "miss")
+        self.telemetry.increment("llm_prompt_tokens_total", prompt_tokens, agent="test_case")
+        self.telemetry.increment("llm_response_tokens_total", response_tokens, agent="test_case")
+        return dict(attributes, model=self.llm_model, cache_hit=cached,
+                    prompt_tokens=prompt_tokens, response_tokens=response_tokens)
+
+    def _generate(self, prompt: str) -> str:
+        """
+        Calls the LLM once, inside an `llm.generate_content` span.
+        """
+        with self.telemetry.span("llm.generate_content", agent="test_case") as llm_span:
+            response_text = self.llm.generate_content(prompt).text
+            llm_span.set(**self._record_llm_call(prompt, response_text, cached=False))
+        return response_text
+
+    def generate_test_cases(self, user_query: str) -> Union[str, Dict]:
+        """
+        Generates test cases based on user query and retrieved context using an LLM.
+        """
+        with self.telemetry.span("test_case_agent.generate_test_cases") as generate_span:
+            result = self._generate_test_cases(user_query)
+            generate_span.set(test_cases=len(result) if isinstance(result, list) else 0,
+                              error="error" in result if isinstance(result, dict) else False)
+        return result
+
+    def _generate_test_cases(self, user_query: str, retrieval_query: Optional[str] = None,
+                             rate_limiter: Optional[TokenBucket] = None, max_retries: int = 0) -> Union[str, Dict]:
+        with self.telemetry.span("test_case_agent.build_prompt"):
+            prompt = self._build_prompt(user_query, retrieval_query)
 
         # 3. Feed retrieved context + user query into an LLM (Gemini API)
         try:
-            response = self.llm.generate_content(prompt)
-            llm_output = response.text
+            cached_output = self.response_cache.get(self.llm_model, prompt)
+            if cached_output is not None:
+                llm_output = cached_output
+                self._record_llm_call(prompt, cached_output, cached=True)
+            else:
+                llm_output, _ = call_with_retries(lambda: self._generate(prompt), max_retries=max_retries,
+                                                  rate_limiter=rate_limiter)
+            raw_output = llm_output
             
             # Extract JSON from markdown code block if present
             if llm_output.strip().startswith("```json") and llm_output.strip().endswith("```"):
@@ -74,12 +145,132 @@ class TestCaseAgent:
             try:
                 parsed_output = json.loads(llm_output)
                 if isinstance(parsed_output, list): # Ensure the output is a list of test cases
+                    if cached_output is None:
+                        # Only well-formed plans are cached, so a bad response is retried next time.
+                        self.response_cache.set(self.llm_model, prompt, raw_output)
                     return parsed_output
                 else:
                     print("Warning: LLM output was valid JSON but not a list. Returning error.")
                     return {"error": "LLM output was valid JSON but not a list of test cases."}
             except json.JSONDecodeError:
+                # Keep every well-formed test case instead of discarding the whole plan.
+                salvaged = list(iter_json_array_objects([raw_output]))
+                if salvaged:
+                    print(f"Warning: LLM output was not fully valid JSON. Recovered {len(salvaged)} test cases.")
+                    return salvaged
                 print("Warning: LLM output was not valid JSON. Returning error.")
                 return {"error": "LLM output was not valid JSON. Please refine your query or context."}
         except Exception as e:
             return {"error": f"Failed to generate test cases with Gemini API: {e}. Ensure your API key is correct and you have access to the '{self.llm_model}' model."}
+
+    def generate_test_cases_map_reduce(self, user_query: str, max_features: int = 12, max_concurrency: int = 4,
+                                       requests_per_second: float = 2.0, max_retries: int = 3,
+                                       similarity_threshold: float = 0.92, id_prefix: str = "TC") -> Union[List[Dict], Dict]:
+        """
+        Map-reduce variant of generate_test_cases for large specs.
+
+        Derives the features to cover from the knowledge base (spec headings, forms and sections of
+        the ingested HTML), then generates test cases for each feature in parallel with its own
+        focused retrieval, so every completion stays short. At most `max_concurrency` features are
+        in flight and LLM calls are throttled to `requests_per_second` with retries. The merged
+        plan drops near-duplicate scenarios (embedding cosine >= `similarity_threshold`) and is
+        renumbered `TC-001`, `TC-002`, ... Falls back to a single generation when no features are
+        found; returns an {"error": ...} dict only if every feature failed.
+        """
+        with self.telemetry.span("test_case_agent.generate_test_cases_map_reduce") as map_reduce_span:
+            with self.telemetry.span("test_case_agent.plan_features") as plan_span:
+                features = plan_features(self.knowledge_base.chunk_texts(), self.knowledge_base.dom_index.indexes,
+                                         max_features=max_features)
+                plan_span.set(features=len(features))
+            if not features:
+                print("No features found in the knowledge base. Generating test cases in one pass.")
+                return self._generate_test_cases(user_query)
+
+            rate_limiter = TokenBucket(requests_per_second, capacity=max(1.0, float(max_concurrency)))
+
+            def generate_feature(feature: Dict) -> Union[List[Dict], Dict]:
+                feature_query = (f'{user_query}\nFocus only on the feature "{feature["name"]}" '
+                                 f'(other features are covered separately).')
+                with self.telemetry.span("test_case_agent.generate_feature", feature=feature["name"]) as feature_span:
+                    result = self._generate_test_cases(feature_query, retrieval_query=feature["retrieval_query"],
+                                                       rate_limiter=rate_limiter, max_retries=max_retries)
+                    feature_span.set(test_cases=len(result) if isinstance(result, list) else 0,
+                                     error="error" in result if isinstance(result, dict) else False)
+                return result
+
+            results: List[Union[List[Dict], Dict, None]] = [None] * len(features)
+            with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+                # Each worker runs in a copy of this context so its spans nest under the map-reduce span.
+                futures = {executor.submit(run_in_context(generate_feature), feature): index
+                           for index, feature in enumerate(features)}
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+
+            test_cases = []
+            errors = []
+            for feature, result in zip(features, results):
+                if isinstance(result, dict):
+                    errors.append(f"{feature['name']}: {result.get('error')}")
+                    continue
+                for test_case in result:
+                    if isinstance(test_case, dict):
+                        test_cases.append(dict(test_case, Feature=test_case.get("Feature") or feature["name"]))
+            if errors and not test_cases:
+                return {"error": "Failed to generate test cases for every feature. " + " ".join(errors)}
+            for error in errors:
+                print(f"Warning: skipped feature {error}")
+
+            with self.telemetry.span("test_case_agent.dedupe", test_cases=len(test_cases)) as dedupe_span:
+                texts = [test_case_text(test_case) for test_case in test_cases]
+                embeddings = self.knowledge_base.embedding_model.encode(texts) if texts else []
+                test_cases, dropped = dedupe_by_similarity(test_cases, embeddings, threshold=similarity_threshold)
+                dedupe_span.set(dropped=dropped)
+            test_cases = renumber_test_ids(test_cases, prefix=id_prefix)
+            map_reduce_span.set(features=len(features), failed_features=len(errors), test_cases=len(test_cases))
+        return test_cases
+
+    def generate_test_cases_stream(self, user_query: str) -> Iterator[Dict]:
+        """
+        Streaming variant of generate_test_cases: consumes the model's streamed response and yields
+        each test case as soon as its JSON object is complete. Malformed elements are skipped.
+        On failure a final {"error": ...} dict is yielded.
+        """
+        with self.telemetry.span("test_case_agent.build_prompt"):
+            prompt = self._build_prompt(user_query)
+        cached_output = self.response_cache.get(self.llm_model, prompt)
+        if cached_output is not None:
+            self._record_llm_call(prompt, cached_output, cached=True)
+            yield from iter_json_array_objects([cached_output])
+            return
+
+        parser = JSONArrayStreamParser()
+        streamed_text = []
+        # The span cannot stay open across yields, so the stream is timed by hand and recorded at the end.
+        started_at = time.time()
+        start_time = time.perf_counter()
+        first_chunk_seconds = None
+        try:
+            response = self.llm.generate_content(prompt, stream=True)
+            for chunk in response:
+                if first_chunk_seconds is None:
+                    first_chunk_seconds = time.perf_counter() - start_time
+                streamed_text.append(chunk.text)
+                yield from parser.feed(chunk.text)
+        except Exception as e:
+            self.telemetry.record_span("llm.generate_content", time.perf_counter() - start_time, start=started_at,
+                                       agent="test_case", stream=True, error=type(e).__name__)
+            yield {"error": f"Failed to generate test cases with Gemini API: {e}. Ensure your API key is correct and you have access to the '{self.llm_model}' model."}
+            return
+        self.telemetry.record_span(
+            "llm.generate_content", time.perf_counter() - start_time, start=started_at,
+            **self._record_llm_call(prompt, "".join(streamed_text), cached=False, agent="test_case", stream=True,
+                                    first_chunk_seconds=first_chunk_seconds, test_cases=parser.parsed)
+        )
+
+        if parser.parsed == 0:
+            yield {"error": "LLM output did not contain any valid test cases. Please refine your query or context."}
+        elif parser.malformed == 0 and parser.finished:
+            # Only complete, well-formed plans are cached.
+            self.response_cache.set(self.llm_model, prompt, "".join(streamed_text))
+        else:
+            print(f"Warning: skipped {parser.malformed} malformed test case(s) in the streamed LLM output.")
@@ -0,0 +1,64 @@
+import os
+import re
+import sys
+import math
+import hashlib
+from typing import List, Optional
+
+import pytest
+
+# The modules live side by side in qa_agent_project/ and import each other by plain name.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import embeddings
+
+_WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+class WordTokenizer:
+    def tokenize(self, text: str) -> List[str]:
+        return _WORD_PATTERN.findall(text)
+
+    def encode(self, text: str, add_special_tokens: bool = False) -> List[str]:
+        return self.tokenize(text)
+
+
+class HashingEmbeddingModel(embeddings.EmbeddingModel):
+    """
+    Deterministic bag-of-words vectors, so knowledge base tests need neither transformers nor
+    torch. `encoded` counts the texts embedded by this instance.
+    """
+    dimensions = 32
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.encoded = 0
+
+    def _load_tokenizer(self) -> None:
+        self._tokenizer = WordTokenizer()
+
+    def _load(self) -> None:
+        self._load_tokenizer()
+        self._model = object()
+
+    def encode(self, texts: List[str], batch_size: Optional[int] = None) -> List[List[float]]:
+        self._load()
+        self.encoded += len(texts)
+        vectors = []
+        for text in texts:
+            vector = [0.0] * self.dimensions
+            for word in re.findall(r"\w+", text.lower()):
+                vector[int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % self.dimensions] += 1.0
+            norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+            vectors.append([value / norm for value in vector])
+        return vectors
+
+
+@pytest.fixture
+def fake_embeddings(monkeypatch):
+    """
+    Makes get_embedding_model() hand out HashingEmbeddingModel instances from an empty registry.
+    """
+    monkeypatch.setattr(embeddings, "EmbeddingModel", HashingEmbeddingModel)
+    monkeypatch.setattr(embeddings, "_registry", {})
+    return embeddings.get_embedding_model
@@ -0,0 +1,106 @@
+import json
+
+from chunkers import chunk_document, chunk_markdown, chunk_text, chunk_json, chunk_html, document_type
+
+MARKDOWN = """# Checkout
+
+Intro text.
+
+## Discounts
+Code SAVE15 takes 15% off.
+
+```
+# not a heading
+```
+
+### Stacking
+Codes cannot be combined.
+
+## Shipping
+Express costs 10 dollars.
+"""
+
+TEXT = """Checkout Guidelines
+
+Error Display
+Errors are shown in red below the field.
+
+Pay Button
+The button turns green when the form is valid.
+"""
+
+HTML = """<html><head><title>Shop</title><style>.x { color: red }</style></head><body>
+<p>Welcome banner</p>
+<div id="cart"><h2>Your Cart</h2><span>1 item</span></div>
+<form id="details"><fieldset><legend>Address</legend><input id="street"></fieldset>
+<button id="pay">Pay</button></form>
+<!-- <div id="old">removed</div> -->
+</body></html>"""
+
+
+def paths(chunks):
+    return [metadata["structure_path"] for _, metadata in chunks]
+
+
+def test_markdown_is_chunked_by_heading():
+    chunks = chunk_markdown(MARKDOWN)
+    assert paths(chunks) == ["Checkout", "Checkout > Discounts", "Checkout > Discounts > Stacking",
+                             "Checkout > Shipping"]
+    assert [metadata.get("section") for _, metadata in chunks] == [None, "Discounts", "Stacking", "Shipping"]
+    text, _ = chunks[1]
+    assert text.startswith("Checkout > Discounts\nCode SAVE15")
+    # A heading inside a code fence stays in its section.
+    assert "# not a heading" in text
+
+
+def test_text_is_chunked_by_title_like_lines():
+    chunks = chunk_text(TEXT)
+    assert paths(chunks) == ["Checkout Guidelines > Error Display", "Checkout Guidelines > Pay Button"]
+    assert chunks[1][0] == "Checkout Guidelines > Pay Button\nThe button turns green when the form is valid."
+
+
+def test_json_gets_one_chunk_per_record():
+    spec = {"api_version": "v1", "endpoints": [
+        {"method": "POST", "path": "/api/apply_coupon", "body": {"code": "string"}},
+        {"method": "GET", "path": "/api/cart"}]}
+    chunks = chunk_json(json.dumps(spec))
+    assert paths(chunks) == ["$", "$.endpoints[0]", "$.endpoints[1]"]
+    assert chunks[0][0] == '$\n{"api_version": "v1"}'
+    header, body = chunks[1][0].split("\n", 1)
+    assert header == "$.endpoints[0] POST /api/apply_coupon"
+    assert json.loads(body) == spec["endpoints"][0]
+    assert chunk_json("not json, just text") == chunk_text("not json, just text")
+
+
+def test_html_is_chunked_by_form_and_section():
+    chunks = chunk_html(HTML)
+    assert paths(chunks) == ["Shop", "Shop > Your Cart [div#cart]", "Shop > form#details"]
+    page, cart, form = (text for text, _ in chunks)
+    assert "Welcome banner" in page and "color: red" not in page and 'id="old"' not in page
+    assert "1 item" in cart and "1 item" not in page
+    # The fieldset belongs to its form.
+    assert 'id="street"' in form and 'id="pay"' in form
+
+
+def test_commented_out_html_is_chunked_from_the_comments():
+    chunks = chunk_html("<html><body><!-- <form id=\"coupon\"><h3>Coupon</h3><input id=\"code\"></form> --></body></html>")
+    assert paths(chunks) == ["Coupon [form#coupon]"]
+    assert 'id="code"' in chunks[0][0]
+
+
+def test_only_large_sections_are_split():
+    body = " ".join(f"Rule {index} applies to every order." for index in range(100))
+    chunks = chunk_markdown(f"# Spec\n\n## Rules\n{body}\n\n## Short\nOne line.\n", max_chars=300, overlap=50)
+    assert len(chunks) > 2
+    assert all(len(text) <= 300 for text, _ in chunks)
+    assert all(text.startswith("Spec > Rules\n") for text, _ in chunks[:-1])
+    assert chunks[-1][0] == "Spec > Short\nOne line."
+
+
+def test_document_type_and_dispatch():
+    assert document_type({"source_document": "specs.MD"}) == "markdown"
+    assert document_type({"source_document": "page.htm"}) == "html"
+    assert document_type({"source_document": "notes.rst"}) == "text"
+    assert document_type({"source_document": "api.txt", "type": "json"}) == "json"
+    assert chunk_document(MARKDOWN, {"source_document": "spec.md"}) == chunk_markdown(MARKDOWN)
+    assert chunk_document(HTML, {"source_document": "checkout.html"}) == chunk_html(HTML)
@@ -0,0 +1,146 @@
+import threading
+import time
+
+import pytest
+
+import concurrency
+from concurrency import TokenBucket, RequestCoalescer, call_with_retries, is_transient_error
+
+
+class StatusError(Exception):
+    def __init__(self, code):
+        super().__init__(f"status {code}")
+        self.code = code
+
+
+class ResourceExhausted(Exception):
+    pass
+
+
+def test_token_bucket_allows_a_burst_then_paces_to_the_rate():
+    bucket = TokenBucket(rate=20, capacity=3)
+    start = time.monotonic()
+    assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert time.monotonic() - start < 0.05
+    waited = sum(bucket.acquire() for _ in range(4))
+    # Four more tokens at 20 per second take about 0.2 seconds.
+    assert 0.15 <= waited <= 0.4
+    assert time.monotonic() - start >= 0.15
+
+
+def test_token_bucket_is_shared_between_threads():
+    bucket = TokenBucket(rate=50, capacity=1)
+    start = time.monotonic()
+    threads = [threading.Thread(target=bucket.acquire) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # One token up front, then five at 50 per second.
+    assert time.monotonic() - start >= 0.09
+
+
+def test_token_bucket_rejects_a_non_positive_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+
+
+def test_transient_errors():
+    assert is_transient_error(TimeoutError())
+    assert is_transient_error(ConnectionResetError())
+    assert is_transient_error(StatusError(429)) and is_transient_error(StatusError(503))
+    assert is_transient_error(ResourceExhausted())
+    assert not is_transient_error(StatusError(400))
+    assert not is_transient_error(ValueError("bad prompt"))
+
+
+def test_retries_transient_errors_only(monkeypatch):
+    monkeypatch.setattr(concurrency.time, "sleep", lambda seconds: None)
+    failures = [StatusError(503), TimeoutError()]
+
+    def flaky():
+        if failures:
+            raise failures.pop(0)
+        return "ok"
+    assert call_with_retries(flaky, max_retries=3) == ("ok", 3)
+
+    calls = []
+
+    def permanent():
+        calls.append(1)
+        raise StatusError(400)
+    with pytest.raises(StatusError):
+        call_with_retries(permanent, max_retries=3)
+    assert len(calls) == 1
+
+    def always_failing():
+        calls.append(1)
+        raise TimeoutError()
+    calls.clear()
+    with pytest.raises(TimeoutError):
+        call_with_retries(always_failing, max_retries=2)
+    assert len(calls) == 3
+
+
+def test_coalescer_runs_identical_concurrent_calls_once():
+    coalescer = RequestCoalescer()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "plan"
+    results = []
+
+    def request():
+        results.append(coalescer.run("same prompt", slow))
+    leader = threading.Thread(target=request)
+    leader.start()
+    assert started.wait(5)
+    followers = [threading.Thread(target=request) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    while coalescer.stats()["coalesced"] < 3:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(results) == [("plan", False)] + [("plan", True)] * 3
+    assert coalescer.stats() == {"executed": 1, "coalesced": 3, "in_flight": 0}
+    assert coalescer.run("same prompt", lambda: "again") == ("again", False)
+
+
+def test_coalescer_shares_exceptions_and_keeps_keys_apart():
+    coalescer = RequestCoalescer()
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("quota")
+    errors = []
+
+    def request():
+        try:
+            coalescer.run("key", failing)
+        except RuntimeError as e:
+            errors.append(str(e))
+    leader = threading.Thread(target=request)
+    leader.start()
+    assert started.wait(5)
+    follower = threading.Thread(target=request)
+    follower.start()
+    while coalescer.stats()["coalesced"] < 1:
+        time.sleep(0.001)
+    assert coalescer.run("other key", lambda: 42) == (42, False)
+    release.set()
+    leader.join()
+    follower.join()
+    assert errors == ["quota", "quota"]
+    assert coalescer.stats() == {"executed": 2, "coalesced": 1, "in_flight": 0}
@@ -0,0 +1,75 @@
+from context_assembler import ContextAssembler, mmr_order, merge_overlapping
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def record(document, source="spec.md", embedding=None):
+    return {"document": document, "metadata": {"source_document": source}, "embedding": embedding}
+
+
+def words(prefix, count):
+    return " ".join(f"{prefix}{index}" for index in range(count))
+
+
+def test_mmr_prefers_diverse_chunks_over_near_duplicates():
+    best = record("best", embedding=[1.0, 0.01])
+    duplicate = record("duplicate", embedding=[1.0, 0.0])
+    different = record("different", embedding=[0.0, 1.0])
+    unembedded = record("unembedded")
+    ordered = mmr_order([duplicate, unembedded, different, best], [1.0, 1.0], mmr_lambda=0.5)
+    assert [item["document"] for item in ordered] == ["best", "different", "duplicate", "unembedded"]
+    ordered = mmr_order([duplicate, different, best], [1.0, 1.0], mmr_lambda=1.0)
+    assert ordered[0] is best
+
+
+def test_merge_overlapping():
+    first = "The discount code SAVE10 applies to orders over fifty dollars"
+    second = "applies to orders over fifty dollars and cannot be combined"
+    assert merge_overlapping(first, second) == first + " and cannot be combined"
+    assert merge_overlapping(first, "orders over fifty") == first
+    assert merge_overlapping(second, first) is None
+    assert merge_overlapping(first, "unrelated text that shares nothing at all") is None
+
+
+def test_overlapping_chunks_of_one_source_are_merged_once():
+    head = words("a", 30)
+    tail = words("b", 30)
+    overlap = words("o", 10)
+    records = [record(f"{head} {overlap}"), record(f"{overlap} {tail}"), record(words("c", 20), source="ui.txt")]
+    assembler = ContextAssembler(token_budget=1000, token_counter=count_words)
+    context = assembler.assemble(records)
+    assert context["used"] == 3 and context["retrieved"] == 3
+    assert context["sources"] == ["spec.md", "ui.txt"]
+    assert context["text"].count(overlap) == 1
+    assert f"{head} {overlap} {tail}" in context["text"]
+    assert context["tokens"] == count_words(context["text"])
+
+
+def test_budget_includes_the_approximation_margin():
+    records = [record(words(f"s{index}_", 40), source=f"doc{index}.md") for index in range(5)]
+    # 42 words per segment, header included: two fit in 150 / 1.2 = 125 tokens, three (126) do not.
+    context = ContextAssembler(token_budget=150, token_counter=count_words).assemble(records)
+    assert context["used"] == 2
+    assert context["tokens"] == 84 <= 150 / 1.2
+    exact = ContextAssembler(token_budget=150, token_counter=count_words, approximation_margin=0).assemble(records)
+    assert exact["used"] == 3 and exact["tokens"] == 126
+
+
+def test_oversized_best_chunk_is_truncated_to_the_budget():
+    context = ContextAssembler(token_budget=50, token_counter=count_words).assemble([record(words("w", 500))])
+    assert context["used"] == 1
+    assert 0 < context["tokens"] <= 50 / 1.2
+    assert context["text"].startswith("[Source: spec.md]\nw0 w1")
+
+
+def test_chunks_are_counted_once():
+    counted = []
+
+    def counter(text):
+        counted.append(text)
+        return count_words(text)
+    records = [record(words(f"s{index}_", 20), source=f"doc{index}.md") for index in range(10)]
+    ContextAssembler(token_budget=10000, token_counter=counter).assemble(records)
+    assert sum(1 for text in counted if text.startswith("s")) == 10
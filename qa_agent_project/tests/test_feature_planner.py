@@ -0,0 +1,65 @@
+import math
+
+import feature_planner
+from feature_planner import plan_features, dedupe_by_similarity, renumber_test_ids, spec_headings
+
+
+def unit(*values):
+    norm = math.sqrt(sum(value * value for value in values))
+    return [value / norm for value in values]
+
+
+def test_near_duplicates_are_dropped_in_order():
+    items = [{"Test_ID": "A"}, {"Test_ID": "B"}, {"Test_ID": "C"}, {"Test_ID": "D"}]
+    embeddings = [unit(1, 0), unit(1, 0.1), unit(0, 1), unit(0.05, 1)]
+    kept, dropped = dedupe_by_similarity(items, embeddings, threshold=0.95)
+    assert [item["Test_ID"] for item in kept] == ["A", "C"]
+    assert dropped == 2
+    kept, dropped = dedupe_by_similarity(items, embeddings, threshold=0.999)
+    assert (len(kept), dropped) == (4, 0)
+    assert dedupe_by_similarity([], []) == ([], 0)
+
+
+def test_test_ids_are_renumbered_across_the_merged_plan():
+    merged = [{"Test_ID": "TC-001", "Feature": "Discounts"}, {"Test_ID": "TC-001", "Feature": "Shipping"},
+              {"Test_ID": "TC-002", "Feature": "Shipping"}]
+    renumbered = renumber_test_ids(merged)
+    assert [test_case["Test_ID"] for test_case in renumbered] == ["TC-001", "TC-002", "TC-003"]
+    assert [test_case["Feature"] for test_case in renumbered] == ["Discounts", "Shipping", "Shipping"]
+    assert merged[0]["Test_ID"] == merged[1]["Test_ID"] == "TC-001"
+    assert renumber_test_ids([{}] * 1000, prefix="UI")[-1]["Test_ID"] == "UI-1000"
+    assert renumber_test_ids([{}] * 2, start=999)[0]["Test_ID"] == "TC-0999"
+
+
+def test_case_text_falls_back_to_the_feature_name():
+    test_case = {"Test_Scenario": "Apply SAVE15", "Expected_Result": "15% off"}
+    assert feature_planner.test_case_text(test_case, feature="Discounts") == "Discounts | Apply SAVE15 | 15% off"
+    assert feature_planner.test_case_text(dict(test_case, Feature="Coupons"), feature="Discounts").startswith("Coupons |")
+
+
+def test_spec_headings():
+    assert spec_headings("# Title\n\n## Discounts\nText\n### Stacking\nMore") == ["Discounts", "Stacking"]
+    assert spec_headings("Intro line.\n\nError Display\nErrors are red.\n") == ["Error Display"]
+
+
+def test_spec_and_page_features_are_interleaved_and_merged():
+    chunks = [("...", {"source_document": "spec.md", "structure_path": "Spec > Discounts", "section": "Discounts"}),
+              ("...", {"source_document": "ui.txt", "structure_path": "UI > Discounts", "section": "Discounts"}),
+              ("...", {"source_document": "spec.md", "structure_path": "Spec > Shipping", "section": "Shipping"}),
+              ("...", {"source_document": "spec.md", "structure_path": "Spec"}),
+              ("## Legacy Heading\nOld chunk", {"source_document": "old.md"}),
+              ("<form>", {"source_document": "checkout.html", "type": "html", "structure_path": "Shop"})]
+    dom_indexes = {"checkout.html": {
+        "forms": [{"id": "user_details", "elements": ["name", "email", "#submit"]}],
+        "elements": [{"id": "shipping_express", "interactive": True, "section": "Shipping"},
+                     {"id": "pay_now", "interactive": True, "section": "Payment Method"},
+                     {"id": "email", "interactive": True, "form": "user_details", "section": "Your Details"}]}}
+    features = plan_features(chunks, dom_indexes)
+    assert [feature["name"] for feature in features] == [
+        "Discounts", "User Details Form", "Shipping", "Payment Method", "Legacy Heading"]
+    assert features[0]["sources"] == ["spec.md", "ui.txt"]
+    assert features[1]["retrieval_query"] == "User Details Form name email"
+    # A page section named like a spec section is covered by the spec feature.
+    assert features[2]["sources"] == ["spec.md"]
+    assert [feature["name"] for feature in plan_features(chunks, dom_indexes, max_features=2)] == [
+        "Discounts", "User Details Form"]
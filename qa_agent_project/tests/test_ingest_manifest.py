@@ -0,0 +1,121 @@
+import os
+import json
+
+from ingest_manifest import IngestManifest, content_hash
+from knowledge_base import KnowledgeBase
+
+SPEC = """# Checkout
+
+## Discount codes
+A valid discount code reduces the order total by the advertised percentage.
+
+## Payment
+Card numbers are validated before the order is submitted.
+"""
+METADATA = {"source_document": "spec.md", "type": "markdown"}
+
+
+def open_knowledge_base(path, model_name="hashing-model"):
+    return KnowledgeBase(persist_directory=str(path), embedding_model_name=model_name, collection_name="test")
+
+
+def test_content_hash_covers_metadata():
+    assert content_hash("text") == content_hash("text")
+    assert content_hash("text", {"a": 1, "b": 2}) == content_hash("text", {"b": 2, "a": 1})
+    assert content_hash("text", {"a": 1}) != content_hash("text", {"a": 2}) != content_hash("text")
+
+
+def test_manifest_round_trip(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    manifest = IngestManifest(path, "model-a")
+    manifest.update("spec.md", "hash", {"chunk-1": "h1"})
+    manifest.save()
+    reloaded = IngestManifest(path, "model-a")
+    assert reloaded.is_unchanged("spec.md", "hash")
+    assert not reloaded.is_unchanged("spec.md", "other")
+    assert reloaded.chunk_ids("spec.md") == ["chunk-1"]
+    assert not reloaded.model_changed
+
+
+def test_manifest_for_another_model_starts_empty(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    manifest = IngestManifest(path, "model-a")
+    manifest.update("spec.md", "hash", {"chunk-1": "h1"})
+    manifest.save()
+    reloaded = IngestManifest(path, "model-b")
+    assert reloaded.model_changed
+    assert reloaded.documents == {}
+
+
+def test_unreadable_manifest_starts_empty(tmp_path):
+    path = tmp_path / "manifest.json"
+    path.write_text("{not json", encoding="utf-8")
+    manifest = IngestManifest(str(path), "model-a")
+    assert manifest.documents == {} and not manifest.model_changed
+
+
+def test_unchanged_documents_are_skipped(tmp_path, fake_embeddings):
+    knowledge_base = open_knowledge_base(tmp_path)
+    first = knowledge_base.ingest_documents([SPEC], [METADATA])
+    assert first["chunks_embedded"] > 0 and first["documents_skipped"] == 0
+    encoded = knowledge_base.embedding_model.encoded
+
+    second = open_knowledge_base(tmp_path).ingest_documents([SPEC], [METADATA])
+    assert second["documents_skipped"] == 1 and second["chunks_embedded"] == 0
+    assert knowledge_base.embedding_model.encoded == encoded
+
+
+def test_only_changed_chunks_are_embedded(tmp_path, fake_embeddings):
+    knowledge_base = open_knowledge_base(tmp_path)
+    first = knowledge_base.ingest_documents([SPEC], [METADATA])
+    changed = SPEC.replace("before the order is submitted", "with the Luhn checksum")
+    stats = knowledge_base.ingest_documents([changed], [METADATA])
+    assert stats["documents_skipped"] == 0
+    assert stats["chunks_unchanged"] >= 1
+    assert stats["chunks_embedded"] >= 1 and stats["chunks_deleted"] == stats["chunks_embedded"]
+    assert knowledge_base.collection.count() == first["chunks_embedded"]
+
+
+def test_model_change_is_migrated_explicitly(tmp_path, fake_embeddings):
+    old = open_knowledge_base(tmp_path, "model-a")
+    old.ingest_documents([SPEC], [METADATA])
+    chunks = old.collection.count()
+
+    new = open_knowledge_base(tmp_path, "model-b")
+    assert new.embedding_model is not old.embedding_model
+    assert new.needs_migration and new.embedding_model.encoded == 0
+    assert new.migrate() == {"lexical_index_rebuilt": False, "chunks_reembedded": chunks}
+    assert new.embedding_model.encoded == chunks
+    assert new.collection.count() == chunks
+    assert not new.needs_migration and new.migrate()["chunks_reembedded"] == 0
+    with open(KnowledgeBase.state_files(str(tmp_path), "test")["manifest"], encoding="utf-8") as f:
+        assert json.load(f)["embedding_model"] == "model-b"
+    assert not open_knowledge_base(tmp_path, "model-b").needs_migration
+
+
+def test_pending_migration_survives_a_restart(tmp_path, fake_embeddings):
+    open_knowledge_base(tmp_path, "model-a").ingest_documents([SPEC, "Shipping is free."],
+                                                              [METADATA, {"source_document": "shipping.txt"}])
+    open_knowledge_base(tmp_path, "model-b").ingest_documents([SPEC], [METADATA])
+    # shipping.txt still has model-a vectors, so the change is not forgotten.
+    assert open_knowledge_base(tmp_path, "model-b").needs_migration
+
+
+def test_missing_lexical_index_is_rebuilt_by_migrate(tmp_path, fake_embeddings):
+    open_knowledge_base(tmp_path).ingest_documents([SPEC], [METADATA])
+    os.remove(KnowledgeBase.state_files(str(tmp_path), "test")["lexical_index"])
+    knowledge_base = open_knowledge_base(tmp_path)
+    assert knowledge_base.needs_migration and len(knowledge_base.lexical_index) == 0
+    encoded = knowledge_base.embedding_model.encoded
+    assert knowledge_base.migrate() == {"lexical_index_rebuilt": True, "chunks_reembedded": 0}
+    assert len(knowledge_base.lexical_index) == knowledge_base.collection.count()
+    assert knowledge_base.embedding_model.encoded == encoded
+
+
+def test_chunks_from_another_model_are_not_reused_on_ingest(tmp_path, fake_embeddings):
+    old = open_knowledge_base(tmp_path, "model-a")
+    chunks = old.ingest_documents([SPEC], [METADATA])["chunks_embedded"]
+    new = open_knowledge_base(tmp_path, "model-b")
+    stats = new.ingest_documents([SPEC], [METADATA])
+    assert (stats["chunks_unchanged"], stats["chunks_embedded"], stats["chunks_deleted"]) == (0, chunks, 0)
+    assert new.collection.count() == chunks
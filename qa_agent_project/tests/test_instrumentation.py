@@ -0,0 +1,43 @@
+import contextvars
+import threading
+
+from instrumentation import Telemetry, trace_context, run_in_context
+
+
+def names(spans):
+    return sorted(span["name"] for span in spans)
+
+
+def test_child_spans_nest_under_their_root():
+    telemetry = Telemetry()
+    with telemetry.span("request") as root:
+        with telemetry.span("embed") as child:
+            telemetry.record_span("parse", 0.01)
+        worker = threading.Thread(target=run_in_context(lambda: telemetry.record_span("worker", 0.01)))
+        worker.start()
+        worker.join()
+    assert child.parent_id == root.span_id
+    [trace] = telemetry.traces()
+    assert names(trace) == ["embed", "parse", "request", "worker"]
+    assert telemetry.trace(root.trace_id) == trace
+
+
+def test_overlapping_roots_of_one_trace_keep_their_own_spans():
+    telemetry = Telemetry()
+    with trace_context() as trace_id:
+        first, second = contextvars.copy_context(), contextvars.copy_context()
+    first_root = telemetry.span("request.first")
+    second_root = telemetry.span("request.second")
+    first.run(first_root.__enter__)
+    second.run(second_root.__enter__)
+    second.run(lambda: telemetry.record_span("second.before", 0.01))
+    first.run(first_root.__exit__, None, None, None)
+    # The second root is still open; its spans must not have left with the first.
+    second.run(lambda: telemetry.record_span("second.after", 0.01))
+    second.run(second_root.__exit__, None, None, None)
+
+    first_trace, second_trace = reversed(telemetry.traces())
+    assert names(first_trace) == ["request.first"]
+    assert names(second_trace) == ["request.second", "second.after", "second.before"]
+    assert names(telemetry.trace(trace_id)) == ["request.first", "request.second", "second.after", "second.before"]
+    assert telemetry._open_traces == {}
@@ -0,0 +1,57 @@
+from json_stream import JSONArrayStreamParser, iter_json_array_objects
+
+
+def chunks_of(text, size):
+    return [text[index:index + size] for index in range(0, len(text), size)]
+
+
+def test_objects_split_across_every_chunk_boundary():
+    text = '```json\n[{"id": 1, "steps": ["a", "b"]}, {"id": 2, "note": "x}y]z"}]\n```'
+    for size in range(1, len(text) + 1):
+        assert list(iter_json_array_objects(chunks_of(text, size))) == [
+            {"id": 1, "steps": ["a", "b"]}, {"id": 2, "note": "x}y]z"}]
+
+
+def test_objects_are_returned_as_soon_as_they_close():
+    parser = JSONArrayStreamParser()
+    assert parser.feed('[{"id": 1}, {"id"') == [{"id": 1}]
+    assert parser.feed(': 2}') == [{"id": 2}]
+    assert not parser.finished
+    assert parser.feed(']') == []
+    assert parser.finished
+
+
+def test_brackets_in_prose_before_the_array_are_skipped():
+    text = 'Here [is] the list [as requested]: [{"id": 1}]'
+    assert list(iter_json_array_objects([text])) == [{"id": 1}]
+
+
+def test_bracket_at_chunk_end_waits_for_the_next_chunk():
+    parser = JSONArrayStreamParser()
+    assert parser.feed("See [") == []
+    assert parser.feed("note] then [") == []
+    assert parser.feed(' {"id": 1}]') == [{"id": 1}]
+    assert parser.finished
+
+
+def test_escaped_quotes_and_backslashes_in_strings():
+    text = r'[{"text": "say \"}\" and \\"}, {"id": 2}]'
+    assert list(iter_json_array_objects(chunks_of(text, 3))) == [{"text": 'say "}" and \\'}, {"id": 2}]
+
+
+def test_malformed_objects_are_skipped_and_counted():
+    parser = JSONArrayStreamParser()
+    assert parser.feed('[{"id": 1}, {"id": 2,}, {"id": 3}]') == [{"id": 1}, {"id": 3}]
+    assert (parser.parsed, parser.malformed) == (2, 1)
+
+
+def test_empty_array_and_non_object_elements():
+    assert list(iter_json_array_objects(["[]"])) == []
+    assert list(iter_json_array_objects(['[{"id": 1}, 2, "three", [{"id": 4}], {"id": 5}]'])) == [
+        {"id": 1}, {"id": 5}]
+
+
+def test_text_after_the_array_is_ignored():
+    parser = JSONArrayStreamParser()
+    assert parser.feed('[{"id": 1}] and [{"id": 2}]') == [{"id": 1}]
+    assert parser.feed('{"id": 3}') == []
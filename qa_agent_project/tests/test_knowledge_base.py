@@ -0,0 +1,94 @@
+import pytest
+
+from knowledge_base import KnowledgeBase
+
+
+def open_knowledge_base(path):
+    return KnowledgeBase(persist_directory=str(path), collection_name="test")
+
+
+def chunk_records(count):
+    return ((f"chunk-{index}", f"Rule {index}: discount code SAVE{index} applies.", {"source_document": "spec.md"})
+            for index in range(count))
+
+
+def record_writes(knowledge_base, monkeypatch):
+    writes = []
+    upsert = knowledge_base._upsert_chunks
+
+    def recording_upsert(records, embeddings):
+        writes.append(len(records))
+        upsert(records, embeddings)
+    monkeypatch.setattr(knowledge_base, "_upsert_chunks", recording_upsert)
+    return writes
+
+
+def test_writes_are_bounded_however_many_chunks_there_are(tmp_path, fake_embeddings, monkeypatch):
+    knowledge_base = open_knowledge_base(tmp_path)
+    writes = record_writes(knowledge_base, monkeypatch)
+    stats = knowledge_base._embed_and_write(chunk_records(100), batch_size=8, queue_size=2, write_batches=2)
+    assert stats == {"chunks_embedded": 100, "write_calls": 7}
+    assert max(writes) == 16 and sum(writes) == 100
+    assert knowledge_base.collection.count() == 100
+
+
+def test_ingesting_a_large_pdf_writes_as_it_goes(tmp_path, fake_embeddings, monkeypatch):
+    knowledge_base = open_knowledge_base(tmp_path)
+    writes = record_writes(knowledge_base, monkeypatch)
+    pages = ((number, f"Page {number}. " + "Orders over fifty dollars ship free of charge. " * 60)
+             for number in range(1, 41))
+    stats = knowledge_base.ingest_pages(pages, {"source_document": "vendor.pdf", "type": "pdf"}, batch_size=8)
+    assert stats["chunks_embedded"] == knowledge_base.collection.count() > 64
+    assert len(writes) > 1 and max(writes) <= 32
+
+
+def test_writes_start_before_encoding_finishes(tmp_path, fake_embeddings, monkeypatch):
+    knowledge_base = open_knowledge_base(tmp_path)
+    events = []
+    encode = knowledge_base.embedding_model.encode
+    upsert = knowledge_base._upsert_chunks
+
+    def recording_encode(texts, batch_size=None):
+        events.append("encode")
+        return encode(texts, batch_size)
+
+    def recording_upsert(records, embeddings):
+        events.append("write")
+        upsert(records, embeddings)
+    monkeypatch.setattr(knowledge_base.embedding_model, "encode", recording_encode)
+    monkeypatch.setattr(knowledge_base, "_upsert_chunks", recording_upsert)
+
+    knowledge_base._embed_and_write(chunk_records(80), batch_size=8, queue_size=1, write_batches=1)
+    assert events.count("encode") == 10 and events.count("write") == 10
+    # With one queued batch, the producer cannot get more than two batches ahead of the writer.
+    assert events.index("write") < 4
+
+
+def test_lexical_hits_read_their_text_from_chroma(tmp_path, fake_embeddings):
+    documents = ["Apply the discount code SAVE15 at checkout.", "Express shipping costs 10 dollars."]
+    metadatas = [{"source_document": "coupons.txt"}, {"source_document": "shipping.txt"}]
+    open_knowledge_base(tmp_path).ingest_documents(documents, metadatas)
+    reopened = open_knowledge_base(tmp_path)
+    assert len(reopened.lexical_index) == reopened.collection.count()
+    records = reopened.query_records("SAVE15", n_results=1, mode="lexical")
+    assert [(record["document"], record["metadata"]["source_document"]) for record in records] == [
+        (documents[0], "coupons.txt")]
+    assert sorted(text for text, _ in reopened.chunk_texts()) == sorted(documents)
+
+
+def test_unknown_query_mode_is_rejected(tmp_path, fake_embeddings):
+    knowledge_base = open_knowledge_base(tmp_path)
+    knowledge_base.ingest_documents(["Apply the discount code SAVE15 at checkout."], [{"source_document": "coupons.txt"}])
+    with pytest.raises(ValueError, match="semantic"):
+        knowledge_base.query_records("SAVE15", mode="semantic")
+    assert knowledge_base.cache_stats()["result_misses"] == 0
+    assert len(knowledge_base.query_records("SAVE15", mode="hybrid")) == 1
+
+
+def test_chunk_ids_include_the_chunk_metadata():
+    chunks = [("Same text", {"source_document": "spec.md", "structure_path": "Spec > Discounts", "section": "Discounts"}),
+              ("Same text", {"source_document": "spec.md", "structure_path": "Spec > Shipping", "section": "Shipping"})]
+    (first_id, first_hash), (second_id, second_hash) = KnowledgeBase._chunk_ids("spec.md", chunks)
+    assert first_hash != second_hash
+    assert first_id != second_id and not second_id.endswith("_1")
+    assert KnowledgeBase._chunk_ids("spec.md", chunks[:1]) == [(first_id, first_hash)]
@@ -0,0 +1,114 @@
+import json
+
+import lexical_index
+from lexical_index import BM25Index, tokenize, is_identifier_query, reciprocal_rank_fusion
+
+CHUNKS = {
+    "coupon": ("Apply the discount code SAVE15 at checkout to get 15% off.", {"source_document": "spec.md"}),
+    "shipping": ("Express shipping costs 10 dollars; standard shipping is free.", {"source_document": "spec.md"}),
+    "button": ("The #pay_now_btn button submits the payment form.", {"source_document": "checkout.html"}),
+    "api": ("POST /api/apply_coupon validates a discount code.", {"source_document": "api.json"}),
+}
+
+
+def build(path=None):
+    index = BM25Index(path)
+    for chunk_id, (document, metadata) in CHUNKS.items():
+        index.add(chunk_id, document, metadata)
+    return index
+
+
+def test_identifiers_are_kept_whole_and_split():
+    assert tokenize("Click #pay_now_btn") == ["click", "pay_now_btn", "pay", "now", "btn"]
+    assert "/api/apply_coupon".strip("/") in tokenize("POST /api/apply_coupon")
+    assert is_identifier_query("SAVE15") and is_identifier_query("#pay_now_btn")
+    assert not is_identifier_query("free shipping") and not is_identifier_query("")
+
+
+def test_search_ranks_matching_chunks_first():
+    index = build()
+    assert index.search("SAVE15")[0][0] == "coupon"
+    assert index.search("pay_now_btn")[0][0] == "button"
+    assert [chunk_id for chunk_id, _ in index.search("shipping")] == ["shipping"]
+    ranked = [chunk_id for chunk_id, _ in index.search("discount code")]
+    assert set(ranked) == {"coupon", "api"}
+    assert index.search("nothing matches this") == []
+
+
+def test_rarer_terms_score_higher():
+    index = build()
+    (_, rare_score), = index.search("express")
+    common_scores = dict(index.search("discount"))
+    assert rare_score > max(common_scores.values())
+
+
+def test_where_filter_and_removal():
+    index = build()
+    assert [chunk_id for chunk_id, _ in index.search("discount code", where={"source_document": "api.json"})] == ["api"]
+    index.remove("coupon")
+    assert [chunk_id for chunk_id, _ in index.search("discount")] == ["api"]
+    assert "save15" not in index.postings and len(index) == 3
+    index.add("api", "Replaced text about refunds.", {"source_document": "api.json"})
+    assert index.search("discount") == [] and index.search("refunds")[0][0] == "api"
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a", "d"]], k=60)
+    assert [chunk_id for chunk_id, _ in fused] == ["a", "c", "b", "d"]
+    assert fused[0][1] == 1 / 61 + 1 / 62
+
+
+def test_saved_index_keeps_no_text_and_loads_without_tokenizing(tmp_path, monkeypatch):
+    path = str(tmp_path / "index_bm25.jsonl")
+    index = build(path)
+    index.save()
+    with open(path, encoding="utf-8") as f:
+        saved = f.read()
+    assert "checkout to get" not in saved
+    expected = index.search("discount code SAVE15")
+
+    def no_tokenize(text):
+        raise AssertionError("load() must not re-tokenize")
+    monkeypatch.setattr(lexical_index, "tokenize", no_tokenize)
+    reloaded = BM25Index(path)
+    monkeypatch.undo()
+    assert len(reloaded) == 4
+    assert reloaded.search("discount code SAVE15") == expected
+
+
+def test_save_appends_only_the_changes(tmp_path):
+    path = tmp_path / "index_bm25.jsonl"
+    index = build(str(path))
+    index.save()
+    index.add("refund", "Refunds take 5 business days.", {"source_document": "spec.md"})
+    index.remove("shipping")
+    index.save()
+    lines = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert len(lines) == 6
+    assert lines[-2]["id"] == "refund" and lines[-1] == {"id": "shipping", "removed": True}
+    reloaded = BM25Index(str(path))
+    assert sorted(reloaded.documents) == ["api", "button", "coupon", "refund"]
+    assert reloaded.search("refunds")[0][0] == "refund"
+
+
+def test_log_is_compacted_once_superseded_lines_dominate(tmp_path):
+    path = tmp_path / "index_bm25.jsonl"
+    index = BM25Index(str(path))
+    for round_number in range(60):
+        for chunk_id in ("a", "b"):
+            index.add(chunk_id, f"round {round_number} text", {})
+        index.save()
+    assert len(path.read_text(encoding="utf-8").splitlines()) <= 2 * len(index) + 100
+    assert BM25Index(str(path)).search("59")[0][0] in ("a", "b")
+
+
+def test_truncated_log_line_is_skipped_and_rewritten(tmp_path):
+    path = tmp_path / "index_bm25.jsonl"
+    build(str(path)).save()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"id": "partial", "ter')
+    index = BM25Index(str(path))
+    assert len(index) == 4
+    index.add("refund", "Refunds take 5 business days.", {})
+    index.save()
+    assert len(BM25Index(str(path))) == 5
@@ -0,0 +1,113 @@
+import os
+import threading
+
+import pytest
+
+from knowledge_base import KnowledgeBase
+from projects import ProjectManager, ProjectError, ProjectNotFoundError, DEFAULT_PROJECT
+
+
+@pytest.fixture
+def manager(tmp_path, fake_embeddings):
+    manager = ProjectManager(persist_directory=str(tmp_path), max_open_projects=2)
+    for name in ("alpha", "beta", "gamma"):
+        manager.create(name)
+    return manager
+
+
+def test_least_recently_used_project_is_evicted(manager):
+    alpha = manager.get("alpha")
+    manager.get("beta")
+    manager.get("alpha")
+    manager.get("gamma")
+    assert manager.open_projects() == ["alpha", "gamma"]
+    assert manager.get("alpha") is alpha
+    assert manager.stats()["evicted"] == 1
+    assert set(manager._open_locks) <= set(manager.open_projects())
+
+
+def test_reopening_an_evicted_project_keeps_its_data(manager):
+    manager.get("alpha").ingest_documents(["Discount codes reduce the total."], [{"source_document": "spec.md"}])
+    manager.get("beta")
+    manager.get("gamma")
+    assert "alpha" not in manager.open_projects()
+    assert manager.get("alpha").collection.count() > 0
+
+
+def test_pinned_projects_are_not_evicted(manager):
+    with manager.use("alpha") as alpha:
+        manager.get("beta")
+        manager.get("gamma")
+        manager.get(DEFAULT_PROJECT)
+        assert "alpha" in manager.open_projects()
+        assert len(manager.open_projects()) == 2
+        assert manager.get("alpha") is alpha
+        assert manager.stats()["pinned"] == 1
+    assert manager.stats()["pinned"] == 0
+
+
+def test_lru_may_exceed_its_size_while_every_project_is_pinned(manager):
+    with manager.use("alpha"), manager.use("beta"), manager.use("gamma"):
+        assert len(manager.open_projects()) == 3
+    assert len(manager.open_projects()) == 2
+
+
+def test_nested_use_keeps_the_pin(manager):
+    with manager.use("alpha") as outer:
+        with manager.use("alpha") as inner:
+            assert inner is outer
+        manager.get("beta")
+        manager.get("gamma")
+        assert "alpha" in manager.open_projects()
+
+
+def test_evict_and_drop_refuse_pinned_projects(manager):
+    with manager.use("alpha"):
+        assert not manager.evict("alpha")
+        with pytest.raises(ProjectError):
+            manager.drop("alpha")
+    assert manager.evict("alpha")
+    manager.drop("alpha")
+    assert not manager.exists("alpha")
+
+
+def test_unknown_projects(manager):
+    with pytest.raises(ProjectNotFoundError):
+        manager.get("missing")
+    with pytest.raises(ProjectError):
+        manager.get("../escape")
+    assert manager.get("missing", create=True) is manager.get("missing")
+
+
+def test_write_locks_are_per_project(manager):
+    with manager.write_lock("alpha"):
+        assert manager.write_lock("alpha").acquire(timeout=0.05) is False
+        with manager.write_lock("beta"):
+            pass
+    assert manager.write_lock("alpha") is manager.write_lock("alpha")
+    with pytest.raises(ProjectError):
+        manager.write_lock("../escape")
+
+
+def test_drop_waits_for_writes_to_the_project(manager):
+    manager.get("alpha")
+    dropped = threading.Event()
+    with manager.write_lock("alpha"):
+        dropper = threading.Thread(target=lambda: (manager.drop("alpha"), dropped.set()))
+        dropper.start()
+        assert not dropped.wait(0.1)
+        assert manager.exists("alpha")
+    dropper.join(5)
+    assert dropped.is_set() and not manager.exists("alpha")
+
+
+def test_migrate_covers_every_project(manager, tmp_path):
+    manager.get("alpha").ingest_documents(["Discount codes reduce the total."], [{"source_document": "spec.md"}])
+    manager.get("beta").ingest_documents(["Shipping is free over fifty dollars."], [{"source_document": "ship.md"}])
+    collection = ProjectManager.collection_name("beta")
+    os.remove(KnowledgeBase.state_files(str(tmp_path), collection)["lexical_index"])
+    manager.evict("beta")
+    assert manager.get("beta").needs_migration
+    assert manager.migrate() == {"beta": {"lexical_index_rebuilt": True, "chunks_reembedded": 0}}
+    assert not manager.get("beta").needs_migration
+    assert manager.migrate() == {}
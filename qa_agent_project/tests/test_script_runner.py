@@ -0,0 +1,167 @@
+import pytest
+
+import script_runner
+from script_runner import ScriptRunner, FakeDriver, write_page, run_scripts_isolated, selenium_available
+
+# FakeDriver needs no browser, but the scripts import selenium.
+requires_selenium = pytest.mark.skipif(not selenium_available(), reason="selenium is not installed")
+
+PAGE = """<html><head><title>Checkout</title></head><body>
+<form id="checkout"><input id="email" name="email" type="email"><button id="pay" type="submit">Pay</button></form>
+</body></html>"""
+
+HEADER = """from selenium import webdriver
+from selenium.webdriver.common.by import By
+"""
+
+PASSING_TESTCASE = HEADER + """import unittest
+
+class CheckoutTest(unittest.TestCase):
+    def setUp(self):
+        self.driver = webdriver.Chrome()
+        self.driver.get("file:///tmp/somewhere/checkout.html")
+
+    def tearDown(self):
+        self.driver.quit()
+
+    def test_pay_button(self):
+        self.assertEqual(self.driver.title, "Checkout")
+        self.driver.find_element(By.ID, "email").send_keys("a@example.com")
+        self.driver.find_element(By.ID, "pay").click()
+"""
+
+FAILING_FUNCTION = HEADER + """
+def test_title():
+    driver = webdriver.Chrome()
+    driver.get("file:///checkout.html")
+    assert driver.title == "Cart", "unexpected title"
+"""
+
+ERROR_FUNCTION = HEADER + """
+def test_missing_field():
+    driver = webdriver.Chrome()
+    driver.get("file:///checkout.html")
+    driver.find_element(By.ID, "coupon")
+"""
+
+
+def page_visits(driver):
+    # The pool sends released drivers to about:blank.
+    return [url for url in driver.visited if url != "about:blank"]
+
+
+@pytest.fixture
+def drivers():
+    created = []
+
+    def factory():
+        created.append(FakeDriver())
+        return created[-1]
+    return factory, created
+
+
+@pytest.fixture
+def runner(tmp_path, drivers):
+    write_page(PAGE, str(tmp_path))
+    with ScriptRunner(str(tmp_path), driver_factory=drivers[0], workers=2, script_timeout=10) as script_runner:
+        yield script_runner
+
+
+@requires_selenium
+def test_passing_testcase(runner, drivers):
+    result = runner.run_script(PASSING_TESTCASE, "TC_1")
+    assert (result["status"], result["passed"], result["tests_run"], result["error"]) == ("passed", True, 1, None)
+    assert page_visits(drivers[1][0]) == [f"{runner.server.base_url}/checkout.html"]
+
+
+@requires_selenium
+def test_assertion_is_a_failure(runner):
+    result = runner.run_script(FAILING_FUNCTION, "TC_2")
+    assert (result["status"], result["passed"]) == ("failed", False)
+    assert result["error"] == "unexpected title"
+    assert "AssertionError" in result["traceback"]
+
+
+@requires_selenium
+def test_missing_element_is_an_error(runner):
+    result = runner.run_script(ERROR_FUNCTION, "TC_3")
+    assert result["status"] == "error"
+    assert result["error"].startswith("NoSuchElementException")
+
+
+@requires_selenium
+def test_testcase_failures_and_errors(runner):
+    script = PASSING_TESTCASE.replace('"Checkout")', '"Cart")')
+    assert runner.run_script(script, "TC_4")["status"] == "failed"
+    script = PASSING_TESTCASE.replace('By.ID, "email"', 'By.ID, "coupon"')
+    assert runner.run_script(script, "TC_5")["status"] == "error"
+
+
+@requires_selenium
+def test_syntax_error_is_an_error(runner):
+    result = runner.run_script("def broken(:\n    pass\n", "TC_6")
+    assert result["status"] == "error"
+    assert result["error"].startswith("SyntaxError")
+
+
+@requires_selenium
+def test_functions_called_by_the_script_run_once(runner, drivers):
+    script = HEADER + """
+def test_visit():
+    driver = webdriver.Chrome()
+    driver.get("file:///checkout.html")
+
+if __name__ == "__main__":
+    test_visit()
+test_visit()
+"""
+    result = runner.run_script(script, "TC_7")
+    assert (result["status"], result["tests_run"]) == ("passed", 1)
+    assert len(page_visits(drivers[1][0])) == 1
+
+
+@requires_selenium
+def test_script_timeout_is_an_error_and_replaces_the_driver(tmp_path, drivers):
+    write_page(PAGE, str(tmp_path))
+    script = HEADER + "import time\ndriver = webdriver.Chrome()\ntime.sleep(3)\n"
+    with ScriptRunner(str(tmp_path), driver_factory=drivers[0], workers=1, script_timeout=0.5) as script_runner:
+        result = script_runner.run_script(script, "TC_8")
+        assert result["status"] == "error"
+        assert result["error"].startswith("TimeoutError")
+        assert drivers[1][0].quit_called
+        assert script_runner.run_script(FAILING_FUNCTION, "TC_9")["status"] == "failed"
+    assert len(drivers[1]) == 2
+
+
+@requires_selenium
+def test_run_scripts_keeps_input_order_and_skips_empty_scripts(runner):
+    scripts = [{"Test_ID": "TC_1", "script": PASSING_TESTCASE}, {"Test_ID": "TC_2", "script": ""},
+               {"Test_ID": "TC_3", "script": FAILING_FUNCTION}, {"Test_ID": "TC_4", "script": ERROR_FUNCTION}]
+    progress = []
+    results = runner.run_scripts(scripts, progress_callback=lambda done, total, result: progress.append((done, total)))
+    assert [(result["Test_ID"], result["status"]) for result in results] == [
+        ("TC_1", "passed"), ("TC_3", "failed"), ("TC_4", "error")]
+    assert progress == [(1, 3), (2, 3), (3, 3)]
+
+
+@requires_selenium
+def test_isolated_dry_run():
+    scripts = [{"Test_ID": "TC_1", "script": PASSING_TESTCASE}, {"Test_ID": "TC_2", "script": FAILING_FUNCTION}]
+    results = run_scripts_isolated(scripts, PAGE, workers=1, dry_run=True, timeout=60)
+    assert [(result["Test_ID"], result["status"]) for result in results] == [("TC_1", "passed"), ("TC_2", "failed")]
+
+
+def test_scripts_are_skipped_without_selenium(tmp_path, drivers, monkeypatch):
+    monkeypatch.setattr(script_runner, "selenium_available", lambda: False)
+    scripts = [{"Test_ID": "TC_1", "script": PASSING_TESTCASE}, {"Test_ID": "TC_2", "script": FAILING_FUNCTION}]
+    progress = []
+    results = run_scripts_isolated(scripts, PAGE, dry_run=True,
+                                   progress_callback=lambda done, total, result: progress.append(done))
+    assert [(result["Test_ID"], result["status"], result["passed"]) for result in results] == [
+        ("TC_1", "skipped", False), ("TC_2", "skipped", False)]
+    assert "selenium is not installed" in results[0]["error"]
+    assert progress == [1, 2]
+    write_page(PAGE, str(tmp_path))
+    with ScriptRunner(str(tmp_path), driver_factory=drivers[0]) as runner:
+        assert runner.run_script(PASSING_TESTCASE, "TC_3")["status"] == "skipped"
+    assert drivers[1] == []